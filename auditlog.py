@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind logging of what we have done. The rows for the master
+table are put on a queue, and one writer thread drains the queue
+into the database in batches, each batch in one transaction. The
+hosts never wait on SQLite, and SQLite only syncs once per batch.
+
+The queue is flushed when the program exits, however it exits:
+normally, through sys.exit(), by control-C, or by SIGTERM/SIGHUP.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import atexit
+import contextlib
+import logging
+import queue
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+import sqlitedb
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+the_writer = None
+
+SQL = """INSERT INTO master (who, host, command, result, invocation) VALUES (?, ?, ?, ?, ?)"""
+
+TABLES = """
+CREATE TABLE IF NOT EXISTS master (
+    t datetime default current_timestamp,
+    who varchar(20),
+    host varchar(20),
+    command varchar(2000),
+    result integer,
+    invocation integer
+    );
+
+CREATE TABLE IF NOT EXISTS invocation (
+    id integer primary key,
+    t datetime default current_timestamp,
+    who varchar(20),
+    statement varchar(2000)
+    );
+
+CREATE TABLE IF NOT EXISTS host_health (
+    host varchar(20) primary key,
+    address varchar(100),
+    port integer,
+    failures integer,
+    opened real,
+    until real
+    );
+
+CREATE TABLE IF NOT EXISTS latency (
+    t datetime default current_timestamp,
+    host varchar(20),
+    fingerprint varchar(200),
+    seconds real
+    );
+"""
+
+###
+# Columns that have been added to tables since the first version.
+###
+MIGRATIONS = (
+    ('master', 'invocation', 'ALTER TABLE master ADD COLUMN invocation integer'),
+    )
+
+SCHEMA = """
+CREATE INDEX IF NOT EXISTS master_invocation ON master(invocation, result);
+CREATE INDEX IF NOT EXISTS invocation_who ON invocation(who);
+CREATE INDEX IF NOT EXISTS master_t ON master(t);
+CREATE INDEX IF NOT EXISTS master_host ON master(host);
+CREATE INDEX IF NOT EXISTS master_who ON master(who);
+CREATE INDEX IF NOT EXISTS master_result ON master(result);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS master_fts USING fts5(
+    command, content='master', content_rowid='rowid', tokenize='trigram'
+    );
+
+CREATE TRIGGER IF NOT EXISTS master_fts_insert AFTER INSERT ON master BEGIN
+    INSERT INTO master_fts(rowid, command) VALUES (new.rowid, new.command);
+    END;
+
+CREATE TRIGGER IF NOT EXISTS master_fts_delete AFTER DELETE ON master BEGIN
+    INSERT INTO master_fts(master_fts, rowid, command) 
+        VALUES ('delete', old.rowid, old.command);
+    END;
+"""
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class AuditWriter:
+    """
+    The one thread that writes the database, and the queue that
+    feeds it.
+    """
+    __slots__ = {
+        'db_name': 'the SQLite database we write',
+        'batch_size': 'the most rows we put in one transaction',
+        'queue': 'rows waiting to be written, as (sql, row) pairs',
+        'thread': 'the writer thread',
+        'written': 'number of rows committed so far',
+        'lock': 'held while a row is queued, and while the writer is closed',
+        'closed': 'True once close() has been called'
+        }
+
+    STOP = object()
+
+    def __init__(self, db_name:str, batch_size:int=1000) -> None:
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.written = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+        ###
+        # Open the database here rather than in the thread, so that
+        # any problem with it is reported to the caller.
+        ###
+        db = self.connect()
+        indexed = db.execute("""SELECT COUNT(*) FROM sqlite_master 
+            WHERE name = 'master_fts'""").fetchone()[0]
+        db.executescript(TABLES)
+        for table, column, alteration in MIGRATIONS:
+            if column not in [ _[1] for _ in db.execute(f"PRAGMA table_info({table})") ]:
+                db.execute(alteration)
+        db.executescript(SCHEMA)
+
+        ###
+        # The text index is keyed by rowid. If it has just been added
+        # to an older database, fill it. (For the same reason, do not
+        # VACUUM the database without a rebuild afterwards.)
+        ###
+        if not indexed:
+            db.execute("INSERT INTO master_fts(master_fts) VALUES ('rebuild')")
+        db.close()
+
+        self.thread = threading.Thread(target=self.run,
+            name='auditwriter', daemon=True)
+        self.thread.start()
+
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        WAL lets readers (the history command, for one) carry on while
+        we write, and with WAL, synchronous=NORMAL is still safe
+        against corruption.
+        """
+        db = sqlite3.connect(self.db_name, timeout=30,
+            isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+
+    def submit(self, sql:str, row:tuple) -> None:
+        """
+        Once the writer is closed, nobody is left to take rows off the
+        queue, so a late row is written at once, the slow way, rather
+        than lost.
+        """
+        with self.lock:
+            if not self.closed:
+                self.queue.put((sql, row))
+                return
+
+        db = self.connect()
+        try:
+            self.write(db, [(sql, row)])
+        finally:
+            db.close()
+
+
+    def record(self, who:str, host:str, command:str, result:int,
+        invocation:int=None) -> None:
+        self.submit(SQL, (who, host, command, result, invocation))
+
+
+    def new_invocation(self, who:str, statement:str) -> int:
+        """
+        Each statement that fans out gets a number, and every row it
+        writes to master carries the number. This is the one write 
+        that cannot wait for the writer thread, because we need the 
+        number now. It is one small row per statement.
+        """
+        db = self.connect()
+        try:
+            with db:
+                return db.execute("""INSERT INTO invocation (who, statement) 
+                    VALUES (?, ?)""", (who, statement)).lastrowid
+        finally:
+            db.close()
+
+
+    def run(self) -> None:
+        """
+        Block until there is something to write, then take everything
+        that is waiting (up to batch_size rows) and write it in one
+        transaction.
+        """
+        db = self.connect()
+        running = True
+
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if any(_ is AuditWriter.STOP for _ in batch):
+                running = False
+
+            rows = [ _ for _ in batch if _ is not AuditWriter.STOP ]
+            try:
+                self.write(db, rows)
+            except Exception as e:
+                logger.error(f"audit write of {len(rows)} rows failed. {e}")
+            finally:
+                for _ in batch: self.queue.task_done()
+
+        db.close()
+
+
+    def write(self, db:sqlite3.Connection, rows:list) -> None:
+        """
+        Consecutive rows with the same SQL go to executemany together.
+        """
+        if not rows: return
+
+        db.execute("BEGIN")
+        try:
+            start = 0
+            for i in range(1, len(rows)+1):
+                if i == len(rows) or rows[i][0] != rows[start][0]:
+                    db.executemany(rows[start][0], [ _[1] for _ in rows[start:i] ])
+                    start = i
+            db.execute("COMMIT")
+        except:
+            db.execute("ROLLBACK")
+            raise
+
+        self.written += len(rows)
+
+
+    def flush(self) -> None:
+        """
+        Return when every row submitted so far has been committed.
+        """
+        self.queue.join()
+
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed: return
+            self.closed = True
+            if self.thread.is_alive(): self.queue.put(AuditWriter.STOP)
+        self.thread.join()
+
+
+def writer() -> Union[AuditWriter, None]:
+    return the_writer
+
+
+def leave(signum:int, frame:object) -> None:
+    """
+    Turn SIGTERM and SIGHUP into an ordinary exit so that the atexit
+    handlers, including the one that flushes the queue, get to run.
+    """
+    sys.exit(128 + signum)
+
+
+@trap
+def open_writer(db_name:str) -> AuditWriter:
+    """
+    Start the writer for this process. This must be called from the
+    main thread.
+    """
+    global the_writer
+    if the_writer is not None: return the_writer
+
+    the_writer = AuditWriter(db_name)
+    atexit.register(close_writer)
+
+    for s in (signal.SIGTERM, signal.SIGHUP):
+        if signal.getsignal(s) == signal.SIG_DFL:
+            signal.signal(s, leave)
+
+    logger.info(f"audit writer started for {db_name}")
+    return the_writer
+
+
+def close_writer() -> None:
+    global the_writer
+    if the_writer is not None:
+        the_writer.close()
+        logger.info(f"audit writer stopped after {the_writer.written} rows")
+        the_writer = None
+
+
+def record(who:str, host:str, command:str, result:int, 
+    invocation:int=None) -> None:
+    """
+    Record a command. If there is no writer, write it now, the old
+    way.
+    """
+    if the_writer is not None:
+        the_writer.record(who, host, command, result, invocation)
+    else:
+        sqlitedb.SQLiteDBinstance().execute_SQL(SQL, who, host, command, result, invocation)
+
+
+def new_invocation(who:str, statement:str) -> Union[int, None]:
+    """
+    A number for this statement, or None if there is no writer
+    (and so nowhere to keep the statement.)
+    """
+    return the_writer.new_invocation(who, statement) if the_writer is not None else None
+
+
+def flush() -> None:
+    if the_writer is not None: the_writer.flush()
+
+
+@trap
+def crash_test(db_name:str, n:int) -> int:
+    """
+    A child process queues n rows and is then stopped in each of
+    the ways we promise to survive. Every row must be there
+    afterwards. The last child closes the writer and then records
+    n rows more, which must not be lost either.
+    """
+    global the_writer
+
+    def after_close() -> None:
+        w = the_writer
+        w.close()
+        for i in range(n): w.record('test', f'host{i%18}', 'after close', i%2, 1)
+        sys.exit(os.EX_OK)
+
+    endings = {
+        'exit': lambda: sys.exit(os.EX_OK),
+        'control-C': lambda: os.kill(os.getpid(), signal.SIGINT),
+        'SIGTERM': lambda: os.kill(os.getpid(), signal.SIGTERM),
+        'SIGHUP': lambda: os.kill(os.getpid(), signal.SIGHUP),
+        'after close': after_close
+        }
+
+    failures = 0
+    for how, ending in endings.items():
+        with contextlib.suppress(FileNotFoundError): os.unlink(db_name)
+
+        if not (pid := os.fork()):
+            the_writer = None
+            open_writer(db_name)
+            for i in range(n): record('test', f'host{i%18}', how, i%2, 1)
+            try:
+                ending()
+                time.sleep(5)
+            except KeyboardInterrupt:
+                sys.exit(os.EX_OK)
+
+        os.waitpid(pid, 0)
+        db = sqlite3.connect(db_name)
+        found = db.execute("SELECT COUNT(*) FROM master").fetchone()[0]
+        db.close()
+        expected = 2 * n if ending is after_close else n
+        print(f"{how:>11}: {found} of {expected} rows")
+        failures += found != expected
+
+    return failures
+
+
+@trap
+def bench(db_name:str, n:int) -> dict:
+    """
+    Compare row-at-a-time writes with write-behind.
+    """
+    with contextlib.suppress(FileNotFoundError): os.unlink(db_name)
+    w = AuditWriter(db_name)
+    w.close()
+
+    db = sqlite3.connect(db_name, isolation_level=None)
+    start = time.perf_counter()
+    for i in range(min(n, 2000)):
+        db.execute(SQL, ('bench', f'host{i%18}', 'date', 0, 1))
+    direct = min(n, 2000) / (time.perf_counter() - start)
+    db.close()
+
+    w = AuditWriter(db_name)
+    start = time.perf_counter()
+    for i in range(n): w.record('bench', f'host{i%18}', 'date', 0)
+    queued = n / (time.perf_counter() - start)
+    w.flush()
+    behind = n / (time.perf_counter() - start)
+    w.close()
+
+    return {'direct rows/s': round(direct), 'enqueue rows/s': round(queued),
+        'write-behind rows/s': round(behind)}
+
+
+@trap
+def auditlog_main(myargs:argparse.Namespace) -> int:
+    """
+    For testing.
+    """
+    db_name = myargs.db or os.path.join(tempfile.mkdtemp(), 'audit.db')
+    if myargs.bench:
+        for k, v in bench(db_name, myargs.rows).items():
+            print(f"{k:>20}: {v}")
+        return os.EX_OK
+
+    return os.EX_OK if not crash_test(db_name, myargs.rows) else os.EX_SOFTWARE
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="auditlog",
+        description="Crash-safety test and throughput benchmark for the audit writer.")
+
+    parser.add_argument('--bench', action='store_true',
+        help="Run the throughput benchmark instead of the crash-safety test.")
+
+    parser.add_argument('--db', type=str, default="",
+        help="Scratch database to use. It is destroyed. Defaults to a new temporary file.")
+
+    parser.add_argument('-n', '--rows', type=int, default=10000,
+        help="Number of rows to write.")
+
+    myargs = parser.parse_args()
+    sys.exit(auditlog_main(myargs))
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+How fast is wscontrol? This measures each stage that a statement goes
+through -- parsing, building the IR, the resolver, and the fsm executors --
+on fleets of simulated workstations of several sizes, and writes the
+numbers to a JSON file named for the commit so that one commit can be
+compared with another:
+
+    python benchmark.py
+    python benchmark.py --hosts 10 100 --compare benchmark-abc1234.json
+
+The workstations are provided by the simulated transport, so nothing
+leaves this computer. The statements in testcommands.txt are parsed
+as a realistic workload.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 11)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import contextlib
+from   datetime import datetime
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+from   urlogger import URLogger
+
+###
+# imports and objects that are a part of this project
+###
+import auditlog
+import ir
+from   fsm import fsm
+import resolver
+from   timeouts import percentile
+import transport
+from   wsconfig import WSConfig
+import wscontrolparser
+import wsfastparser
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+wslanguage = wsfastparser.wslanguage
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def fleet(n:int) -> list:
+    """
+    n host names, numbered the way a rack is: sim001, sim002, and so
+    on, as node[001-512] would name them.
+    """
+    width = max(3, len(f"{n}"))
+    return [ f"sim{i:0{width}d}" for i in range(1, n+1) ]
+
+
+def workload(filename:str) -> list:
+    """
+    The statements in the file, without the blank lines and comments.
+    """
+    with open(filename) as f:
+        return [ _.strip() for _ in f if _.strip() and not _.strip().startswith('#') ]
+
+
+def parses(statement:str) -> bool:
+    try:
+        wslanguage.parse(statement)
+        return True
+    except Exception as e:
+        logger.warning(f"{statement} does not parse, and is left out. {e}")
+        return False
+
+
+def measure(stage:str, hosts:int, f:Callable, items:list,
+    min_time:float, max_reps:int) -> dict:
+    """
+    Call f on each of the items, over and over until min_time seconds
+    have gone by (or max_reps times through), and summarize.
+
+    returns -- a dict with the stage, the number of hosts, how many
+        calls there were, how long they took in all, calls per second,
+        host-operations per second, and the 50th, 95th, and highest
+        latency of one call in milliseconds.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for rep in range(max_reps):
+        for item in items:
+            t0 = time.perf_counter()
+            f(item)
+            latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - start >= min_time: break
+
+    seconds = sum(latencies)
+    result = {
+        'stage': stage,
+        'hosts': hosts,
+        'calls': len(latencies),
+        'seconds': round(seconds, 6),
+        'per_second': round(len(latencies) / seconds, 2) if seconds else None,
+        'hosts_per_second': round(max(1, hosts) * len(latencies) / seconds, 2) if seconds else None,
+        'p50_ms': round(1000 * percentile(latencies, 50), 4),
+        'p95_ms': round(1000 * percentile(latencies, 95), 4),
+        'max_ms': round(1000 * max(latencies), 4)
+        }
+    logger.info(f"{result}")
+    return result
+
+
+def commit_id() -> str:
+    p = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+        text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return p.stdout.strip() if not p.returncode else "unknown"
+
+
+def compare(old:dict, new:dict) -> None:
+    """
+    Print the two sets of results side by side. A ratio below 1 means
+    the new commit is slower.
+    """
+    before = { (r['stage'], r['hosts']): r for r in old['results'] }
+    print(f"\n{'stage':<10} {'hosts':>6} {old['commit']:>12} {new['commit']:>12}   ratio")
+    for r in new['results']:
+        o = before.get((r['stage'], r['hosts']))
+        if o is None or not o['per_second'] or not r['per_second']: continue
+        ratio = r['per_second'] / o['per_second']
+        flag = "  <-- slower" if ratio < 0.9 else ""
+        print(f"{r['stage']:<10} {r['hosts']:>6} {o['per_second']:>12.1f} "
+            f"{r['per_second']:>12.1f} {ratio:>7.2f}{flag}")
+
+
+@trap
+def benchmark_main(myargs:argparse.Namespace) -> int:
+    """
+    Build the fleets, run the stages, and write the results.
+    """
+    global wslanguage
+    wslanguage = ( wscontrolparser if myargs.parser == 'parsec' else wsfastparser ).wslanguage
+    config = WSConfig(myargs.config)
+    config.override('executor.max_in_flight', myargs.max_in_flight)
+    transport.open_transport(myargs.transport, latency=myargs.latency,
+        failure_rate=myargs.failure_rate, output_size=myargs.output_size, seed=1)
+
+    results = []
+    quiet = open(os.devnull, 'w')
+    statements = [ _ for _ in workload(myargs.workload) if parses(_) ]
+
+    ###
+    # The records of what was done are part of the cost, so they are
+    # written, but to a database that is thrown away.
+    ###
+    scratch = tempfile.TemporaryDirectory()
+    if not myargs.no_audit:
+        auditlog.open_writer(os.path.join(scratch.name, 'benchmark.db'))
+
+    ###
+    # The workload does not depend on the size of the fleet.
+    ###
+    with contextlib.redirect_stdout(quiet):
+        results.append(measure('parse', 0, wslanguage.parse, statements,
+            myargs.min_time, myargs.max_reps))
+        trees = [ wslanguage.parse(_) for _ in statements ]
+        results.append(measure('build', 0, ir.build, trees,
+            myargs.min_time, myargs.max_reps))
+
+    for n in myargs.hosts:
+        hosts = fleet(n)
+        config.override('ws.benchmark', hosts)
+        print(f"{n} hosts")
+
+        exec_statement = 'on ws.benchmark do ("uptime", "df -h /")'
+        send_statement = 'send /etc/hostname to ws.benchmark'
+        snapshot_statement = 'snapshot ws.benchmark'
+        listed = f'on ({", ".join(hosts)}) do "uptime"'
+
+        with contextlib.redirect_stdout(quiet):
+            results.append(measure('parse', n, wslanguage.parse, [listed],
+                myargs.min_time, myargs.max_reps))
+            results.append(measure('resolve', n,
+                lambda s: resolver.resolver(ir.build(wslanguage.parse(s))),
+                [exec_statement], myargs.min_time, myargs.max_reps))
+
+            ###
+            # The executors are slow enough that once through is plenty.
+            ###
+            for stage, statement in (('exec', exec_statement), ('send', send_statement),
+                ('snapshot', snapshot_statement)):
+                program = resolver.resolver(ir.build(wslanguage.parse(statement)))
+                results.append(measure(stage, n,
+                    lambda p: fsm(p, not myargs.no_exec, statement),
+                    [program], 0, 1))
+
+        for r in results[-5:]:
+            print(f"  {r['stage']:<10} {r['hosts_per_second']:>12.1f} hosts/s  "
+                f"p50 {r['p50_ms']:.2f} ms")
+
+    auditlog.close_writer()
+    report = {
+        'commit': commit_id(),
+        'when': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'settings': {k: v for k, v in vars(myargs).items() if k not in ('output', 'compare')},
+        'results': results
+        }
+
+    output = myargs.output if myargs.output else f"benchmark-{report['commit']}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results are in {output}")
+
+    if myargs.compare:
+        with open(myargs.compare) as f:
+            compare(json.load(f), report)
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(prog="benchmark",
+        description="What benchmark does, benchmark does best.")
+
+    parser.add_argument('--config', type=str, default=f"{here}/wscontrol.toml",
+        help="Config file to start from; the simulated hosts are added to it.")
+    parser.add_argument('--compare', type=str, default="",
+        help="A results file from an earlier run to compare with this one.")
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+        help="Fraction of the simulated connections and commands that fail.")
+    parser.add_argument('--hosts', type=int, nargs='+', default=[10, 100, 1000, 10000],
+        help="Sizes of the fleets, defaults to 10 100 1000 10000.")
+    parser.add_argument('--latency', type=float, default=0.01,
+        help="Seconds for a simulated host to answer, defaults to 0.01.")
+    parser.add_argument('--loglevel', type=int, default=logging.WARNING,
+        help=f"Logging level, defaults to {logging.WARNING}")
+    parser.add_argument('--max-in-flight', type=int, default=64,
+        help="Hosts with commands in flight at once, defaults to 64.")
+    parser.add_argument('--max-reps', type=int, default=1000,
+        help="Most times through the faster stages.")
+    parser.add_argument('--min-time', type=float, default=0.5,
+        help="Least seconds to spend on each of the faster stages.")
+    parser.add_argument('--no-audit', action='store_true',
+        help="Do not write the records of what was done.")
+    parser.add_argument('--no-exec', action='store_true',
+        help="Run the executors without sending anything to the hosts.")
+    parser.add_argument('-o', '--output', type=str, default="",
+        help="Where to write the results; defaults to benchmark-<commit>.json")
+    parser.add_argument('--output-size', type=int, default=200,
+        help="Characters of output from each simulated command.")
+    parser.add_argument('--parser', type=str, default="fast", choices=("fast", "parsec"),
+        help="Which parser to time, defaults to fast.")
+    parser.add_argument('--transport', type=str, default='simulated',
+        choices=tuple(transport.transports),
+        help="simulated, unless you mean it.")
+    parser.add_argument('--workload', type=str, default=f"{here}/testcommands.txt",
+        help="Statements to parse, one per line.")
+
+    myargs = parser.parse_args()
+    logger = URLogger(level=myargs.loglevel)
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
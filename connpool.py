@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+A pool of persistent, multiplexed ssh connections. The first command
+sent to a host opens a master connection (ControlMaster); everything
+after that, whether from EXEC, SEND, or SNAPSHOT, rides on the same
+socket and skips the TCP setup, key exchange, and authentication.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import getpass
+mynetid = getpass.getuser()
+import logging
+import subprocess
+import tempfile
+import threading
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+the_pool = None
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class ConnectionPool:
+    """
+    Keep track of the master connections we have opened, and close
+    the ones that have not been used for a while.
+    """
+    __slots__ = {
+        'control_dir': 'private directory holding the control sockets',
+        'persist': 'seconds an idle master stays open',
+        'last_used': 'dict of destination -> time of most recent use',
+        'lock': 'the pool is shared by the fan-out threads'
+        }
+
+    def __init__(self, control_dir:str=None, persist:int=300) -> None:
+        self.control_dir = ( control_dir if control_dir else
+            os.path.join(tempfile.gettempdir(), f"wscontrol-{mynetid}") )
+        self.persist = int(persist)
+        self.last_used = {}
+        self.lock = threading.Lock()
+
+        ###
+        # The sockets are as good as credentials, so nobody else
+        # gets to look in the directory. Note that the directory
+        # must not be on NFS; unix sockets do not work there.
+        ###
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        os.chmod(self.control_dir, 0o700)
+
+
+    @property
+    def control_path(self) -> str:
+        """
+        %C is a hash of the local host, remote host, port, and user,
+        so the path is short and the same destination always maps to
+        the same socket, however it was named.
+        """
+        return os.path.join(self.control_dir, "%C")
+
+
+    def options(self, destination:str) -> str:
+        """
+        The ssh (or scp) options that route a connection to
+        destination through its master.
+        """
+        with self.lock:
+            self.last_used[destination] = time.time()
+
+        return ( f"-o ControlMaster=auto -o ControlPath={self.control_path} "
+            f"-o ControlPersist={self.persist} " )
+
+
+    def is_open(self, destination:str) -> bool:
+        """
+        Ask ssh whether there is a live master for destination.
+        """
+        cmd = ['ssh', '-o', f'ControlPath={self.control_path}',
+            '-O', 'check', destination]
+        return not subprocess.run(cmd, capture_output=True).returncode
+
+
+    def release(self, destination:str) -> None:
+        """
+        Tell the master for destination to exit.
+        """
+        cmd = ['ssh', '-o', f'ControlPath={self.control_path}',
+            '-O', 'exit', destination]
+        subprocess.run(cmd, capture_output=True)
+        with self.lock:
+            self.last_used.pop(destination, None)
+
+
+    @trap
+    def reap(self, idle:int=None) -> int:
+        """
+        Close masters that have been idle for longer than idle
+        seconds (by default, the ControlPersist time). ssh would
+        eventually close them itself; this keeps our books straight.
+
+        returns -- the number of masters closed.
+        """
+        idle = self.persist if idle is None else idle
+        now = time.time()
+        with self.lock:
+            stale = [ k for k, v in self.last_used.items() if now - v > idle ]
+
+        for destination in stale:
+            logger.debug(f"reaping master for {destination}")
+            self.release(destination)
+
+        return len(stale)
+
+
+    @trap
+    def close(self) -> None:
+        """
+        Close every master we know about. Called at the end of
+        the session.
+        """
+        self.reap(-1)
+
+
+    def __len__(self) -> int:
+        return len(self.last_used)
+
+
+def pool() -> Union[ConnectionPool, None]:
+    """
+    The session's pool, or None if no session has opened one.
+    """
+    return the_pool
+
+
+@trap
+def open_pool(control_dir:str=None, persist:int=300) -> ConnectionPool:
+    """
+    Create the pool for this session.
+    """
+    global the_pool
+    if the_pool is None:
+        the_pool = ConnectionPool(control_dir, persist)
+    return the_pool
+
+
+@trap
+def close_pool() -> None:
+    global the_pool
+    if the_pool is not None:
+        the_pool.close()
+        the_pool = None
+
+
+def ssh_options(destination:str) -> str:
+    """
+    Options for destination, if a pool is open; otherwise nothing,
+    and the connection is made the ordinary way.
+    """
+    return the_pool.options(destination) if the_pool is not None else ""
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+The fan-out engine. A request that names many workstations is broken
+into one job per host, and the jobs are run concurrently with a
+bounded number of them in flight at any one time.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   collections import deque
+from   concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import functools
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   sloppytree import SloppyTree
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+from   opcodes import OpCode
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# When more than one statement is fanning out at once, the limit on
+# hosts in flight is for all of them together. None means that each
+# fan-out has only its own limit.
+###
+slots = None
+
+###
+# Functions called as listener(event, job) when a host's job is
+# 'started', 'retrying', 'finished', or 'abandoned', in the thread
+# that called fan_out(), and when it is 'connected', in the worker
+# thread that connected it. Background jobs and the progress board
+# use them to follow what is happening.
+###
+listeners = []
+
+###
+# Functions called with no arguments, in the thread that called
+# fan_out(), before it starts any more hosts. If one of them says
+# True, the fan-out has been cancelled, and the hosts already running
+# are allowed to finish. Background jobs use them to be cancelled.
+###
+stops = []
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class HostJob:
+    """
+    The chain of actions to be carried out on one host, and what
+    happened when we tried.
+    """
+    __slots__ = {
+        'host': 'the connection information for the host',
+        'actions': 'tuple of command strings, run in order',
+        'on_error': 'the OpCode that says what to do when an action fails',
+        'transport': 'the Transport that carries the actions to the host',
+        'results': 'list of (action, command, result) triples, in the order run',
+        'code': 'exit code of the last action run; zero if all went well',
+        'cursor': 'index of the first action that has not yet succeeded',
+        'attempts': 'how many times the job has been tried'
+        }
+
+    def __init__(self, host:object, actions:tuple, on_error:OpCode,
+        transport:object=None) -> None:
+        self.host = host
+        self.actions = actions
+        self.on_error = on_error
+        self.transport = transport
+        self.results = []
+        self.code = 0
+        self.cursor = 0
+        self.attempts = 0
+
+
+    @property
+    def failed(self) -> bool:
+        return self.code != 0
+
+
+    @property
+    def remaining(self) -> tuple:
+        return self.actions[self.cursor:]
+
+
+    def __str__(self) -> str:
+        return f"{self.host.get('host', self.host.get('hostname'))}"
+
+
+class Backoff:
+    """
+    How long to wait before trying a job again: exponential, with
+    jitter so that hosts that failed together do not all come back
+    together.
+    """
+    __slots__ = {
+        'attempts': 'the most times a job will be tried, first try included',
+        'base': 'seconds before the first retry',
+        'cap': 'the longest we will wait between tries'
+        }
+
+    def __init__(self, attempts:int=3, base:float=1.0, cap:float=30.0) -> None:
+        self.attempts = max(1, int(attempts))
+        self.base = float(base)
+        self.cap = float(cap)
+
+
+    def delay(self, attempt:int) -> float:
+        """
+        Half the exponential delay is certain, and the other half is
+        random.
+        """
+        d = min(self.cap, self.base * 2 ** (attempt - 1))
+        return d / 2 + random.uniform(0, d / 2)
+
+
+def notify(event:str, job:HostJob) -> None:
+    for listener in listeners:
+        try:
+            listener(event, job)
+        except Exception as e:
+            logger.error(f"{listener} could not take {event} for {job}. {e}")
+
+
+def stopped() -> bool:
+    return any(stop() for stop in stops)
+
+
+def limit_in_flight(n:int) -> None:
+    """
+    Share n places among all the fan-outs, or stop sharing if n is 0.
+    """
+    global slots
+    slots = threading.BoundedSemaphore(n) if n else None
+
+
+def limited(guard:threading.Semaphore, work:Callable, job:HostJob) -> HostJob:
+    with guard:
+        return work(job)
+
+
+@trap
+def fan_out(jobs:Iterable[HostJob],
+    work:Callable[[HostJob], HostJob],
+    max_in_flight:int=8,
+    done:Callable[[HostJob], None]=None,
+    backoff:Backoff=None) -> list:
+    """
+    Run work(job) for every job, with no more than max_in_flight of
+    them running at once. The actions for any one host are always
+    run in order by work(); it is only the hosts that are concurrent.
+
+    jobs -- the per-host jobs.
+    work -- a function that carries out one job, starting at its
+        cursor. It runs in a worker thread, so it must not print or
+        touch the database.
+    max_in_flight -- the limit on concurrency, for this fan-out. (If
+        limit_in_flight() has been called, there is a limit for all
+        of them together, as well.)
+    done -- called in *this* thread as each job finishes, so that it
+        is safe for it to print and to write the database.
+    backoff -- the schedule for jobs whose policy is OpCode.RETRY.
+
+    What happens when a job fails depends on its policy:
+
+        IGNORE -- work() has already carried on with the next action.
+        NEXT -- the job is over; the other hosts carry on.
+        RETRY -- the job goes back in the queue, to start again at the
+            failed action after a delay. While it waits, it does not
+            hold one of the max_in_flight places, so other hosts'
+            work goes ahead. When it is out of attempts, it is treated
+            like NEXT.
+        FAIL -- jobs that have not yet started are abandoned.
+
+    If work() raises, rather than returning the job, the job has
+    failed with os.EX_SOFTWARE, and the policy is applied as usual.
+
+    Jobs that have not yet started are also abandoned if one of the
+    stops says that this fan-out is cancelled. Along the way, the listeners are told as each job
+    is started, retried, finished, or abandoned.
+
+    returns -- the jobs that were run, in the order they finished.
+    """
+    finished = []
+    max_in_flight = max(1, int(max_in_flight))
+    backoff = Backoff() if backoff is None else backoff
+
+    if slots is not None: work = functools.partial(limited, slots, work)
+
+    ready = deque(jobs)
+    waiting = []
+    running = {}
+    tiebreak = itertools.count()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight,
+        thread_name_prefix='fanout') as pool:
+
+        while ready or waiting or running:
+            ###
+            # Move the retries whose time has come to the ready queue,
+            # and fill the empty places.
+            ###
+            now = time.monotonic()
+            while waiting and waiting[0][0] <= now:
+                ready.append(heapq.heappop(waiting)[2])
+
+            if (ready or waiting) and stopped():
+                logger.info("cancelled; abandoning hosts not yet started.")
+                abandon(ready, waiting)
+
+            while ready and len(running) < max_in_flight:
+                job = ready.popleft()
+                job.attempts += 1
+                running[pool.submit(work, job)] = job
+                notify('started', job)
+
+            ###
+            # Wait for something to finish, but not past the time
+            # the next retry is due.
+            ###
+            timeout = max(0, waiting[0][0] - now) if waiting else None
+            if not running:
+                ###
+                # Nothing is running, so only a retry can be pending,
+                # unless a cancel or a failure has just abandoned it.
+                ###
+                if timeout is not None: time.sleep(timeout)
+                continue
+
+            completed, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in completed:
+                job = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    crashed(job, e)
+
+                if (job.failed and job.on_error == OpCode.RETRY and 
+                    job.attempts < backoff.attempts):
+                    delay = backoff.delay(job.attempts)
+                    logger.info(f"{job} failed with {job.code}; retry {job.attempts} in {delay:.1f}s")
+                    heapq.heappush(waiting, (time.monotonic() + delay, next(tiebreak), job))
+                    notify('retrying', job)
+                    continue
+
+                finished.append(job)
+                done and done(job)
+                notify('finished', job)
+
+                if job.failed and job.on_error == OpCode.FAIL and (ready or waiting):
+                    logger.info(f"{job} failed; abandoning hosts not yet started.")
+                    abandon(ready, waiting)
+
+    return finished
+
+
+def crashed(job:HostJob, e:Exception) -> None:
+    """
+    work() raised e rather than returning the job. It is a failure of
+    the action it was on, for this host alone; the other hosts carry
+    on, and this one is reported and recorded like any other failure.
+    """
+    logger.error(f"{job} raised {e}")
+    action = job.remaining[0] if job.remaining else ""
+    job.code = os.EX_SOFTWARE
+    job.results.append((action, f"{action}", SloppyTree({'OK': False, 
+        'code': job.code, 'stdout': "", 'stderr': f"{e}\n", 'elapsed': None})))
+
+
+def abandon(ready:deque, waiting:list) -> None:
+    for job in itertools.chain(ready, (_[2] for _ in waiting)):
+        notify('abandoned', job)
+    ready.clear()
+    waiting.clear()
+
+
+def run_batch(job:HostJob, timeout:float) -> HostJob:
+    """
+    Ship the job's remaining actions to the host over one session, and
+    record the result of each action separately, as if it had been
+    run by itself.
+    """
+    stop_on_error = job.on_error != OpCode.IGNORE
+    actions = job.remaining
+    for action, result in zip(actions, 
+        job.transport.batch(job.host, actions, timeout, stop_on_error)):
+
+        job.results.append((action, job.transport.describe(job.host, action), result))
+        job.code = result.code
+        if result.code and stop_on_error: break
+        job.cursor += 1
+
+    return job
@@ -24,6 +24,7 @@ mynetid = getpass.getuser()
 import logging
 import socket
 this_host = socket.gethostname()
+import time
 
 ###
 # Installed libraries.
@@ -42,14 +43,25 @@ from   urdecorators import trap
 ###
 # imports and objects that are a part of this project
 ###
-from wscontrolparser import OpCode
-from wsview import * #utility for a snapshot
+import auditlog
+import hosthealth
+import ir
+import progress
+import timeouts
+import transport
+from executor import Backoff, HostJob, fan_out, notify, run_batch
+from resolver import resolve_config
+from opcodes import OpCode
 ###
 # Global objects and initializations
 ###
 logger = logging.getLogger('URLogger')
 verbose = False
-SQL = """INSERT INTO master (who, host, command, result) VALUES (?, ?, ?, ?)"""
+
+###
+# What a snapshot asks each host.
+###
+SNAPSHOT = ('free', 'nproc', 'w')
 
 ###
 # Credits
@@ -74,81 +86,290 @@ def prep_action(t:Union[tuple, str]) -> tuple:
     return " && ".join(t)
 
 
-@trap
-def prep_connection(t:SloppyTree) -> str:
-    h = t.hostname
-    u = t.user
-    k = t.identityfile[0]
-    return f"""ssh -i {k} -o ConnectTimeout=5 {u}@{h} """
-
-
 @trap
 def prep_destination(t:SloppyTree) -> str:
     return ""
 
 
 @trap
-def fsm(prog:SloppyTree, exec:bool) -> int:
+def fsm(prog:ir.Node, exec:bool, source:str="", who:str=mynetid) -> int:
     """
     Execute the user's request
+
+    source -- the text of the statement, for the record.
+    who -- whose request it is, for the record.
+
+    returns -- os.EX_OK, or the exit code of the failure that 
+        stopped the statement.
+    """
+    return EXECUTORS[type(prog)](prog, exec, source, who)
+
+
+def establish(job:HostJob, action:str=None) -> Union[HostJob, None]:
+    """
+    Make the connection to the host by itself before anything is
+    run over it. That way, we learn how long the connection takes,
+    separately from how long the commands take.
+
+    returns -- None if all is well, or the job, with the failure 
+        recorded against action (by default, the first one that
+        remains), if we could not connect.
+    """
+    result = job.transport.connect(job.host, timeouts.connect_timeout(f"{job}") + 1)
+    hosthealth.observe(f"{job}", job.host.hostname,
+        int(job.host.get('port') or 22), 0 if result.OK else result.code or 255)
+    if result.OK: 
+        if result.elapsed is not None:
+            timeouts.record_connect(f"{job}", result.elapsed)
+        notify('connected', job)
+        return None
+
+    action = job.remaining[0] if action is None else action
+    job.code = result.code if result.code else 255
+    result.code = job.code
+    job.results.append((action, job.transport.describe(job.host, action), result))
+    return job
+
+
+def run_chain(job:HostJob, exec:bool) -> HostJob:
+    """
+    Carry out the commands for one host, in order. This function runs
+    in a worker thread of the fan-out, so it does no printing and
+    does not touch the database; run_jobs() takes care of that as
+    each host finishes.
     """
-    request_type = next(iter(dict(prog)))
-    prog = prog[request_type]
+    if not job.remaining: return job
+    if not exec:
+        for action in job.remaining:
+            job.results.append((action, job.transport.describe(job.host, action), None))
+        job.cursor = len(job.actions)
+        return job
+
+    logger.debug(f"{job} <- {job.remaining}")
+    if establish(job) is not None: return job
+    return run_batch(job, timeouts.connect_timeout(f"{job}") +
+        sum(timeouts.deadline(f"{job}", _) for _ in job.remaining))
+
+
+def copy_files(job:HostJob, exec:bool) -> HostJob:
+    """
+    The job's actions are the files to send, and they all go at once.
+    """
+    cmd = job.transport.describe_copy(job.host, job.actions)
+    if not exec:
+        job.results.append((cmd, cmd, None))
+        job.cursor = len(job.actions)
+        return job
+
+    if establish(job, cmd) is not None: return job
+    result = job.transport.copy(job.host, job.actions,
+        timeouts.connect_timeout(f"{job}") + timeouts.deadline(f"{job}", cmd))
+    job.results.append((cmd, cmd, result))
+    job.code = result.code
+    if result.OK: job.cursor = len(job.actions)
+    return job
+
+
+@trap
+def run_jobs(jobs:list, exec:bool, source:str="", 
+    work:Callable[[HostJob, bool], HostJob]=run_chain, who:str=mynetid) -> int:
+    """
+    Fan the jobs out across the hosts, no more than 
+    executor.max_in_flight of them at once, doing work() for each
+    of them, and record what
+    happened as each host finishes. The records are written
+    behind our backs by the audit writer, and they all carry
+    the number of this invocation so that the failures can be
+    found and redone.
+
+    returns -- os.EX_OK, unless the policy was on_error fail and
+        something failed, in which case it is the exit code of 
+        the first failure. (With ignore, next, or retry, failures
+        have already been dealt with as requested.)
+
+    who -- the user the records are made for, who is not us when
+        wsdaemon is running the statement for someone.
+    """
+    max_in_flight = resolve_config('executor.max_in_flight', 8)
+    backoff = Backoff(resolve_config('executor.retry_attempts', 3),
+        resolve_config('executor.retry_base', 1.0),
+        resolve_config('executor.retry_cap', 30.0))
+    invocation = auditlog.new_invocation(who, source) if exec else None
+
+    ###
+    # Hosts that are known to be down are not worth waiting for.
+    ###
+    skipped = []
+    if exec:
+        for job in (skipped := [ _ for _ in jobs if hosthealth.is_down(f"{_}") ]):
+            print(f"Skipping {job}; it has been down since {hosthealth.down_since(f'{job}')}.")
+        jobs = [ _ for _ in jobs if _ not in skipped ]
+
+    num_actions = 0
+    def report(job:HostJob) -> None:
+        nonlocal num_actions
+        for action, cmd, result in job.results:
+            print(cmd)
+            if result is None: continue
+            if result.get('elapsed') is not None:
+                timeouts.record_runtime(f"{job}", action, result.elapsed)
+            auditlog.record(who, f"{job}", cmd, result.code, invocation)
+            if result.OK: 
+                num_actions += 1
+                print(result.stdout)
+
+    ###
+    # The progress board goes up only when there is someone at a
+    # terminal to watch it.
+    ###
+    with progress.board(jobs if exec else [], skipped,
+        resolve_config('progress.fps', 10), resolve_config('progress.max_rows', 10),
+        resolve_config('progress.min_hosts', 2)):
+        finished = fan_out(jobs, lambda job: work(job, exec), 
+            max_in_flight, report, backoff)
+    if invocation is not None: print(f"Invocation {invocation}.")
+    logger.info(f"{num_actions} commands succeeded on {len(finished)} hosts.")
 
-    foo = f"fsm_do_{request_type.name}"
-    return globals()[foo](prog, exec)
+    ###
+    # If the policy is to fail, the first failure has already stopped
+    # the hosts that had not yet begun. 
+    ###
+    for job in finished:
+        if job.failed and job.on_error == OpCode.FAIL: 
+            print(f"Stopped because of a failure on {job}.")
+            return job.code
+
+    return os.EX_OK
 
 
 @trap
-def fsm_do_EXEC(prog:SloppyTree, exec:bool) -> int:
+def fsm_do_EXEC(prog:ir.Exec, exec:bool, source:str="", who:str=mynetid) -> int:
     """
-    prog -- the instructions of the program, now that we have
-        determined the type of request.
+    prog -- the statement, resolved.
     exec -- must be True to execute the command. This is to support
         testing and dry-run functionality.
+
+    Each host gets its own chain of actions, and the chains are run
+    concurrently. All of a host's actions travel over one session
+    of the transport, and their results are sorted out again when
+    it finishes. The actions are invariant across the hosts, so the
+    list of them is built once. 
+    """
+    jobs = [ HostJob(host, prog.actions, prog.on_error, transport.current())
+            for host in prog.hosts ]
+
+    return run_jobs(jobs, exec, source, who=who)
+
+
+@trap
+def fsm_do_SNAPSHOT(prog:ir.Snapshot, exec:bool, source:str="", who:str=mynetid) -> int:
     """
+    Ask each host how busy its CPUs and memory are, with the commands
+    in SNAPSHOT, run in one session through the same fan-out and
+    transport as everything else, and show a graph for each host:
+
+        adam          [CCCC______________] [MMMMMMMMM_________]
 
-    global mynetid, this_host
-    db = sqlitedb.SQLiteDBinstance()
+    The curses view that follows the graphs as they change is still
+    python wsview.py.
 
+    returns -- os.EX_OK, or, with on_error fail, the exit code of the
+        first host that failed.
+    """
     ###
-    # A nested loop across each command to be executed first, and
-    # then looping over the hosts. The reason is that the command
-    # is invariant across the hosts, and there is no need to rebuild
-    # it for each one.
+    # wsview brings curses with it, which nothing else needs.
     ###
-    num_actions = 0
-    for action in prog[OpCode.DO]:
-        action_string = prep_action(action)
-        for target in prog[OpCode.ON]:
-            target_string = prep_connection(SloppyTree(target))
-            cmd = f"{target_string} {action_string}"
-            logger.debug(cmd)
-                    
-            if exec:
-                print(cmd)
-                result = SloppyTree(dorunrun(cmd, timeout=5, return_datatype=dict))
-                db.execute_SQL(SQL, mynetid, this_host, cmd, result.code)
-                if result.OK: 
-                    num_actions +=1 
-                    print(result.stdout)
-                    continue
-                if prog[OpCode.ONERROR] == OpCode.FAIL: 
-                    sys.exit(result.code)
-            else:
-                result = print(cmd)
-
-    return num_actions
+    import wsview
+
+    jobs = [ HostJob(host, SNAPSHOT, prog.on_error, transport.current())
+        for host in prog.hosts ]
+    if not exec:
+        for job in jobs:
+            print("\n".join(job.transport.describe(job.host, _) for _ in SNAPSHOT))
+        return os.EX_OK
+
+    for job in (skipped := [ _ for _ in jobs if hosthealth.is_down(f"{_}") ]):
+        print(f"Skipping {job}; it has been down since {hosthealth.down_since(f'{job}')}.")
+    jobs = [ _ for _ in jobs if _ not in skipped ]
+
+    graphs = {}
+    def graph(job:HostJob) -> None:
+        said = { action: result.stdout for action, _, result in job.results 
+            if result is not None and result.OK }
+        graphs[f"{job}"] = wsview.graphs(
+            wsview.cpu_from(said.get('nproc', ""), said.get('w', "")),
+            wsview.memory_from(said.get('free', "")))
+
+    backoff = Backoff(resolve_config('executor.retry_attempts', 3),
+        resolve_config('executor.retry_base', 1.0),
+        resolve_config('executor.retry_cap', 30.0))
+    finished = fan_out(jobs, lambda job: run_chain(job, exec), 
+        resolve_config('executor.max_in_flight', 8), graph, backoff)
+
+    for host in sorted(graphs):
+        print(f"{host.ljust(13)} {graphs[host]}")
+
+    for job in finished:
+        if job.failed and job.on_error == OpCode.FAIL: 
+            print(f"Stopped because of a failure on {job}.")
+            return job.code
+
+    return os.EX_OK
+
 
 @trap
-def fsm_do_SNAPSHOT(prog:SloppyTree, db:SQLiteDB, exec:bool) -> int:
+def fsm_do_SEND(prog:ir.Send, exec:bool, source:str="", who:str=mynetid) -> int:
     """
-    Snapshot is a program that displays CPU and memory availability using curses.
+    Copy the files to each of the hosts, concurrently, with one copy
+    (scp, with ssh) per host.
     """
-    ws = "" #retrieve this from prog:SloppyTree
-    fork_ssh(ws)
-    wrapper(display_data)
+    jobs = [ HostJob(host, prog.files, prog.on_error, transport.current()) 
+        for host in prog.hosts ]
+
+    return run_jobs(jobs, exec, source, copy_files, who)
+
+
+@trap
+def fsm_do_LOG(prog:ir.Log, exec:bool, source:str="", who:str=mynetid) -> int:
+    """
+    Put the message in the logfile (and on the screen.)
+    """
+    logger.info(prog.text)
+    print(prog.text)
+    return 0
+
+
+@trap
+def fsm_do_NOP(prog:ir.Nop, exec:bool, source:str="", who:str=mynetid) -> int:
+    return 0
+
 
 @trap
-def fsm_do_SEND(prog:SloppyTree, exec:bool) -> int:
-    pass
+def fsm_do_STOP(prog:ir.Stop, exec:bool, source:str="", who:str=mynetid) -> int:
+    sys.exit(os.EX_OK)
+
+
+@trap
+def fsm_do_SEQUENCE(prog:ir.Sequence, exec:bool, source:str="", who:str=mynetid) -> int:
+    """
+    Each step in turn, stopping at the first one that fails. Each is
+    recorded by itself, with its own source.
+    """
+    for step_source, step in prog.steps:
+        print(step_source)
+        if (code := fsm(step, exec, step_source, who)): return code
+    return os.EX_OK
+
+
+###
+# Which function carries out which kind of statement.
+###
+EXECUTORS = {
+    ir.Exec: fsm_do_EXEC,
+    ir.Send: fsm_do_SEND,
+    ir.Snapshot: fsm_do_SNAPSHOT,
+    ir.Log: fsm_do_LOG,
+    ir.Nop: fsm_do_NOP,
+    ir.Stop: fsm_do_STOP,
+    ir.Sequence: fsm_do_SEQUENCE
+    }
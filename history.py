@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Queries against the master table. Everything here uses an index:
+host, who, and result have their own; a time range is turned into a
+range of rowids with the index on t; and the command text is found
+through the full text (trigram) index, master_fts. Results come back a page at
+a time, newest first, and the next page starts below the smallest
+rowid of this one, so no query ever reads the whole table.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import logging
+import shlex
+import sqlite3
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+###
+# The names the user may give to the filters, and what they
+# turn into.
+###
+filter_names = {
+    'host': 'host', 'on': 'host',
+    'who': 'who', 'user': 'who',
+    'since': 'since', 'after': 'since',
+    'until': 'until', 'before': 'until',
+    'result': 'result', 'code': 'result',
+    'cmd': 'text', 'command': 'text',
+    'limit': 'limit'
+    }
+
+
+def parse_filters(args:str) -> dict:
+    """
+    Turn 'host=adam result=failed cmd="dnf update" limit=20' into
+    a dict of filters. A bare word is taken to be a piece of the
+    command.
+    """
+    filters = {}
+    for word in shlex.split(args):
+        k, sep, v = word.partition('=')
+        if not sep:
+            filters['text'] = f"{filters.get('text', '')} {word}".strip()
+            continue
+        if k.lower() not in filter_names:
+            raise ValueError(f"Unknown filter {k}. Try one of {', '.join(filter_names)}")
+        filters[filter_names[k.lower()]] = v
+
+    try:
+        if 'limit' in filters: filters['limit'] = int(filters['limit'])
+    except ValueError:
+        raise ValueError(f"limit={filters['limit']} is not a number.") from None
+
+    result = filters.get('result')
+    if result is not None and result.lower() not in ('failed', 'fail', '!0'):
+        try:
+            filters['result'] = int(result)
+        except ValueError:
+            raise ValueError(f"result={result} is not an exit code. Try a number, or failed.") from None
+    return filters
+
+
+def rowid_bound(db:sqlite3.Connection, t:str, first:bool) -> Union[int, None]:
+    """
+    Rows are appended in time order, so a time is as good as a
+    rowid, and the index on t will find the rowid in one probe.
+    """
+    if first:
+        row = db.execute("SELECT rowid FROM master WHERE t >= ? ORDER BY t LIMIT 1", (t,)).fetchone()
+    else:
+        row = db.execute("SELECT rowid FROM master WHERE t <= ? ORDER BY t DESC LIMIT 1", (t,)).fetchone()
+    return row[0] if row else None
+
+
+def query(db:sqlite3.Connection,
+    host:str=None,
+    who:str=None,
+    since:str=None,
+    until:str=None,
+    result:str=None,
+    text:str=None,
+    below:int=None,
+    limit:int=25) -> list:
+    """
+    Find rows in master, newest first.
+
+    host, who -- exact matches.
+    since, until -- times, as 'YYYY-MM-DD[ HH:MM:SS]' (UTC, as SQLite
+        writes them.)
+    result -- an exit code, or 'failed' for any nonzero exit code.
+    text -- a piece of the command.
+    below -- only rows with a rowid less than this; it is how we page.
+    limit -- rows per page.
+
+    returns -- list of (rowid, t, who, host, result, invocation, command) 
+        tuples.
+    """
+    where = []
+    params = []
+    source = "master m"
+    key = "m.rowid"
+
+    ###
+    # With text to look for, the text index drives the query: it
+    # hands back matching rows newest first, and we stop as soon as
+    # we have a page. The trigram index only works for three or more
+    # characters; anything shorter is rare, and gets a LIKE.
+    ###
+    if text and len(text) >= 3:
+        source = "master_fts f CROSS JOIN master m ON m.rowid = f.rowid"
+        key = "f.rowid"
+        where.append("master_fts MATCH ?")
+        params.append('"' + text.replace('"', '""') + '"')
+    elif text:
+        where.append("m.command LIKE ?")
+        params.append(f"%{text}%")
+
+    if host:
+        where.append("m.host = ?")
+        params.append(host)
+    if who:
+        where.append("m.who = ?")
+        params.append(who)
+
+    if result is not None and f"{result}".lower() in ('failed', 'fail', '!0'):
+        where.append("m.result != 0")
+    elif result is not None:
+        where.append("m.result = ?")
+        params.append(int(result))
+
+    if since:
+        lo = rowid_bound(db, since, True)
+        if lo is None: return []
+        where.append(f"{key} >= ?")
+        params.append(lo)
+    if until:
+        hi = rowid_bound(db, until, False)
+        if hi is None: return []
+        below = hi + 1 if below is None else min(below, hi + 1)
+    if below is not None:
+        where.append(f"{key} < ?")
+        params.append(below)
+
+    SQL = f"""SELECT m.rowid, m.t, m.who, m.host, m.result, m.invocation, m.command 
+        FROM {source}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {key} DESC LIMIT ?"""
+    params.append(limit)
+
+    logger.debug(f"{SQL} {params}")
+    return db.execute(SQL, params).fetchall()
+
+
+def connect(db_name:str) -> sqlite3.Connection:
+    """
+    We only read, so there is no reason to take any locks that
+    would slow the audit writer.
+    """
+    return sqlite3.connect(f"file:{db_name}?mode=ro", uri=True, timeout=10)
+
+
+def show(rows:list) -> None:
+    """
+    Print a page of history.
+    """
+    for rowid, t, who, host, result, invocation, command in rows:
+        print(f"{rowid:>8} {t} {who or '':<10} {host or '':<14} {result if result is not None else '-':>4} "
+            f"{invocation or '':>6}  {command}")
+
+
+def last_invocation(db:sqlite3.Connection, who:str) -> Union[int, None]:
+    """
+    The most recent invocation by who that had a failure.
+    """
+    row = db.execute("""SELECT MAX(invocation) FROM master
+        WHERE invocation IN (SELECT id FROM invocation WHERE who = ?)
+        AND result != 0""", (who,)).fetchone()
+    return row[0] if row else None
+
+
+def statement_of(db:sqlite3.Connection, invocation:int) -> Union[str, None]:
+    row = db.execute("SELECT statement FROM invocation WHERE id = ?", 
+        (invocation,)).fetchone()
+    return row[0] if row else None
+
+
+def failed_hosts(db:sqlite3.Connection, invocation:int) -> tuple:
+    """
+    The hosts where anything in the invocation went wrong, in the
+    order they were recorded.
+    """
+    rows = db.execute("""SELECT host FROM master 
+        WHERE invocation = ? AND result != 0 ORDER BY rowid""", 
+        (invocation,)).fetchall()
+    return tuple(dict.fromkeys(_[0] for _ in rows))
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Which workstations are known to be down. Workstations are often
+turned off, and there is no point in waiting out a connection timeout
+on each of them for every command. After a host fails to connect
+threshold times in a row, its circuit is opened: it is skipped, at
+once, until ttl seconds have passed or until a background probe
+finds sshd listening on it again.
+
+The state is kept in the host_health table so that it survives from
+one session to the next.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   concurrent.futures import ThreadPoolExecutor
+import logging
+import sqlite3
+import threading
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import auditlog
+import transport
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+SQL = """INSERT OR REPLACE INTO host_health
+    (host, address, port, failures, opened, until) VALUES (?, ?, ?, ?, ?, ?)"""
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class HostHealth:
+    """
+    The circuit breakers for all the hosts, and the thread that
+    probes the ones that are open.
+    """
+    __slots__ = {
+        'threshold': 'consecutive connection failures that open the circuit',
+        'ttl': 'seconds the circuit stays open without a successful probe',
+        'interval': 'seconds between probes of the hosts that are down',
+        'hosts': 'dict of host -> [address, port, failures, opened, until]',
+        'lock': 'the state is shared by the fan-out and the prober',
+        'prober': 'the background probe thread'
+        }
+
+    def __init__(self, threshold:int=2, ttl:int=600, interval:int=30) -> None:
+        self.threshold = max(1, int(threshold))
+        self.ttl = ttl
+        self.interval = interval
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.prober = None
+
+
+    def load(self, db_name:str) -> None:
+        """
+        Pick up where the last session left off. Circuits whose time
+        has run out are not worth loading.
+        """
+        try:
+            db = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+            rows = db.execute("""SELECT host, address, port, failures, opened, until
+                FROM host_health WHERE until > ?""", (time.time(),)).fetchall()
+            db.close()
+        except sqlite3.Error as e:
+            logger.info(f"no host health in {db_name}. {e}")
+            return
+
+        with self.lock:
+            for host, *state in rows: self.hosts[host] = list(state)
+        logger.info(f"{len(rows)} hosts are known to be down.")
+
+
+    def save(self, host:str) -> None:
+        """
+        Written behind, like everything else.
+        """
+        w = auditlog.writer()
+        if w is not None: w.submit(SQL, (host, *self.hosts[host]))
+
+
+    def is_down(self, host:str) -> bool:
+        state = self.hosts.get(host)
+        return state is not None and state[4] > time.time()
+
+
+    def down_since(self, host:str) -> str:
+        state = self.hosts.get(host)
+        return time.strftime("%H:%M:%S", time.localtime(state[3])) if state else ""
+
+
+    def failure(self, host:str, address:str, port:int=22) -> None:
+        """
+        A connection to host failed. Open its circuit if that is
+        one failure too many.
+        """
+        with self.lock:
+            state = self.hosts.setdefault(host, [address, port, 0, 0.0, 0.0])
+            state[0:3] = [address, port, state[2] + 1]
+            if state[2] >= self.threshold:
+                now = time.time()
+                if state[4] <= now: state[3] = now
+                state[4] = now + self.ttl
+                logger.info(f"circuit opened for {host}")
+            self.save(host)
+
+
+    def success(self, host:str) -> None:
+        """
+        We got through to the host. Close its circuit.
+        """
+        with self.lock:
+            if self.hosts.pop(host, None) is None: return
+            w = auditlog.writer()
+            if w is not None: w.submit("DELETE FROM host_health WHERE host = ?", (host,))
+        logger.info(f"circuit closed for {host}")
+
+
+    def probe(self, host:str) -> None:
+        """
+        Ask the transport whether the host is answering again.
+        """
+        state = self.hosts.get(host)
+        if state is None: return
+        address, port = state[0:2]
+        if transport.current().probe(address, port): self.success(host)
+
+
+    def probe_forever(self) -> None:
+        with ThreadPoolExecutor(max_workers=16, thread_name_prefix='probe') as pool:
+            while True:
+                time.sleep(self.interval)
+                down = [ h for h in list(self.hosts) if self.is_down(h) ]
+                list(pool.map(self.probe, down))
+
+
+    def start(self) -> None:
+        if self.prober is None:
+            self.prober = threading.Thread(target=self.probe_forever,
+                name='prober', daemon=True)
+            self.prober.start()
+
+
+###
+# Until open_health() is called, nothing is remembered between
+# sessions and there is no probing, but the circuits still work.
+###
+the_health = HostHealth()
+
+###
+# What open_health() was given, until the first connection wants it.
+###
+pending = None
+opening = threading.Lock()
+
+
+@trap
+def open_health(db_name:str, threshold:int=2, ttl:int=600, interval:int=30) -> None:
+    """
+    The circuits are read, and the prober started, when the first
+    host is asked about, so that a session that never connects to
+    anything pays for neither.
+    """
+    global pending
+    pending = (db_name, threshold, ttl, interval)
+
+
+def health() -> HostHealth:
+    global the_health, pending
+    if pending is None: return the_health
+
+    with opening:
+        if pending is not None:
+            db_name, threshold, ttl, interval = pending
+            opened = HostHealth(threshold, ttl, interval)
+            opened.load(db_name)
+            opened.start()
+            the_health, pending = opened, None
+    return the_health
+
+
+def is_down(host:str) -> bool:
+    return health().is_down(host)
+
+
+def down_since(host:str) -> str:
+    return health().down_since(host)
+
+
+def observe(host:str, address:str, port:int, code:int) -> None:
+    """
+    Note the outcome of a connection to host. code is what the
+    transport's connect() said, not what a command on the host
+    exited with; a host that is up but runs a command that fails or
+    times out is not down.
+    """
+    if code:
+        health().failure(host, address, port)
+    else:
+        health().success(host)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Names for many hosts at once, written as a range in brackets:
+
+    node[001-512]       node001, node002, ... node512
+    lab[1-4]-ws[01-40]  lab1-ws01, lab1-ws02, ... lab4-ws40
+
+The numbers keep as many digits as the first number of the range has,
+so [001-512] gives node001 rather than node1. A range may appear in a
+statement or as a member of a group in wscontrol.toml, and the names
+are only made as they are wanted; nothing holds all 10000 of them
+unless the caller keeps them.
+
+    python hostranges.py 'lab[1-4]-ws[01-40]'
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import itertools
+import logging
+import re
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+RANGE = re.compile(r'\[(\d+)-(\d+)\]')
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def is_range(name:str) -> bool:
+    return '[' in name
+
+
+def numbers(first:str, last:str) -> range:
+    """
+    The numbers from first through last, or a ValueError if there are
+    none.
+    """
+    if int(last) < int(first):
+        raise ValueError(f"[{first}-{last}] goes backwards.")
+    return range(int(first), int(last) + 1)
+
+
+def expand(name:str) -> Iterator[str]:
+    """
+    The names in the pattern, in order, one at a time. A name without
+    a range is just itself.
+    """
+    if not is_range(name):
+        yield name
+        return
+
+    ###
+    # split() leaves the text around the ranges at the even places,
+    # and the first and last numbers of each range after them.
+    ###
+    pieces = RANGE.split(name)
+    texts = pieces[0::3]
+    ranges = [ [ f"{n:0{len(first)}d}" for n in numbers(first, last) ]
+        for first, last in zip(pieces[1::3], pieces[2::3]) ]
+
+    for choice in itertools.product(*ranges):
+        yield "".join(itertools.chain.from_iterable(
+            itertools.zip_longest(texts, choice, fillvalue="")))
+
+
+def expand_all(names:Iterable[str]) -> Iterator[str]:
+    for name in names:
+        yield from expand(name)
+
+
+def count(name:str) -> int:
+    """
+    How many names there are in the pattern, without making them.
+    """
+    total = 1
+    for first, last in RANGE.findall(name):
+        total *= len(numbers(first, last))
+    return total
+
+
+@trap
+def hostranges_main(myargs:argparse.Namespace) -> int:
+    for name in myargs.name:
+        try:
+            print(f"{name}: {count(name)} hosts")
+            print(" ".join(expand(name)))
+        except ValueError as e:
+            print(f"{name}: {e}")
+            return os.EX_DATAERR
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="hostranges",
+        description="What hostranges does, hostranges does best.")
+
+    parser.add_argument('name', nargs='+',
+        help="Names with ranges in them, to be shown expanded.")
+
+    myargs = parser.parse_args()
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+The intermediate representation of a statement: what the parsers'
+nested tuples of opcodes become, what the resolver fills in, and what
+the fsm carries out. There is one small class for each kind of
+statement. The nodes have slots rather than a dict, they cannot be
+changed once they are made (the resolver makes new ones), and two
+nodes with the same contents are equal and hash the same, so that a
+whole program can be a key in a dict or pickled into the script cache.
+
+    on adam do ("uptime", "df -h")
+
+becomes
+
+    Exec(hosts=('adam',), actions=('uptime', 'df -h'), on_error=OpCode.FAIL)
+
+and, after it is resolved, hosts is a tuple of Host nodes.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import logging
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+from   opcodes import OpCode
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class Node:
+    """
+    The things all the nodes have in common. A subclass only has to
+    declare its __slots__; the names of the slots, in order, are the
+    arguments of its constructor.
+    """
+    __slots__ = ()
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.fields = tuple(cls.__slots__)
+
+
+    def __init__(self, *values) -> None:
+        if len(values) != len(self.fields):
+            raise TypeError(f"{type(self).__name__} takes {self.fields}, not {values}")
+        for name, value in zip(self.fields, values):
+            object.__setattr__(self, name, value)
+
+
+    def __setattr__(self, name:str, value:object) -> NoReturn:
+        raise AttributeError(f"{type(self).__name__} cannot be changed.")
+
+
+    def __delattr__(self, name:str) -> NoReturn:
+        raise AttributeError(f"{type(self).__name__} cannot be changed.")
+
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, _) for _ in self.fields)
+
+
+    def replace(self, **changes) -> 'Node':
+        """
+        A copy, with some of the fields changed.
+        """
+        return type(self)(*(changes.get(_, getattr(self, _)) for _ in self.fields))
+
+
+    def __eq__(self, other:object) -> bool:
+        return type(self) is type(other) and self.values() == other.values()
+
+
+    def __hash__(self) -> int:
+        return hash((type(self).__name__, self.values()))
+
+
+    def __reduce__(self) -> tuple:
+        return type(self), self.values()
+
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in zip(self.fields, self.values()))})"
+
+
+class Host(Node):
+    """
+    Where to find a workstation, from the ssh config or the transport.
+    The transports ask for these with get(), as they would of a dict.
+    """
+    __slots__ = {
+        'alias': 'the name we know it by',
+        'hostname': 'the name (or address) to connect to',
+        'user': 'who to connect as, or None',
+        'port': 'the port, or None for the usual one',
+        'identityfile': 'the key to use, or None',
+        'options': 'tuple of (key, value) for anything else the ssh config said'
+        }
+
+    @classmethod
+    def of(cls, alias:str, info:dict) -> 'Host':
+        """
+        Make a Host from the connection information for alias.
+        """
+        info = { k: tuple(v) if isinstance(v, list) else v for k, v in info.items() }
+        return cls(alias, info.get('hostname', alias), info.get('user'),
+            info.get('port'), info.get('identityfile'),
+            tuple(sorted( (k, v) for k, v in info.items() if k not in HOST_KEYS )))
+
+
+    def get(self, key:str, default:object=None) -> object:
+        if key == 'host': return self.alias
+        value = getattr(self, key) if key in self.fields else dict(self.options).get(key)
+        return default if value is None else value
+
+
+    def __getitem__(self, key:str) -> object:
+        return self.get(key)
+
+
+HOST_KEYS = ('host', 'hostname', 'user', 'port', 'identityfile')
+
+
+class FromFile(Node):
+    """
+    A file of commands on this computer, to be read when the
+    statement is resolved.
+    """
+    __slots__ = {
+        'filename': 'as it was written in the statement'
+        }
+
+
+class Exec(Node):
+    opcode = OpCode.EXEC
+    __slots__ = {
+        'hosts': 'tuple of names, or of Hosts once resolved',
+        'actions': 'tuple of commands, in order; before resolution, one may be a FromFile',
+        'on_error': 'IGNORE, FAIL, NEXT, or RETRY'
+        }
+
+
+class Send(Node):
+    opcode = OpCode.SEND
+    __slots__ = {
+        'files': 'tuple of file names',
+        'hosts': 'tuple of names, or of Hosts once resolved',
+        'on_error': 'IGNORE, FAIL, NEXT, or RETRY'
+        }
+
+
+class Snapshot(Node):
+    opcode = OpCode.SNAPSHOT
+    __slots__ = {
+        'hosts': 'tuple of names, or of Hosts once resolved',
+        'on_error': 'IGNORE, FAIL, NEXT, or RETRY'
+        }
+
+
+class Log(Node):
+    opcode = OpCode.LOG
+    __slots__ = {
+        'text': 'the message'
+        }
+
+
+class Stop(Node):
+    opcode = OpCode.STOP
+    __slots__ = {}
+
+
+class Nop(Node):
+    opcode = OpCode.NOP
+    __slots__ = {
+        'command': 'the node that is not to be done, or None'
+        }
+
+
+class Sequence(Node):
+    """
+    Statements joined by semicolons, which are to be done in order,
+    one after the other, whatever else is going on at the same time.
+    This is not something the parser makes; a script is put together
+    from them when it is compiled.
+    """
+    __slots__ = {
+        'steps': 'tuple of (source, node), in order'
+        }
+
+
+class Combine(Node):
+    """
+    Two groups of hosts put together with +, -, or &. It stands in
+    the hosts of a statement as if it were one more name, and the
+    resolver works out who is in it.
+    """
+    __slots__ = {
+        'operator': 'UNION, DIFFERENCE, or INTERSECTION',
+        'left': 'tuple of names, or of Combines',
+        'right': 'tuple of names, or of Combines'
+        }
+
+
+SET_OPERATORS = (OpCode.UNION, OpCode.DIFFERENCE, OpCode.INTERSECTION)
+
+
+def names_of(context:object) -> tuple:
+    """
+    The context of a statement is a name, a tuple of them, or
+    (operator, context, context) for groups put together.
+    """
+    if isinstance(context, str): return (context,)
+    if context and context[0] in SET_OPERATORS:
+        operator, left, right = context
+        return (Combine(operator, names_of(left), names_of(right)),)
+    return tuple(context)
+
+
+def actions_of(t:object) -> tuple:
+    """
+    Reduce the DO operand, in any of the forms the parsers leave it,
+    to a flat tuple of commands in the order they are to be run.
+
+    "from local FILE" is a file of commands on this computer, and is
+    left as a FromFile for the resolver to read. "from FILE" is a
+    script that is already on each host, and it has always been run
+    there as "bash FILE".
+    """
+    if isinstance(t, str): return (t,)
+    if not isinstance(t, (tuple, list)) or not len(t): return ()
+
+    head = t[0]
+    if head in (OpCode.ACTION, OpCode.CAPTURE):
+        return actions_of(t[1])
+    if head == OpCode.FROM:
+        return (FromFile(t[2]),) if t[1] == OpCode.LOCAL else (f"bash {t[2]}",)
+
+    return tuple(a for _ in t for a in actions_of(_))
+
+
+def policy_of(clauses:dict, default:OpCode) -> OpCode:
+    return clauses.get(OpCode.ONERROR, default)
+
+
+def clauses_of(tokens:tuple) -> dict:
+    """
+    After the opcode of the command, each clause is (opcode, operand).
+    """
+    return { _[0]: _[1] for _ in tokens[1:] }
+
+
+def build_exec(tokens:tuple) -> Exec:
+    c = clauses_of(tokens)
+    return Exec(names_of(c[OpCode.ON]), actions_of(c[OpCode.DO]), policy_of(c, OpCode.FAIL))
+
+
+def build_send(tokens:tuple) -> Send:
+    c = clauses_of(tokens)
+    return Send(names_of(c[OpCode.FILES]), names_of(c[OpCode.TO]), policy_of(c, OpCode.FAIL))
+
+
+def build_snapshot(tokens:tuple) -> Snapshot:
+    c = clauses_of(tokens)
+    return Snapshot(names_of(c[OpCode.ON]), policy_of(c, OpCode.RETRY))
+
+
+def build_log(tokens:tuple) -> Log:
+    return Log(clauses_of(tokens)[OpCode.LITERAL])
+
+
+def build_stop(tokens:tuple) -> Stop:
+    return Stop()
+
+
+def build_nop(tokens:tuple) -> Nop:
+    command = tokens[1] if len(tokens) > 1 else None
+    return Nop(None if command is None else build(command))
+
+
+BUILDERS = {
+    OpCode.EXEC: build_exec,
+    OpCode.SEND: build_send,
+    OpCode.SNAPSHOT: build_snapshot,
+    OpCode.LOG: build_log,
+    OpCode.STOP: build_stop,
+    OpCode.NOP: build_nop
+    }
+
+
+@trap
+def build(tokens:Union[tuple, OpCode]) -> Node:
+    """
+    Turn what the parser gives back for one statement into a node.
+    """
+    if not isinstance(tokens, tuple): tokens = (tokens,)
+    return BUILDERS[tokens[0]](tokens)
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Statements that run in the background, so that a long one -- a dnf
+update on ws.all -- does not keep the console from taking the next.
+A statement that ends with & becomes a Job:
+
+    [WSControl]: on ws.all do "dnf -y update" &
+    [1] on ws.all do "dnf -y update"
+
+Each Job runs in its own thread. What it prints is kept, up to
+jobs.max_lines lines of it (the oldest are dropped first), rather
+than written over whatever is being typed, and what has happened on
+each host is followed through the executor's events. The console's
+jobs, wait, fg, and cancel commands look at them.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   collections import deque
+import itertools
+import logging
+import threading
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import executor
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# id -> Job, for every job of this session whose output has not yet
+# been shown with fg.
+###
+the_jobs = {}
+next_id = itertools.count(1)
+
+###
+# thread ident -> the Job running in it, so that its printing and the
+# executor's events can be sent to the right place.
+###
+by_thread = {}
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class Job:
+    """
+    One statement running in the background, and what it has done.
+    """
+    __slots__ = {
+        'id': 'the number the user knows it by',
+        'source': 'the statement',
+        'thread': 'the thread it runs in',
+        'state': "'running', 'done', 'failed', or 'cancelled'",
+        'code': 'the exit code, once it is over',
+        'started': 'time.monotonic() when it started',
+        'ended': 'time.monotonic() when it ended, or None',
+        'lines': 'the last jobs.max_lines lines it printed',
+        'written': 'how many lines it has printed in all',
+        'partial': 'what it has printed since the last newline',
+        'hosts': 'host -> its state, from the executor events',
+        'changed': 'a Condition, notified when there is more output, and at the end',
+        'stop': 'a threading.Event, set when it is cancelled',
+        'reported': 'True once the console has said that it is over'
+        }
+
+    def __init__(self, source:str, max_lines:int) -> None:
+        self.id = next(next_id)
+        self.source = source
+        self.thread = None
+        self.state = 'running'
+        self.code = None
+        self.started = time.monotonic()
+        self.ended = None
+        self.lines = deque(maxlen=max(1, int(max_lines)))
+        self.written = 0
+        self.partial = ""
+        self.hosts = {}
+        self.changed = threading.Condition()
+        self.stop = threading.Event()
+        self.reported = False
+
+
+    @property
+    def over(self) -> bool:
+        return self.ended is not None
+
+
+    def write(self, text:str) -> None:
+        with self.changed:
+            self.partial += text
+            *lines, self.partial = self.partial.split('\n')
+            self.lines.extend(lines)
+            self.written += len(lines)
+            if lines: self.changed.notify_all()
+
+
+    def since(self, n:int) -> tuple:
+        """
+        The lines after the first n it printed (or those of them that
+        are still kept), and how many it has printed now.
+        """
+        with self.changed:
+            first = self.written - len(self.lines)
+            return list(itertools.islice(self.lines, max(0, n - first), None)), self.written
+
+
+    def finish(self, state:str, code:int) -> None:
+        with self.changed:
+            if self.partial: self.lines.append(self.partial)
+            self.written += bool(self.partial)
+            self.partial = ""
+            self.state = 'cancelled' if self.state == 'cancelled' else state
+            self.code = code
+            self.ended = time.monotonic()
+            self.changed.notify_all()
+
+
+    def summary(self) -> str:
+        counts = {}
+        for state in self.hosts.values(): counts[state] = counts.get(state, 0) + 1
+        hosts = ", ".join(f"{n} {state}" for state, n in sorted(counts.items()))
+        elapsed = (self.ended or time.monotonic()) - self.started
+        code = f" ({self.code})" if self.over and self.code else ""
+        return ( f"[{self.id}] {self.state}{code} {elapsed:.0f}s" +
+            (f" [{hosts}]" if hosts else "") + f"  {self.source}" )
+
+
+class Router:
+    """
+    Stands in for sys.stdout. What a Job's thread prints goes to the
+    Job, and everything else goes where it always did.
+    """
+    __slots__ = {
+        'stdout': 'where everything else goes'
+        }
+
+    def __init__(self, stdout:TextIO) -> None:
+        self.stdout = stdout
+
+
+    def write(self, text:str) -> int:
+        job = by_thread.get(threading.get_ident())
+        if job is None: return self.stdout.write(text)
+        job.write(text)
+        return len(text)
+
+
+    def isatty(self) -> bool:
+        """
+        Nobody is watching what a Job prints as it prints it.
+        """
+        return threading.get_ident() not in by_thread and self.stdout.isatty()
+
+
+    def __getattr__(self, name:str) -> object:
+        return getattr(self.stdout, name)
+
+
+def stopping() -> bool:
+    """
+    One of the executor's stops: has the Job in this thread been
+    cancelled? The Job is looked up by thread only while it runs,
+    so a thread that is used again later does not inherit it.
+    """
+    job = by_thread.get(threading.get_ident())
+    return job is not None and job.stop.is_set()
+
+
+def follow(event:str, hostjob:executor.HostJob) -> None:
+    """
+    The executor's listener: keep track of the hosts of each Job.
+    """
+    job = by_thread.get(threading.get_ident())
+    if job is None: return
+    if event == 'finished':
+        job.hosts[f"{hostjob}"] = 'failed' if hostjob.failed else 'done'
+    else:
+        job.hosts[f"{hostjob}"] = event
+
+
+@trap
+def start(source:str, work:Callable[[], int], max_lines:int=1000) -> Job:
+    """
+    Run work() in the background as a Job.
+
+    work -- carries out the statement, and gives back its exit code.
+    """
+    if not isinstance(sys.stdout, Router): sys.stdout = Router(sys.stdout)
+    if follow not in executor.listeners: executor.listeners.append(follow)
+    if stopping not in executor.stops: executor.stops.append(stopping)
+
+    job = Job(source, max_lines)
+
+    def run() -> None:
+        by_thread[threading.get_ident()] = job
+        code = os.EX_SOFTWARE
+        try:
+            code = work() or os.EX_OK
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else os.EX_OK
+        except Exception as e:
+            logger.error(f"job {job.id} raised {e}")
+            print(f"{e}")
+        finally:
+            job.finish('failed' if code else 'done', code)
+            by_thread.pop(threading.get_ident(), None)
+
+    job.thread = threading.Thread(target=run, name=f"job-{job.id}", daemon=True)
+    the_jobs[job.id] = job
+    job.thread.start()
+    return job
+
+
+def find(which:str) -> Union[Job, None]:
+    """
+    The job numbered which, or the most recent one if which is empty.
+    """
+    try:
+        return the_jobs[int(which)] if which.strip() else the_jobs[max(the_jobs)]
+    except (ValueError, KeyError):
+        return None
+
+
+def cancel(job:Job) -> None:
+    """
+    No more hosts are started. Those that are running finish.
+    """
+    with job.changed:
+        if job.over: return
+        job.state = 'cancelled'
+        job.stop.set()
+
+
+def running() -> list:
+    return [ _ for _ in the_jobs.values() if not _.over ]
+
+
+def forget(job:Job) -> None:
+    """
+    Once what a job printed has been shown, it is not kept any longer.
+    """
+    job.reported = True
+    the_jobs.pop(job.id, None)
+
+
+def newly_over() -> list:
+    """
+    The jobs that have ended since we last asked. They are kept, so
+    that fg can show what they printed.
+    """
+    over = [ _ for _ in the_jobs.values() if _.over and not _.reported ]
+    for job in over: job.reported = True
+    return over
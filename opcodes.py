@@ -38,6 +38,11 @@ class OpCode(IntEnum):
     FILES       = 26
     LITERAL     = 27
     SNAPSHOT    = 28
+
+    # Ways to put groups of hosts together: a + b, a - b, a & b
+    UNION       = 32
+    DIFFERENCE  = 33
+    INTERSECTION = 34
     
 
     # Typing info for data
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+The optimizer works on resolved programs, between the resolver and
+the fsm. It does three things:
+
+    - drops nop statements, which would do nothing anyway.
+    - removes the second and later appearances of a host in one
+        statement, which happen when a host is named by itself and
+        also as part of a group: on (adam, ws.parish) ...
+    - merges consecutive exec statements for the same hosts into
+        one, so that each host gets one session with all the commands
+        in it rather than one session per statement.
+
+Merging is only done when it cannot change what the script does,
+which is to say only for on_error ignore, where every command is run
+on every host regardless. With on_error fail, a failure anywhere in
+the first statement stops the script before the second begins, on
+every host; merged, the hosts that did not fail would go on to the
+second statement anyway. With next and retry, a failure in the first
+statement must not keep the second from running on that host. So
+all of those are left alone. (What merging does change is that a host
+may go on to the second statement before the others have finished
+the first.)
+
+    python optimizer.py 'on adam do "uptime"' 'on adam do "df -h"'
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import logging
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import ir
+from   opcodes import OpCode
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+MERGEABLE = (OpCode.IGNORE,)
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def dedupe(node:ir.Node) -> ir.Node:
+    """
+    Each host once, where it first appears.
+    """
+    if isinstance(node, ir.Sequence):
+        return node.replace(steps=tuple((s, dedupe(n)) for s, n in node.steps))
+    hosts = getattr(node, 'hosts', None)
+    if not hosts: return node
+    seen = {}
+    for host in hosts: seen.setdefault(host.alias, host)
+    unique = tuple(seen.values())
+    return node if len(unique) == len(hosts) else node.replace(hosts=unique)
+
+
+def mergeable(a:ir.Node, b:ir.Node) -> bool:
+    return ( isinstance(a, ir.Exec) and isinstance(b, ir.Exec) and
+        a.on_error == b.on_error and a.on_error in MERGEABLE and
+        frozenset(a.hosts) == frozenset(b.hosts) )
+
+
+@trap
+def optimize(statements:list) -> list:
+    """
+    statements -- a list of (line number, source, resolved program),
+        in the order they are to be run. The program may be None for
+        something that is not a statement at all, and nothing is
+        merged across it.
+
+    returns -- a list of the same shape. A merged statement has the
+        line number of the first of its parts, and their sources,
+        separated by semicolons.
+    """
+    plan = []
+    for lineno, source, program in statements:
+        if isinstance(program, ir.Nop): continue
+        if program is not None: program = dedupe(program)
+
+        if plan and plan[-1][2] is not None and program is not None and mergeable(plan[-1][2], program):
+            first_line, first_source, first = plan.pop()
+            logger.debug(f"merging line {lineno} into line {first_line}")
+            program = first.replace(actions=first.actions + program.actions)
+            lineno, source = first_line, f"{first_source.rstrip().rstrip(';')}; {source}"
+
+        plan.append((lineno, source, program))
+
+    return plan
+
+
+def explain(program:ir.Node) -> str:
+    """
+    What is going to be done, in words.
+    """
+    if program is None: return "    (for the console)"
+
+    hosts = ", ".join(_.alias for _ in getattr(program, 'hosts', ()))
+    policy = f"on_error {program.on_error.name.lower()}" if hasattr(program, 'on_error') else ""
+    if isinstance(program, ir.Exec):
+        return "\n".join([f"    exec on {hosts} [{policy}], one session per host",
+            *(f"        {_}" for _ in program.actions)])
+    if isinstance(program, ir.Send):
+        return f"    send {' '.join(program.files)} to {hosts} [{policy}]"
+    if isinstance(program, ir.Snapshot):
+        return f"    snapshot {hosts} [{policy}]"
+    if isinstance(program, ir.Log):
+        return f"    log {program.text}"
+    if isinstance(program, ir.Stop):
+        return "    stop"
+    if isinstance(program, ir.Sequence):
+        return "\n".join(["    in this order:",
+            *(f"    {line}" for s, _ in program.steps for line in explain(_).split("\n"))])
+    return f"    {program}"
+
+
+@trap
+def optimizer_main(myargs:argparse.Namespace) -> int:
+    """
+    Explain the plan for the statements on the command line.
+    """
+    import transport
+    import wsfastparser
+    from   resolver import resolver
+    from   wsconfig import WSConfig
+
+    WSConfig(myargs.config)
+    transport.open_transport(myargs.transport)
+    statements = [ (i, s, resolver(ir.build(wsfastparser.wslanguage.parse(s))))
+        for i, s in enumerate(myargs.statement, start=1) ]
+    for lineno, source, program in optimize(statements):
+        print(f"{lineno}: {source}\n{explain(program)}")
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="optimizer",
+        description="What optimizer does, optimizer does best.")
+
+    parser.add_argument('--config', type=str, default="wscontrol.toml",
+        help="Config file, defaults to wscontrol.toml")
+    parser.add_argument('--transport', type=str, default="simulated",
+        help="Where the host information comes from, if not ~/.ssh/config.")
+    parser.add_argument('statement', nargs='+',
+        help="Statements, in the order they would be run.")
+
+    myargs = parser.parse_args()
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
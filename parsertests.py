@@ -76,4 +76,51 @@ parsertests = (
     )
 
 
-
+###
+# Every statement here must parse the same way with the parsec
+# grammar in wscontrolparser.py and with wsfastparser.py. Add to
+# it when the language changes; python wsfastparser.py --compare
+# checks them, along with some variations on each.
+###
+languagetests = (
+    'stop',
+    '  stop   ',
+    'quit',
+    'nop',
+    'nop on adam do "date"',
+    'log "hello world"',
+    'log hello world',
+    'send kevin to kevin on_error ignore',
+    'send /ab/c/d to (adam, anna, kevin)',
+    'send (/ab/c/d, $HOME/.bashrc) to (adam, anna, kevin)',
+    'send ~/important.txt to ws.all on_error next',
+    'on ws.parish do "date -%s"',
+    'on (billieholiday, badenpowell) do "date -%s"',
+    'on (sarah, evan, kevin) do "cat /etc/fstab"',
+    'on (sarah, evan, kevin) do capture "cat /etc/fstab"',
+    """on (billieholiday,  adam, thais) do (
+                capture "tail -1 /etc/fstab", 
+                "sed -i 's/141.166.88.99/newhost/' somefile"
+                ) on_error ignore""",
+    'on adam do from x.sh on_error retry',
+    'on adam do from local ~/X.sh on_error fail',
+    'snapshot erica',
+    'snapshot (erica, evan)',
+    'snapshot ws.parish on_error next',
+    'on adam do "date"; on anna do "date"\nlog "done"',
+    'on ws.all - ws.provost do "uptime"',
+    'on ws.parish-(adam, anna) do "uptime" on_error ignore',
+    'on (adam, anna) + ws.provost & ws.all do "date"',
+    'send ~/.bashrc to ws.all - ws.donald - (erica) on_error next',
+    'snapshot ws.parish & (adam, kevin, enterprise)',
+    'on ws.all - do "date"',
+    'on ws.all & do "date"',
+    'on node[001-512] do "uptime"',
+    'on (lab[1-4]-ws[01-40], gpu-node[1-8]) do "nvidia-smi" on_error ignore',
+    'on node[001-512] - node[100-199] do "date"',
+    'on ws.parish-(adam, anna) do "date"',
+    'on ws.parish -ws.donald do "date"',
+    'snapshot rack[1-2]-n[01-16] & ws.all',
+    'on node[1-] do "date"',
+    'on node- do "date"',
+    )
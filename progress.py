@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+A board at the bottom of the terminal that shows how a fan-out is
+going while it goes: how many hosts are queued, connecting, running,
+done, failed, or skipped, how long it has been, how many hosts a
+second are finishing, and which hosts have been at it the longest.
+When one host is stuck, it is at the top of the list.
+
+The board is driven by the executor's events, which only change a
+few counts, and it is drawn by a thread of its own no more than
+progress.fps times a second, so that drawing never holds up the
+hosts. What is printed while it is up appears above it. The colors
+are those of wsview: green for what went well, yellow for what is
+under way, red for failures, and white for the rest.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import contextlib
+import logging
+import shutil
+import threading
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+
+
+###
+# imports and objects that are a part of this project
+###
+import executor
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+GREEN = "\033[32m"
+YELLOW = "\033[33m"
+WHITE = "\033[37m"
+RED = "\033[31m"
+RESET = "\033[0m"
+
+STATES = ('queued', 'connecting', 'running', 'done', 'failed', 'skipped')
+COLORS = {'queued': WHITE, 'connecting': YELLOW, 'running': YELLOW,
+    'done': GREEN, 'failed': RED, 'skipped': WHITE}
+
+###
+# What each executor event makes of a host. A host that is to be
+# retried is waiting in the queue again.
+###
+EVENTS = {'started': 'connecting', 'connected': 'running', 'retrying': 'queued',
+    'abandoned': 'skipped'}
+
+###
+# There is one terminal, so there is one board at a time. Statements
+# of a script that run alongside the one that has it go without.
+###
+showing = threading.Lock()
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class Board:
+    """
+    The state of each host of one fan-out, and the lines that show it.
+    While it is up, it is sys.stdout, so that what is printed can be
+    put above it.
+    """
+    __slots__ = {
+        'states': 'job -> its state',
+        'since': 'job -> time.monotonic() when it got there',
+        'counts': 'state -> how many hosts are in it',
+        'started': 'time.monotonic() when the board went up',
+        'fps': 'the most frames a second',
+        'max_rows': 'the most hosts to list',
+        'stream': 'the real stdout',
+        'drawn': 'how many lines of the board are on the screen',
+        'lock': 'guards the states, and is held only long enough to change them',
+        'screen': 'guards the terminal',
+        'stopping': 'set when the fan-out is over',
+        'painter': 'the thread that draws the frames'
+        }
+
+    def __init__(self, jobs:Iterable, skipped:Iterable=(),
+        fps:float=10, max_rows:int=10) -> None:
+        now = time.monotonic()
+        self.states = { job: 'queued' for job in jobs }
+        self.states.update({ job: 'skipped' for job in skipped })
+        self.since = { job: now for job in self.states }
+        self.counts = { state: 0 for state in STATES }
+        for state in self.states.values(): self.counts[state] += 1
+        self.started = now
+        self.fps = max(1.0, float(fps))
+        self.max_rows = int(max_rows)
+        self.stream = sys.stdout
+        self.drawn = 0
+        self.lock = threading.Lock()
+        self.screen = threading.RLock()
+        self.stopping = threading.Event()
+        self.painter = threading.Thread(target=self.paint, name='progress', daemon=True)
+
+
+    def __enter__(self) -> 'Board':
+        executor.listeners.append(self.listen)
+        sys.stdout = self
+        self.painter.start()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.stopping.set()
+        self.painter.join()
+        executor.listeners.remove(self.listen)
+        with self.screen:
+            self.erase()
+            sys.stdout = self.stream
+        print(self.summary())
+
+
+    def listen(self, event:str, job:executor.HostJob) -> None:
+        """
+        The executor's listener. Events for other fan-outs' hosts are
+        not ours.
+        """
+        if job not in self.states: return
+        if event == 'finished':
+            state = 'failed' if job.failed else 'done'
+        elif (state := EVENTS.get(event)) is None:
+            return
+
+        with self.lock:
+            self.counts[self.states[job]] -= 1
+            self.counts[state] += 1
+            self.states[job] = state
+            self.since[job] = time.monotonic()
+
+
+    def paint(self) -> None:
+        while not self.stopping.wait(1 / self.fps):
+            with self.screen:
+                self.erase()
+                self.draw()
+
+
+    def frame(self) -> list:
+        """
+        The lines of the board: the counts, and then the hosts that
+        have been connecting or running the longest.
+        """
+        now = time.monotonic()
+        with self.lock:
+            counts = dict(self.counts)
+            busy = sorted(( (self.since[job], f"{job}", state)
+                for job, state in self.states.items()
+                if state in ('connecting', 'running') ))
+
+        elapsed = now - self.started
+        over = counts['done'] + counts['failed']
+        rate = over / elapsed if elapsed else 0
+        left = counts['queued'] + counts['connecting'] + counts['running']
+        eta = f"  about {left / rate:.0f}s to go" if rate and left else ""
+        lines = [ f"{elapsed:.1f}s  {rate:.1f} hosts/s  " + "  ".join(
+            f"{COLORS[state]}{counts[state]} {state}{RESET}" for state in STATES
+            if counts[state]) + eta ]
+
+        rows = max(0, min(self.max_rows, shutil.get_terminal_size().lines - 2))
+        for since, host, state in busy[:rows]:
+            lines.append(f"  {YELLOW}{host} {state} {now - since:.1f}s{RESET}")
+        if len(busy) > rows:
+            lines.append(f"  ... and {len(busy) - rows} more")
+        return lines
+
+
+    def draw(self) -> None:
+        """
+        Each line is cut to the width of the terminal, so that none of
+        them wraps, and erase() knows how many there are.
+        """
+        width = shutil.get_terminal_size().columns
+        lines = self.frame()
+        for line in lines:
+            self.stream.write(cut(line, width - 1) + "\n")
+        self.stream.flush()
+        self.drawn = len(lines)
+
+
+    def erase(self) -> None:
+        if self.drawn:
+            self.stream.write(f"\033[{self.drawn}F\033[J")
+            self.drawn = 0
+
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return f"{len(self.states)} hosts in {elapsed:.1f}s: " + ", ".join(
+            f"{self.counts[state]} {state}" for state in STATES if self.counts[state])
+
+
+    def write(self, text:str) -> int:
+        """
+        Take the board down, print the text where it was, and leave
+        the next frame to put it back.
+        """
+        with self.screen:
+            self.erase()
+            return self.stream.write(text)
+
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+    def __getattr__(self, name:str) -> object:
+        return getattr(self.stream, name)
+
+
+def cut(line:str, width:int) -> str:
+    """
+    The line, with no more than width characters that show; the
+    color escapes take no room.
+    """
+    shown, out, escaping = 0, [], False
+    for c in line:
+        if c == "\033": escaping = True
+        if not escaping:
+            if shown == width: return "".join(out) + RESET
+            shown += 1
+        out.append(c)
+        if escaping and c == 'm': escaping = False
+    return line
+
+
+def wanted(jobs:list, min_hosts:int=2) -> bool:
+    """
+    Only for someone watching a terminal, and not for a statement
+    in the background, or one sent through wsdaemon. min_hosts of
+    0 means never.
+    """
+    isatty = getattr(sys.stdout, 'isatty', None)
+    return ( 0 < min_hosts <= len(jobs) and isatty is not None and isatty() and
+        os.environ.get('TERM', 'dumb') != 'dumb' )
+
+
+@contextlib.contextmanager
+def board(jobs:list, skipped:list=(), fps:float=10, max_rows:int=10,
+    min_hosts:int=2) -> Iterator[Union[Board, None]]:
+    """
+    Show a board for the jobs for as long as the with block lasts,
+    if one is wanted and the terminal is free.
+    """
+    if not wanted(jobs, min_hosts) or not showing.acquire(blocking=False):
+        yield None
+        return
+
+    try:
+        with Board(jobs, skipped, fps, max_rows) as b:
+            yield b
+    finally:
+        showing.release()
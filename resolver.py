@@ -33,7 +33,6 @@ import logging
 ###
 import fileutils
 import linuxutils
-import netutils
 from   sloppytree import SloppyTree
 from   urdecorators import trap
 from   urlogger import URLogger, piddly
@@ -41,7 +40,11 @@ from   urlogger import URLogger, piddly
 ###
 # imports and objects that are a part of this project
 ###
+import hostranges
+import ir
 from   opcodes import OpCode
+import sshindex
+import transport
 from   wsconfig import WSConfig
 
 ###
@@ -61,133 +64,193 @@ __email__ = ['gflanagin@richmond.edu']
 __status__ = 'in progress'
 __license__ = 'MIT'
 
-info = netutils.get_ssh_host_info('all')
 logger = logging.getLogger('URLogger')
 
+###
+# What each context we have seen came to, for the version of the
+# config it was worked out from. A big group that is named over and
+# over is only taken apart once.
+###
+expansions = {}
+expansions_version = None
+
 @trap
 def resolve_config(search_term:str, not_found:object) -> object:
     """
-    Look through our config information for a symbol.
+    Look up a dotted name in our config information.
     """
-    d = WSConfig()
-    for t in search_term.split('.'):    
-        d = d.get(t)
-        if d is None: return not_found
-        
-    return d
+    return WSConfig().lookup(search_term, not_found)
 
-@trap
-def resolve_ACTION(data) -> object:
+def resolve_actions(actions:tuple) -> Union[tuple, None]:
     """
-    See if an action is defined in the .toml file.
+    Commands to be read from a local file are read now, one to a
+    line, in place of the FromFile.
     """
-    d = WSConfig()
-    
+    resolved = []
+    for action in actions:
+        if not isinstance(action, ir.FromFile):
+            resolved.append(action)
+            continue
 
+        command_file = fileutils.expandall(action.filename)
+        try:
+            with open(command_file) as f:
+                commands = [ _.strip() for _ in f if _.strip() ]
+        except OSError:
+            print(f"Unable to open {command_file}")
+            return None
 
-@trap
-def resolve_DO(data:tuple) -> tuple:
-    if OpCode.FROM in data[0]:
-        return resolve_FROM(data)
-    elif OpCode.ACTION in data[0]:
-        return resolve_ACTION(data)
-    return tuple((OpCode.ACTION, _) for _ in data[0])
+        if not commands: print(f"{command_file} is empty. Nothing to do.")
+        resolved.extend(commands)
+
+    return tuple(resolved)
 
     
-@trap
-def resolve_FILES(data:tuple) -> tuple:
+def resolve_files(files:tuple) -> tuple:
     """
-    FILES come in looking like these examples:
-
-    One file: ('/ab/c/d',)
-    Two files: (['/ab/c/d', '$HOME/.bashrc'],)
-
-    Note that each is a one-tuple. 
-
     NOTE: Why not glob the filenames? There are two reasons that this
     does not work. [1] If nothing matches the globbed expression, glob
     returns an empty list. [2] Most of the programs like rsync and
     scp that might be used to move files between hosts deal well with
     wildcard file names.
     """
-    files = data[0]
-    if isinstance(files, str): files = (files,)
-    return tuple((OpCode.FILE, fileutils.expandall(_)) for _ in files)
+    return tuple(fileutils.expandall(_) for _ in files)
 
 
-@trap
-def resolve_FROM(data:tuple) -> tuple:
+def is_group(name:str) -> bool:
+    return isinstance(resolve_config(name, None), (list, tuple))
+
+
+def check_dashes(name:str) -> None:
+    """
+    A host name may have a - in it, so ws.all-ws.nas is one name, not
+    ws.all - ws.nas. If a group is on either side of a dash, that is
+    surely not what was meant, and it is a ValueError rather than a
+    host that does not exist.
+    """
+    for i, c in enumerate(name):
+        if c == '-' and (is_group(name[:i]) or is_group(name[i+1:])):
+            raise ValueError(f"{name} is not a host. For the hosts in "
+                f"{name[:i]} but not in {name[i+1:]}, write {name[:i]} - {name[i+1:]}")
+
+
+def members_of(term:Union[str, ir.Combine]) -> Iterable[str]:
+    """
+    The hosts a name or a Combine stands for, in order, each once
+    for a Combine. (Groups inside groups are already taken apart in
+    the config's index.) Ranges like node[001-512] are made into
+    names here, when a statement names them, rather than when the
+    config is read; expand() keeps the whole tuple of them.
     """
-    FROM clause is part of a three-tuple. Only if it is a LOCAL
-    file do we try to resolve the file name.
+    if isinstance(term, str):
+        if (members := resolve_config(term, None)) is None: 
+            check_dashes(term)
+            members = (term,)
+        return hostranges.expand_all(members)
+
+    left = dict.fromkeys(expand(term.left))
+    right = dict.fromkeys(expand(term.right))
+    if term.operator == OpCode.UNION:
+        return tuple({**left, **right})
+    if term.operator == OpCode.DIFFERENCE:
+        return tuple(_ for _ in left if _ not in right)
+    return tuple(_ for _ in left if _ in right)
+
+
+def expand(names:tuple) -> tuple:
     """
-    clause = data[0]
-    print(clause)
-    if clause[1] is not OpCode.LOCAL: return clause
+    The hosts in the context of a statement, remembered until the
+    config changes. A range is kept this way with all of its hosts
+    spelled out, so a large one costs its memory once and keeps it.
+    """
+    global expansions, expansions_version
+
+    version = WSConfig().version
+    if version != expansions_version:
+        expansions, expansions_version = {}, version
 
     try:
-        command_file = fileutils.expandall(clause[2])
-        with open(command_file) as f:
-            commands = f.readlines()
-    except:
-        print(f"Unable to open {command_file}")
-        sys.exit(os.EX_IOERR)
-
-    if not len(commands): 
-        print(f"{command_file} is empty. Nothing to do.")
-        return clause[0], clause[1], OpCode.NOP
-
-    commands = tuple((OpCode.ACTION, _.strip()) for _ in commands if _)
-    
-    return clause[0], clause[1], commands
+        return expansions[names]
+    except KeyError:
+        hosts = expansions[names] = tuple(h for _ in names for h in members_of(_))
+        return hosts
 
 
-@trap
-def resolve_ON(data:tuple) -> tuple:
+def resolve_hosts(names:tuple) -> Union[tuple, None]:
     """
-    hostnames come in looking like this:
-
-    (['adam', 'anna', 'kevin'],)
-    ('adam',)
+    Each name is a host, the name of a list of them in the config
+    file, or a Combine of them. Every host has to have connection
+    information, either from the ssh config or from the transport.
     """
-    global info
-    data = data[0]
-    
-    if isinstance (data, str): data = (data,)
-
-    connection_info = []
-    for datum in data:
-        hosts = resolve_config(datum, (datum,))
-        for host in hosts:
-            hostinfo = info.get(host)
-            if hostinfo is None:
-                print(f"No connection information for {host}.")
-                sys.exit(os.EX_CONFIG)
-            connection_info.append((OpCode.HOST, hostinfo))
+    try:
+        members = expand(names)
+    except ValueError as e:
+        print(f"{e}")
+        return None
+
+    ssh_config = sshindex.index()
+    hosts = []
+    for host in members:
+        hostinfo = ssh_config.lookup(host)
+        if hostinfo is None: hostinfo = transport.host_info(host)
+        if hostinfo is None:
+            print(f"No connection information for {host}.")
+            return None
+        hosts.append(ir.Host.of(host, hostinfo))
     
-    return connection_info
+    return tuple(hosts)
+
+
+def resolve_exec(node:ir.Exec) -> Union[ir.Exec, ir.Nop, None]:
+    """
+    If the only commands were in local files that turn out to be
+    empty, there is nothing to do on any host.
+    """
+    hosts = resolve_hosts(node.hosts)
+    actions = resolve_actions(node.actions)
+    if hosts is None or actions is None: return None
+    if not actions: return ir.Nop(None)
+    return node.replace(hosts=hosts, actions=actions)
+
+
+def resolve_send(node:ir.Send) -> Union[ir.Send, None]:
+    hosts = resolve_hosts(node.hosts)
+    if hosts is None: return None
+    return node.replace(files=resolve_files(node.files), hosts=hosts)
 
-resolve_TO = resolve_ON
+
+def resolve_snapshot(node:ir.Snapshot) -> Union[ir.Snapshot, None]:
+    hosts = resolve_hosts(node.hosts)
+    if hosts is None: return None
+    return node.replace(hosts=hosts)
+
+
+###
+# The kinds of statement that have something to resolve. The others
+# are already what they are going to be.
+###
+RESOLVERS = {
+    ir.Exec: resolve_exec,
+    ir.Send: resolve_send,
+    ir.Snapshot: resolve_snapshot
+    }
 
 
 @trap
-def resolver(t:SloppyTree) -> SloppyTree:
+def resolver(node:ir.Node) -> Union[ir.Node, None]:
     """
-    This function works its way through the tree of symbols looking for
-    ones that are un-resolved. Examples are: 
+    Fill in what the statement left to be looked up: 
 
         - filenames that might contain environment variables like $HOME, 
             or that have relative paths like ../somedir/somefile.txt  
-        - hostnames that are defined in ~/.ssh/config
+        - hostnames that are defined in ~/.ssh/config, or names of 
+            groups of them in the config file
+        - commands to be read from a local file
 
-    The resolver() goes through the tree and looks for OpCodes that 
-    have resolvers identified by name: OpCode.ON -> resolve_ON, and so
-    on. If they don't, then no changes are made.
-
-    t -- The parse tree representing the user's command.
-
-    returns -- The modified (resolved) parse tree.
+    node -- the statement, as ir.build() made it.
 
+    returns -- a new node, with everything resolved, or None if 
+        something could not be (and we have said what.)
     """
     try:
         config = WSConfig()
@@ -195,21 +258,5 @@ def resolver(t:SloppyTree) -> SloppyTree:
         print(f"Could not get configuration. {e}")
         sys.exit(os.EX_CONFIG)
 
-    cmd = next(iter(dict(t)))
-    d = t[cmd]
-
-    for k in d.keys():
-        if k in OpCode:
-            print(f"Found {k}")
-            try:
-                d[k] = globals()[f"resolve_{k.name}"](d[k])
-            except:
-                pass
-
-        else:
-            logger.info(f"{k=} not in OpCode")
-            pass # someday, we may have something else here.
-        
-    t[cmd] = d
-    return t
-
+    resolve = RESOLVERS.get(type(node))
+    return node if resolve is None else resolve(node)
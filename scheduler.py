@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+A script is a list of statements, but there is no need to run them
+one at a time. Two statements that touch none of the same workstations
+cannot get in each other's way, so they may as well run at the same
+time. The scheduler works out what has to wait for what:
+
+    - a statement waits for the last earlier statement that touched
+        any of the same workstations.
+    - log, stop, and anything that is for the console are barriers.
+        They wait for everything before them, and everything after
+        them waits for them.
+    - statements joined by semicolons are one ir.Sequence, and they
+        are done in order as one step.
+
+and then runs each statement as soon as everything it waits for is
+done, with no more than scheduler.max_statements of them at once.
+How long a script takes is then about the length of its longest chain
+of waiting, rather than the sum of all its statements.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import heapq
+import logging
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import ir
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class Step:
+    """
+    One statement of the script, and its place in the graph.
+    """
+    __slots__ = {
+        'index': 'where it is in the script',
+        'lineno': 'where it is in the file',
+        'source': 'the text of the statement',
+        'program': 'the resolved statement, or None if it is for the console',
+        'machines': 'frozenset of the names of what it touches, or None for a barrier',
+        'after': 'the indexes of the steps that must be done first',
+        'before': 'the indexes of the steps that wait for this one',
+        'depth': 'the number of steps in the longest chain that ends here'
+        }
+
+    def __init__(self, index:int, lineno:int, source:str, program:ir.Node) -> None:
+        self.index = index
+        self.lineno = lineno
+        self.source = source
+        self.program = program
+        self.machines = touches(program)
+        self.after = set()
+        self.before = []
+        self.depth = 1
+
+
+    @property
+    def barrier(self) -> bool:
+        return self.machines is None
+
+
+def touches(program:ir.Node) -> Union[frozenset, None]:
+    """
+    The workstations a statement touches, by alias and by hostname,
+    or None if it is a barrier.
+    """
+    if program is None or isinstance(program, (ir.Log, ir.Stop)): return None
+    if isinstance(program, ir.Sequence):
+        parts = [ touches(_) for s, _ in program.steps ]
+        return None if None in parts else frozenset().union(*parts)
+    return frozenset(name for host in getattr(program, 'hosts', ())
+        for name in (host.alias, host.hostname))
+
+
+@trap
+def plan(statements:list) -> list:
+    """
+    statements -- (line number, source, resolved program or None),
+        in the order they were written.
+
+    returns -- a Step for each of them.
+    """
+    steps = []
+    last_to_touch = {}
+    barrier = None
+    since_barrier = []
+
+    for index, (lineno, source, program) in enumerate(statements):
+        step = Step(index, lineno, source, program)
+        if step.barrier:
+            ###
+            # Everything since the last barrier already waits for it,
+            # so if there is nothing since then, wait for it instead.
+            ###
+            step.after = set(since_barrier) or ({barrier} if barrier is not None else set())
+            barrier, since_barrier, last_to_touch = index, [], {}
+        else:
+            step.after = { last_to_touch[_] for _ in step.machines if _ in last_to_touch }
+            if barrier is not None: step.after.add(barrier)
+            last_to_touch.update(dict.fromkeys(step.machines, index))
+            since_barrier.append(index)
+
+        step.depth = 1 + max((steps[_].depth for _ in step.after), default=0)
+        for _ in step.after: steps[_].before.append(index)
+        steps.append(step)
+
+    return steps
+
+
+def describe(step:Step, steps:list) -> str:
+    """
+    Where the step stands in the graph, for --explain.
+    """
+    waits = ", ".join(f"{steps[_].lineno}" for _ in sorted(step.after))
+    return ( f"level {step.depth}" + (", barrier" if step.barrier else "") +
+        (f", after line(s) {waits}" if waits else "") )
+
+
+@trap
+def run(statements:list, work:Callable[[int, str, ir.Node], int],
+    max_statements:int=4) -> int:
+    """
+    Run the statements as soon as they are free to run.
+
+    work -- carries out one statement, and gives back its exit code.
+        Barriers are run in this thread, and everything else in a
+        worker thread.
+    max_statements -- the most statements running at once.
+
+    returns -- os.EX_OK, or the exit code of the first statement that
+        failed. After a failure, nothing more is started, but the
+        statements that are running are allowed to finish.
+    """
+    steps = plan(statements)
+    waiting_for = [ len(_.after) for _ in steps ]
+    ready = [ _.index for _ in steps if not _.after ]
+    heapq.heapify(ready)
+    running = {}
+    code = os.EX_OK
+
+    def finished(step:Step) -> None:
+        for _ in step.before:
+            waiting_for[_] -= 1
+            if not waiting_for[_]: heapq.heappush(ready, _)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_statements)),
+        thread_name_prefix='statement') as pool:
+
+        while (ready and not code) or running:
+            while ready and not code and len(running) < max_statements:
+                step = steps[heapq.heappop(ready)]
+                if step.barrier:
+                    ###
+                    # Nothing can be running, because a barrier is not
+                    # ready until everything before it is done.
+                    ###
+                    try:
+                        code = work(step.lineno, step.source, step.program)
+                    except Exception as e:
+                        logger.error(f"line {step.lineno} raised {e}")
+                        code = os.EX_SOFTWARE
+                    finished(step)
+                else:
+                    logger.debug(f"starting line {step.lineno}")
+                    running[pool.submit(work, step.lineno, step.source, step.program)] = step
+
+            if not running: continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"line {step.lineno} raised {e}")
+                    result = os.EX_SOFTWARE
+                if result and not code:
+                    logger.info(f"line {step.lineno} failed with {result}")
+                    code = result
+                finished(step)
+
+    return code
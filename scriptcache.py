@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Scripts that are run again and again -- the nightly ones -- need not
+be parsed and resolved again and again. The first time a script is
+run, the resolved program is pickled in ~/.cache/wscontrol under a
+key made from the text of the script, the modification times of the
+config file and of ~/.ssh/config, and anything else that changes how
+it resolves. If any of those change, the key changes with them, and
+the script is compiled afresh. Files read with "from local" are
+checked when the program is loaded, because their names are not known
+until the script has been parsed.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import contextlib
+import hashlib
+import logging
+import pickle
+import tempfile
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+import fileutils
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+from   opcodes import OpCode
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# Change this when the shape of what is pickled changes, and the
+# old entries will simply never be found again.
+###
+FORMAT = 2
+
+###
+# The most compiled scripts we keep; the least recently used go first.
+###
+MAX_ENTRIES = 200
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class CompiledScript:
+    """
+    A script, ready to run.
+    """
+    __slots__ = {
+        'key': 'the hash that names it in the cache',
+        'statements': 'list of (line number, source, resolved ir.Node or None)',
+        'depends': 'dict of file name -> mtime, for the files it read as it was compiled'
+        }
+
+    def __init__(self, key:str, statements:list, depends:dict) -> None:
+        self.key = key
+        self.statements = statements
+        self.depends = depends
+
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+
+    @property
+    def stale(self) -> bool:
+        """
+        True if any file that went into the program has changed.
+        """
+        return any(mtime(f) != m for f, m in self.depends.items())
+
+
+def mtime(filename:str) -> float:
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return 0.0
+
+
+def cache_dir() -> str:
+    """
+    Private to us, like the control sockets.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    d = os.path.join(base, 'wscontrol')
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    return d
+
+
+def key_of(text:str, config_file:str, *others:str) -> str:
+    """
+    The script, and the things that change what it resolves to. others
+    are anything else that matters, such as the choice of parser or
+    transport.
+    """
+    h = hashlib.sha256()
+    for part in (f"{FORMAT}", text, os.path.abspath(config_file),
+        f"{mtime(config_file)}", f"{mtime(os.path.expanduser('~/.ssh/config'))}",
+        *others):
+        h.update(part.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def local_files(tokens:object) -> list:
+    """
+    The files named in "from local" clauses of a parsed statement.
+    """
+    if not isinstance(tokens, (tuple, list)): return []
+    if len(tokens) == 3 and tokens[0] == OpCode.FROM and tokens[1] == OpCode.LOCAL:
+        return [fileutils.expandall(tokens[2])]
+    return [ f for _ in tokens for f in local_files(_) ]
+
+
+def depends_on(files:Iterable) -> dict:
+    """
+    The modification times to check before a compiled script is used.
+    """
+    return { f: mtime(f) for f in files }
+
+
+def entry(key:str) -> str:
+    return os.path.join(cache_dir(), f"{key}.pickle")
+
+
+def load(key:str) -> Union[CompiledScript, None]:
+    """
+    The compiled script with this key, if there is one and nothing it
+    depends on has changed. The directory must be ours; we are not
+    going to unpickle anything that someone else could have put there.
+    """
+    d = cache_dir()
+    if os.stat(d).st_uid != os.getuid():
+        logger.warning(f"{d} does not belong to us. Not using it.")
+        return None
+
+    try:
+        with open(entry(key), 'rb') as f:
+            script = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.info(f"unable to read compiled script {key}. {e}")
+        return None
+
+    if script.stale:
+        logger.info(f"compiled script {key} is out of date.")
+        return None
+
+    ###
+    # Touch it, so that it is not among the first to be pruned.
+    ###
+    os.utime(entry(key))
+    return script
+
+
+@trap
+def save(script:CompiledScript) -> None:
+    """
+    Write it to a temporary file and rename it, so that a reader never
+    sees half of one.
+    """
+    fd, name = tempfile.mkstemp(dir=cache_dir(), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(script, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(name, entry(script.key))
+    prune()
+
+
+def prune(keep:int=MAX_ENTRIES) -> int:
+    """
+    Remove all but the keep most recently used entries.
+
+    returns -- how many were removed.
+    """
+    d = cache_dir()
+    entries = sorted(( os.path.join(d, _) for _ in os.listdir(d) if _.endswith('.pickle') ),
+        key=mtime, reverse=True)
+    for name in entries[keep:]:
+        with contextlib.suppress(OSError): os.unlink(name)
+    return max(0, len(entries) - keep)
+
+
+def compiled(text:str, compile:Callable[[str], tuple], key:str) -> CompiledScript:
+    """
+    The compiled script for text, from the cache if it is there, or
+    else from compile(), which gives back the statements and the
+    local files they read.
+    """
+    if (script := load(key)) is not None:
+        logger.info(f"using compiled script {key}")
+        return script
+
+    statements, files = compile(text)
+    script = CompiledScript(key, statements, depends_on(files))
+    save(script)
+    return script
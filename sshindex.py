@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+What ~/.ssh/config says about how to reach each host, read only when
+a host is first asked about, and kept in ~/.cache/wscontrol so that
+it is not read again until it changes.
+
+The file is read as ssh reads it: the Include'd files (and their
+Includes) in place, and, for each host, the first value of each
+keyword from the Host blocks that match it, the ones with wildcards
+included. A host is only known if some Host line names it without
+wildcards; anything else is left to the transport.
+
+The cache is the Host blocks, in order, and the modification times
+of every file that was read and of every directory an Include looked
+in for files, so that a new file in ~/.ssh/config.d is noticed too.
+
+    python sshindex.py adam anna
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import fnmatch
+import glob
+import json
+import logging
+import re
+import shlex
+import tempfile
+import threading
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+SSH_DIR = os.path.expanduser('~/.ssh')
+SSH_CONFIG = os.path.join(SSH_DIR, 'config')
+KEYWORD = re.compile(r'(\S+?)(?:\s*=\s*|\s+|$)(.*)')
+
+###
+# Change this when the shape of the cache file changes.
+###
+FORMAT = 1
+
+the_index = None
+index_lock = threading.Lock()
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def mtime_of(path:str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def keyword_and_value(line:str) -> tuple:
+    """
+    ssh allows "Keyword value" and "Keyword=value". Quoted values
+    keep their spaces.
+    """
+    keyword, value = KEYWORD.match(line).groups()
+    try:
+        return keyword.lower(), shlex.split(value)
+    except ValueError:
+        return keyword.lower(), value.split()
+
+
+def read_config(filename:str, blocks:list, stamps:dict, current:list=None) -> None:
+    """
+    Add the Host blocks in filename, and those in anything it
+    includes, to blocks. Every file and Include directory we look at
+    goes into stamps.
+
+    current -- the block that lines before the first Host line belong
+        to; None at the top of ~/.ssh/config, where they apply to
+        every host.
+
+    A Match block is skipped, because whether it applies cannot be
+    known until ssh is connecting.
+    """
+    stamps[filename] = mtime_of(filename)
+    try:
+        with open(filename) as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        logger.debug(f"{filename} cannot be read. {e}")
+        return
+
+    skipping = False
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'): continue
+
+        keyword, words = keyword_and_value(line)
+        if keyword == 'include':
+            for pattern in words:
+                pattern = os.path.join(SSH_DIR, os.path.expanduser(pattern))
+                stamps[os.path.dirname(pattern)] = mtime_of(os.path.dirname(pattern))
+                for included in sorted(glob.glob(pattern)):
+                    read_config(included, blocks, stamps, None if skipping else current)
+        elif keyword == 'host':
+            current, skipping = [words, {}], False
+            blocks.append(current)
+        elif keyword == 'match':
+            skipping = True
+        elif words and not skipping:
+            if current is None:
+                current = [['*'], {}]
+                blocks.append(current)
+            current[1].setdefault(keyword, words[0])
+
+
+def matches(host:str, patterns:list) -> bool:
+    """
+    ssh's rule: any of the patterns matches, and none of the negated
+    ones do.
+    """
+    if any(fnmatch.fnmatchcase(host, _[1:]) for _ in patterns if _.startswith('!')):
+        return False
+    return any(fnmatch.fnmatchcase(host, _) for _ in patterns if not _.startswith('!'))
+
+
+class SSHIndex:
+    """
+    The Host blocks, and what has been looked up in them so far.
+    """
+    __slots__ = {
+        'blocks': 'list of [patterns, {keyword: value}], in the order ssh reads them',
+        'stamps': 'path -> mtime_ns of everything that was read to make them',
+        'named': 'the hosts that some Host line names without wildcards',
+        'found': 'host -> what was looked up for it, or None'
+        }
+
+    def __init__(self, blocks:list, stamps:dict) -> None:
+        self.blocks = blocks
+        self.stamps = stamps
+        self.named = frozenset( p for patterns, _ in blocks for p in patterns
+            if not any(c in p for c in '*?!') )
+        self.found = {}
+
+
+    @classmethod
+    def read(cls, filename:str=SSH_CONFIG) -> 'SSHIndex':
+        blocks, stamps = [], {}
+        read_config(filename, blocks, stamps)
+        return cls(blocks, stamps)
+
+
+    def current(self) -> bool:
+        return all(mtime_of(path) == t for path, t in self.stamps.items())
+
+
+    def lookup(self, host:str) -> Union[dict, None]:
+        """
+        The connection information for host, or None if the ssh config
+        does not know it.
+        """
+        try:
+            return self.found[host]
+        except KeyError:
+            pass
+
+        info = None
+        if host in self.named:
+            info = {}
+            for patterns, settings in self.blocks:
+                if matches(host, patterns):
+                    for k, v in settings.items(): info.setdefault(k, v)
+            if 'hostname' in info:
+                info['hostname'] = info['hostname'].replace('%h', host)
+        self.found[host] = info
+        return info
+
+
+def cache_file() -> str:
+    import scriptcache
+    return os.path.join(scriptcache.cache_dir(), 'sshconfig.json')
+
+
+def load(filename:str=SSH_CONFIG) -> Union[SSHIndex, None]:
+    """
+    The index from the cache, if it is for this file and nothing it
+    was made from has changed since.
+    """
+    try:
+        with open(cache_file()) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get('format') != FORMAT or cached.get('filename') != filename: return None
+    index = SSHIndex(cached['blocks'], cached['stamps'])
+    return index if index.current() else None
+
+
+def save(index:SSHIndex, filename:str=SSH_CONFIG) -> None:
+    """
+    Write to a temporary file, and rename it, so that someone else
+    reading the cache never sees half of it.
+    """
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_file()), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'format': FORMAT, 'filename': filename,
+                'stamps': index.stamps, 'blocks': index.blocks}, f)
+        os.replace(tmp, cache_file())
+    except OSError as e:
+        logger.warning(f"Could not save the ssh config index. {e}")
+
+
+def index() -> SSHIndex:
+    """
+    The index, read from the cache or from the ssh config the first
+    time it is wanted, and again if the ssh config has changed.
+    """
+    global the_index
+
+    with index_lock:
+        if the_index is None or not the_index.current():
+            if (the_index := load()) is None:
+                the_index = SSHIndex.read()
+                logger.debug(f"{SSH_CONFIG} read, {len(the_index.named)} hosts.")
+                save(the_index)
+        return the_index
+
+
+def host_info(host:str) -> Union[dict, None]:
+    return index().lookup(host)
+
+
+def stamp() -> str:
+    """
+    Something that changes when any part of the ssh config does.
+    """
+    return " ".join(f"{t}" for t in index().stamps.values())
+
+
+@trap
+def sshindex_main(myargs:argparse.Namespace) -> int:
+    i = index()
+    for host in myargs.host or sorted(i.named):
+        print(f"{host} = {i.lookup(host)}")
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="sshindex",
+        description="What sshindex does, sshindex does best.")
+
+    parser.add_argument('host', nargs='*',
+        help="Hosts to look up; every named host, if there are none.")
+
+    myargs = parser.parse_args()
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Timeouts that are learned rather than guessed. We keep the recent
+connection times for each host, and the recent run times for each
+(host, command) pair, and set the timeouts from their percentiles:
+a host that always answers in 50ms need not be given five seconds,
+and a 'dnf -y update' that has taken ten minutes before should not
+be killed after one.
+
+Anything in the timeouts section of wscontrol.toml overrides what
+is learned.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   collections import deque
+import logging
+import math
+import shlex
+import sqlite3
+import threading
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+import auditlog
+from   resolver import resolve_config
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# The fingerprint of the connection itself, as opposed to a command.
+###
+CONNECT = ''
+
+SQL = """INSERT INTO latency (host, fingerprint, seconds) VALUES (?, ?, ?)"""
+
+###
+# Commands that run another command. 'sudo dnf -y update' is a dnf
+# update, so these are passed over, with their options, and with the
+# arguments of the options that take one.
+###
+WRAPPERS = {
+    'sudo': ('-u', '-g', '-C', '-D', '-h', '-p', '-r', '-t', '-U'),
+    'env': ('-u', '-C', '-S'),
+    'nice': ('-n',),
+    'nohup': ()
+    }
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def fingerprint(command:str) -> str:
+    """
+    Commands that differ only in their options or in the details of
+    their arguments are the same command for our purposes:
+    'dnf -y update', 'dnf update --refresh', and 'sudo -u root nice
+    -n 10 dnf -y update' are all 'dnf update'.
+    """
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        words = command.split()
+
+    while words and (wrapper := os.path.basename(words[0])) in WRAPPERS:
+        words = words[1:]
+        while words and (words[0].startswith('-') or wrapper == 'env' and '=' in words[0]):
+            words = words[2:] if words[0] in WRAPPERS[wrapper] else words[1:]
+
+    words = [ _ for _ in words if not _.startswith('-') ]
+    if not words: return command.strip()
+    return " ".join([os.path.basename(words[0])] + words[1:2])
+
+
+def percentile(samples:Iterable, p:float) -> float:
+    """
+    Nearest-rank percentile; there are never many samples.
+    """
+    s = sorted(samples)
+    return s[max(0, math.ceil(p/100 * len(s)) - 1)]
+
+
+class LatencyBook:
+    """
+    The recent samples for each (host, fingerprint).
+    """
+    __slots__ = {
+        'samples': 'dict of (host, fingerprint) -> deque of seconds',
+        'depth': 'how many samples to keep for each key',
+        'lock': 'shared by the fan-out threads'
+        }
+
+    def __init__(self, depth:int=50) -> None:
+        self.samples = {}
+        self.depth = depth
+        self.lock = threading.Lock()
+
+
+    def load(self, db_name:str) -> None:
+        try:
+            db = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+            rows = db.execute("""SELECT host, fingerprint, seconds FROM latency
+                ORDER BY rowid DESC LIMIT 100000""").fetchall()
+            db.close()
+        except sqlite3.Error as e:
+            logger.info(f"no latency history in {db_name}. {e}")
+            return
+
+        with self.lock:
+            for host, fp, seconds in reversed(rows):
+                self.samples.setdefault((host, fp), deque(maxlen=self.depth)).append(seconds)
+        logger.info(f"{len(rows)} latency samples loaded.")
+
+
+    def record(self, host:str, fp:str, seconds:float) -> None:
+        with self.lock:
+            self.samples.setdefault((host, fp), deque(maxlen=self.depth)).append(seconds)
+        w = auditlog.writer()
+        if w is not None: w.submit(SQL, (host, fp, seconds))
+
+
+    def estimate(self, host:str, fp:str, p:float, minimum:int=5) -> Union[float, None]:
+        """
+        The p-th percentile of the samples, or None if there are not
+        enough of them to go on.
+        """
+        with self.lock:
+            samples = tuple(self.samples.get((host, fp), ()))
+        return percentile(samples, p) if len(samples) >= minimum else None
+
+
+the_book = LatencyBook()
+
+###
+# The database open_latency() was given, until the first connection
+# wants the samples in it.
+###
+pending = None
+opening = threading.Lock()
+
+
+@trap
+def open_latency(db_name:str) -> None:
+    """
+    Up to 100000 samples are read when the first connection is
+    timed, not before.
+    """
+    global pending
+    pending = db_name
+
+
+def book() -> LatencyBook:
+    global the_book, pending
+    if pending is None: return the_book
+
+    with opening:
+        if pending is not None:
+            opened = LatencyBook(resolve_config('timeouts.samples', 50))
+            opened.load(pending)
+            the_book, pending = opened, None
+    return the_book
+
+
+def record_connect(host:str, seconds:float) -> None:
+    book().record(host, CONNECT, seconds)
+
+
+def record_runtime(host:str, command:str, seconds:float) -> None:
+    book().record(host, fingerprint(command), seconds)
+
+
+def connect_timeout(host:str) -> int:
+    """
+    ssh wants whole seconds. Three times the 99th percentile leaves
+    plenty of room for a busy day, and never more than the configured
+    timeout, which is also what an unknown host gets.
+    """
+    if (override := resolve_config(f"timeouts.hosts.{host}", None)) is not None:
+        return int(override)
+
+    ceiling = int(resolve_config('timeouts.connect', 5))
+    if (p99 := book().estimate(host, CONNECT, 99)) is None: return ceiling
+    return max(1, min(ceiling, math.ceil(3 * p99)))
+
+
+def deadline(host:str, command:str) -> float:
+    """
+    How long command may run on host. A command that has been killed
+    at its deadline is recorded as having taken that long, so three
+    times the 95th percentile lets the deadline grow quickly for a
+    command that turns out to be slow.
+    """
+    fp = fingerprint(command)
+    if (override := resolve_config('timeouts.commands', {}).get(fp)) is not None:
+        return float(override)
+
+    default = float(resolve_config('timeouts.command', 60))
+    if (p95 := book().estimate(host, fp, 95)) is None: return default
+    return max(float(resolve_config('timeouts.command_min', 5)),
+        min(float(resolve_config('timeouts.command_max', 3600)), 3 * p95))
@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+How commands and files get to a workstation. Everything that touches
+a host -- EXEC, SEND, the health probes, and the wsview collectors --
+goes through the session's Transport, of which there are three:
+
+    ssh -- the real thing.
+    local -- every host is this computer; the commands really run,
+        each in a directory of its own. Good for trying out scripts.
+    simulated -- nothing runs at all. Each host answers after a
+        delay, fails now and then, and sends back some output, all
+        as configured. It is how we find out what a fan-out to a
+        thousand workstations costs without having them.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+from   abc import ABC, abstractmethod
+import getpass
+mynetid = getpass.getuser()
+import logging
+import random
+import re
+import shlex
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   sloppytree import SloppyTree
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+from   connpool import pool, ssh_options
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def outcome(code:int, stdout:str="", stderr:str="", elapsed:float=None) -> SloppyTree:
+    """
+    What every transport hands back: the same shape that dorunrun
+    gives us, plus how long it took.
+    """
+    return SloppyTree({'OK': code == 0, 'code': code,
+        'stdout': stdout, 'stderr': stderr, 'elapsed': elapsed})
+
+
+def shell(cmd:str, timeout:float, input:str=None, **kwargs) -> SloppyTree:
+    """
+    Run cmd here. A command that runs out of time gets 124, which is
+    what timeout(1) returns, so it will be familiar. Hosts print what
+    they like, so bytes that are not UTF-8 are replaced rather than
+    allowed to end the run.
+    """
+    start = time.perf_counter()
+    try:
+        p = subprocess.run(cmd, shell=True, input=input, capture_output=True,
+            text=True, errors='replace', timeout=timeout, **kwargs)
+        return outcome(p.returncode, p.stdout, p.stderr, time.perf_counter() - start)
+
+    except subprocess.TimeoutExpired as e:
+        stdout = e.stdout.decode(errors='replace') if isinstance(e.stdout, bytes) else (e.stdout or "")
+        stderr = e.stderr.decode(errors='replace') if isinstance(e.stderr, bytes) else (e.stderr or "")
+        return outcome(124, stdout, stderr, timeout)
+
+
+def batch_script(actions:tuple, marker:str, stop_on_error:bool) -> str:
+    """
+    Build a shell script that runs the actions one after the other,
+    each in its own subshell as if it had its own ssh connection.
+    After each action, a line with the marker, the index of the
+    action, its exit code, and the times it started and finished is
+    written to stdout and to stderr so that demux() can take the
+    output apart again. EPOCHREALTIME is bash 5; older shells pay
+    for a call to date.
+
+    The actions' stdin is /dev/null; otherwise the first action that
+    reads stdin would swallow the rest of the script.
+    """
+    now = "${EPOCHREALTIME:-$(date +%s.%N)}"
+    lines = []
+    for i, action in enumerate(actions):
+        lines.append(f"__t0={now}")
+        lines.append(f"( {action}\n) </dev/null")
+        lines.append(f"__rc=$?; __t1={now}; "
+            f"printf '\\n{marker} {i} %d %s %s\\n' $__rc $__t0 $__t1; "
+            f"printf '\\n{marker} {i} %d %s %s\\n' $__rc $__t0 $__t1 >&2")
+        if stop_on_error:
+            lines.append("[ $__rc -eq 0 ] || exit $__rc")
+    return "\n".join(lines) + "\n"
+
+
+def demux(text:str, marker:str) -> tuple:
+    """
+    Split the output of a batch_script() into its actions.
+
+    returns -- a dict of action index -> (output, exit code, seconds),
+        and whatever followed the last marker (usually nothing, but it
+        is where an ssh error message ends up).
+    """
+    pieces = {}
+    position = 0
+    for m in re.finditer(rf"\n{marker} (\d+) (-?\d+) ([\d.,]+) ([\d.,]+)\n", text):
+        try:
+            seconds = float(m[4].replace(',', '.')) - float(m[3].replace(',', '.'))
+        except ValueError:
+            seconds = None
+        pieces[int(m[1])] = (text[position:m.start()], int(m[2]), seconds)
+        position = m.end()
+    return pieces, text[position:]
+
+
+class Transport(ABC):
+    """
+    The operations every transport provides. host is always the
+    connection information for one workstation, as the resolver
+    leaves it: a SloppyTree with host (its name to us), hostname,
+    and usually user, identityfile, and port. A transport must have
+    its own run() and copy(); the rest have sensible defaults.
+    """
+    __slots__ = {}
+    name = 'none'
+
+    def host_info(self, host:str) -> Union[dict, None]:
+        """
+        Connection information for a host that is not in the ssh
+        config, or None if there is no such host.
+        """
+        return None
+
+
+    def describe(self, host:SloppyTree, command:str) -> str:
+        """
+        The command as we show it, and as it goes into the record.
+        """
+        return command
+
+
+    def describe_copy(self, host:SloppyTree, files:tuple) -> str:
+        return f"copy {' '.join(files)} to {host.get('host', host.hostname)}"
+
+
+    def connect(self, host:SloppyTree, timeout:float) -> SloppyTree:
+        """
+        Get ready to talk to the host. elapsed is None if there was
+        nothing to do, so that it is not mistaken for a connection time.
+        """
+        return outcome(0)
+
+
+    @abstractmethod
+    def run(self, host:SloppyTree, command:str, timeout:float,
+        input:str=None, wait:int=None) -> SloppyTree:
+        """
+        Run command on host, with input on its stdin, giving it no more
+        than timeout seconds, of which no more than wait are for making
+        the connection.
+        """
+
+
+    def batch(self, host:SloppyTree, actions:tuple, timeout:float,
+        stop_on_error:bool) -> list:
+        """
+        Run the actions, in order, in one session on host.
+
+        returns -- a result for each action that was run. If the session
+            died or ran out of time, the last result is for the action
+            that was running and carries the session's exit code, and
+            there are no results after it.
+        """
+        marker = f"__wscontrol_{uuid.uuid4().hex}"
+        session = self.run(host, "bash -s", timeout,
+            batch_script(actions, marker, stop_on_error))
+
+        outputs, out_tail = demux(session.stdout, marker)
+        errors, err_tail = demux(session.stderr, marker)
+
+        results = []
+        for i, action in enumerate(actions):
+            if i not in outputs:
+                code = session.code if session.code else 255
+                results.append(outcome(code, out_tail, err_tail,
+                    timeout if code == 124 else None))
+                break
+
+            output, code, seconds = outputs[i]
+            results.append(outcome(code, output, errors.get(i, ("",))[0], seconds))
+            if code and stop_on_error: break
+
+        return results
+
+
+    @abstractmethod
+    def copy(self, host:SloppyTree, files:tuple, timeout:float) -> SloppyTree:
+        """
+        Send the local files to host, into the home directory.
+        """
+
+
+    def probe(self, address:str, port:int=22) -> bool:
+        """
+        Is anyone listening? A TCP connection to sshd is much cheaper
+        than an ssh connection, and tells us just as much.
+        """
+        try:
+            with socket.create_connection((address, port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+
+class SSHTransport(Transport):
+    """
+    ssh and scp, through the session's pool of master connections
+    if there is one.
+    """
+    __slots__ = {
+        'connect_timeout': 'function of the host name that gives seconds to allow for connecting'
+        }
+    name = 'ssh'
+
+    def __init__(self, connect_timeout:Callable[[str], int]=None, **kwargs) -> None:
+        self.connect_timeout = ( connect_timeout if connect_timeout is not None
+            else lambda host: 5 )
+
+
+    def destination(self, host:SloppyTree) -> str:
+        return f"{host.user}@{host.hostname}" if host.get('user') else f"{host.hostname}"
+
+
+    def options(self, host:SloppyTree, wait:int=None) -> str:
+        """
+        The options common to ssh and scp.
+        """
+        wait = self.connect_timeout(host.get('host', host.hostname)) if wait is None else wait
+        identity = host.get('identityfile')
+        if isinstance(identity, (list, tuple)): identity = identity[0] if identity else None
+        port = host.get('port')
+
+        return ( (f"-i {identity} " if identity else "") +
+            (f"-o Port={port} " if port else "") +
+            f"-o ConnectTimeout={wait} {ssh_options(self.destination(host))}" )
+
+
+    def describe(self, host:SloppyTree, command:str) -> str:
+        return f"ssh {self.destination(host)} {command}"
+
+
+    def describe_copy(self, host:SloppyTree, files:tuple) -> str:
+        return f"scp {' '.join(files)} {self.destination(host)}:"
+
+
+    def connect(self, host:SloppyTree, timeout:float) -> SloppyTree:
+        """
+        If the session has a pool and there is no master for this host
+        yet, open one by itself, so that we learn how long connecting
+        takes separately from how long the commands take.
+        """
+        destination = self.destination(host)
+        if pool() is None or pool().is_open(destination): return outcome(0)
+        return shell(f"ssh {self.options(host)} -fN {destination}", timeout)
+
+
+    def run(self, host:SloppyTree, command:str, timeout:float,
+        input:str=None, wait:int=None) -> SloppyTree:
+        return shell(f"ssh {self.options(host, wait)} {self.destination(host)} {command}",
+            timeout, input)
+
+
+    def copy(self, host:SloppyTree, files:tuple, timeout:float) -> SloppyTree:
+        return shell(f"scp -q {self.options(host)} {' '.join(files)} "
+            f"{self.destination(host)}:", timeout)
+
+
+class LocalTransport(Transport):
+    """
+    Every host is this computer. Each one gets a directory of its own
+    under root, in which its commands run and to which files are sent,
+    and WSCONTROL_HOST tells the commands which host they are.
+    """
+    __slots__ = {
+        'root': 'the directory that holds a directory for each host'
+        }
+    name = 'local'
+
+    def __init__(self, root:str=None, **kwargs) -> None:
+        self.root = ( root if root else
+            os.path.join(tempfile.gettempdir(), f"wscontrol-{mynetid}-hosts") )
+
+
+    def home(self, host:SloppyTree) -> str:
+        d = os.path.join(self.root, host.get('host', host.hostname))
+        os.makedirs(d, mode=0o700, exist_ok=True)
+        return d
+
+
+    def host_info(self, host:str) -> dict:
+        return {'hostname': host, 'user': mynetid}
+
+
+    def describe(self, host:SloppyTree, command:str) -> str:
+        return f"[{host.get('host', host.hostname)}] {command}"
+
+
+    def describe_copy(self, host:SloppyTree, files:tuple) -> str:
+        return f"cp {' '.join(files)} {self.home(host)}"
+
+
+    def run(self, host:SloppyTree, command:str, timeout:float,
+        input:str=None, wait:int=None) -> SloppyTree:
+        return shell(command, timeout, input, cwd=self.home(host),
+            env={**os.environ, 'WSCONTROL_HOST': host.get('host', host.hostname)})
+
+
+    def copy(self, host:SloppyTree, files:tuple, timeout:float) -> SloppyTree:
+        return shell(f"cp -r {' '.join(shlex.quote(_) for _ in files)} {self.home(host)}/",
+            timeout)
+
+
+    def probe(self, address:str, port:int=22) -> bool:
+        return True
+
+
+###
+# What the simulated hosts say to the commands that wsview uses, so
+# that SNAPSHOT has something to draw. Anything else gets filler.
+###
+CANNED = {
+    'free': lambda r: (
+        "              total        used        free      shared  buff/cache   available\n"
+        f"Mem:       65536000 {r.randint(1000000, 64000000):>11}     1000000       10000     2000000    30000000\n"
+        "Swap:       8388604           0     8388604\n" ),
+    'nproc': lambda r: f"{r.choice((4, 8, 16, 32))}\n",
+    'w': lambda r: (
+        f" 10:01:02 up 3 days,  4:05,  2 users,  load average: {r.uniform(0, 8):.2f}, 0.40, 0.33\n" )
+    }
+
+
+class SimulatedTransport(Transport):
+    """
+    Hosts that exist only here. Every host takes latency seconds to
+    answer (a little more or less, at random), fails failure_rate of
+    the time, and sends back output_size characters of output. Any of
+    them may be set for a particular host in hosts. The first contact
+    with a host is its "connection", and a connection that fails looks
+    just like an ssh connection that failed: the exit code is 255.
+    """
+    __slots__ = {
+        'latency': 'seconds for a host to answer',
+        'failure_rate': 'fraction of connections and commands that fail',
+        'output_size': 'characters of output from each command',
+        'hosts': 'dict of host -> dict of the above, for hosts that differ',
+        'connected': 'the hosts we have been in contact with',
+        'rng': 'the source of randomness; seeded, the same run happens every time',
+        'lock': 'the hosts are simulated by the fan-out threads'
+        }
+    name = 'simulated'
+
+    def __init__(self, latency:float=0.05, failure_rate:float=0.0,
+        output_size:int=200, hosts:dict=None, seed:int=None, **kwargs) -> None:
+        self.latency = float(latency)
+        self.failure_rate = float(failure_rate)
+        self.output_size = int(output_size)
+        self.hosts = { k: dict(v) for k, v in dict(hosts or {}).items() }
+        self.connected = set()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+
+    def profile(self, host:SloppyTree) -> tuple:
+        """
+        latency, failure_rate, output_size for this host.
+        """
+        p = self.hosts.get(host.get('host', host.hostname), {})
+        return ( float(p.get('latency', self.latency)),
+            float(p.get('failure_rate', self.failure_rate)),
+            int(p.get('output_size', self.output_size)) )
+
+
+    def host_info(self, host:str) -> dict:
+        return {'hostname': host, 'user': mynetid}
+
+
+    def describe(self, host:SloppyTree, command:str) -> str:
+        return f"[{host.get('host', host.hostname)}] {command}"
+
+
+    def answer(self, host:SloppyTree, timeout:float) -> tuple:
+        """
+        Wait as long as the host takes to answer, or until the time
+        runs out, and decide whether it worked.
+
+        returns -- exit code (0, 1, or 124), and the seconds it took.
+        """
+        latency, failure_rate, _ = self.profile(host)
+        with self.lock:
+            delay = latency * self.rng.uniform(0.5, 1.5)
+            failed = self.rng.random() < failure_rate
+
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return 124, timeout
+        time.sleep(delay)
+        return int(failed), delay
+
+
+    def connect(self, host:SloppyTree, timeout:float) -> SloppyTree:
+        name = host.get('host', host.hostname)
+        if name in self.connected: return outcome(0)
+
+        code, seconds = self.answer(host, timeout)
+        if code:
+            return outcome(255, "", f"ssh: connect to host {name} port 22: "
+                "Connection timed out (simulated)\n", seconds)
+        with self.lock:
+            self.connected.add(name)
+        return outcome(0, elapsed=seconds)
+
+
+    def output(self, command:str, size:int) -> str:
+        words = command.split()
+        if words and words[0] in CANNED:
+            with self.lock:
+                return CANNED[words[0]](self.rng)
+        line = "simulated output " * 4 + "\n"
+        return (line * (size // len(line) + 1))[:size]
+
+
+    def run(self, host:SloppyTree, command:str, timeout:float,
+        input:str=None, wait:int=None) -> SloppyTree:
+        """
+        The connection is part of the first command to a host, as it is
+        with ssh.
+        """
+        if not (c := self.connect(host, wait if wait is not None else timeout)).OK: return c
+
+        code, seconds = self.answer(host, timeout)
+        if code:
+            return outcome(code, "", f"{command}: failed (simulated)\n", seconds)
+        return outcome(0, self.output(command, self.profile(host)[2]), "", seconds)
+
+
+    def batch(self, host:SloppyTree, actions:tuple, timeout:float,
+        stop_on_error:bool) -> list:
+        """
+        There is no shell to give a script to, so the actions are simply
+        answered one after the other, out of the same time allowance.
+        """
+        results = []
+        deadline = time.monotonic() + timeout
+        for action in actions:
+            results.append(r := self.run(host, action, max(0, deadline - time.monotonic())))
+            if r.code == 124 or (r.code and stop_on_error): break
+        return results
+
+
+    def copy(self, host:SloppyTree, files:tuple, timeout:float) -> SloppyTree:
+        return self.run(host, f"copy {' '.join(files)}", timeout)
+
+
+    def probe(self, address:str, port:int=22) -> bool:
+        with self.lock:
+            return self.rng.random() >= self.failure_rate
+
+
+transports = {
+    SSHTransport.name: SSHTransport,
+    LocalTransport.name: LocalTransport,
+    SimulatedTransport.name: SimulatedTransport
+    }
+
+###
+# Until open_transport() says otherwise, we use ssh.
+###
+the_transport = SSHTransport()
+
+
+def current() -> Transport:
+    """
+    The session's transport.
+    """
+    return the_transport
+
+
+@trap
+def open_transport(kind:str='ssh', **kwargs) -> Transport:
+    """
+    Choose the session's transport. The keyword arguments are the
+    settings for that kind of transport; the ones that do not apply
+    are ignored.
+    """
+    global the_transport
+    if kind not in transports:
+        print(f"Unknown transport {kind}. Try one of {', '.join(transports)}")
+        sys.exit(os.EX_CONFIG)
+
+    the_transport = transports[kind](**kwargs)
+    logger.info(f"transport is {kind}")
+    return the_transport
+
+
+def host_info(host:str) -> Union[dict, None]:
+    return the_transport.host_info(host)
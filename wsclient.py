@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Send statements to wsdaemon, and show what comes back. This imports
+nothing of wscontrol's, so that it starts as quickly as Python does.
+
+    python wsclient.py -c 'on ws.parish do "uptime"'
+    python wsclient.py < nightly.ws
+
+The exit code is the one the statements would have had if they had
+been run by wscontrol itself.
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import json
+import socket
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def default_socket() -> str:
+    """
+    Where wsdaemon listens if the config file does not say.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'wscontrol', 'daemon.sock')
+
+
+def wsclient_main(myargs:argparse.Namespace) -> int:
+    command = myargs.command or sys.stdin.read()
+    if not command.strip(): return os.EX_OK
+
+    try:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(myargs.socket)
+    except OSError as e:
+        print(f"wsdaemon is not answering on {myargs.socket}. {e}", file=sys.stderr)
+        return os.EX_UNAVAILABLE
+
+    with s, s.makefile('rw') as daemon:
+        daemon.write(json.dumps({'command': command, 'cwd': os.getcwd()}) + '\n')
+        daemon.flush()
+        for line in daemon:
+            message = json.loads(line)
+            if 'out' in message:
+                sys.stdout.write(message['out'])
+                sys.stdout.flush()
+            if 'exit' in message:
+                return message['exit']
+
+    print("wsdaemon hung up without saying how it went.", file=sys.stderr)
+    return os.EX_PROTOCOL
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="wsclient",
+        description="What wsclient does, wsclient does best.")
+
+    parser.add_argument('-c', '--command', type=str, default="",
+        help="Statements to run (separated by semicolons), instead of reading them from stdin.")
+    parser.add_argument('--socket', type=str,
+        default=os.environ.get('WSCONTROL_SOCKET') or default_socket(),
+        help="Where wsdaemon is listening; defaults to $WSCONTROL_SOCKET, or ~/.cache/wscontrol/daemon.sock")
+
+    myargs = parser.parse_args()
+
+    try:
+        sys.exit(wsclient_main(myargs))
+
+    except KeyboardInterrupt:
+        sys.exit(os.EX_TEMPFAIL)
@@ -1,8 +1,26 @@
 # -*- coding: utf-8 -*-
+"""
+The configuration service. wscontrol.toml is read once, and what is
+in it is kept in an index from dotted names to values:
+
+    executor.max_in_flight -> 8
+    transport.simulated    -> the whole table
+    ws.parish              -> ('adam', 'alexis', ...)
+
+Lists of names are groups, and a group may name other groups; in the
+index they are expanded all the way down, with each name once. Looking
+anything up is then one dict lookup.
+
+When the file changes (a different inode, mtime, or size, checked at
+most once a CHECK_INTERVAL), it is read again, and a new index is
+built beside the old one and swapped in with one assignment, so that
+nothing ever sees half of one. If the new file is broken, the old
+index is kept.
+"""
 import typing
 from   typing import *
 
-min_py = (3, 9)
+min_py = (3, 11)
 
 ###
 # Standard imports, starting with os and sys
@@ -16,7 +34,9 @@ if sys.version_info < min_py:
 ###
 # Other standard distro imports
 ###
+import argparse
 import logging
+import threading
 import tomllib
 import time
 
@@ -42,6 +62,11 @@ from   urlogger import URLogger
 ###
 verbose = False
 
+###
+# Seconds between looks at the file to see if it has changed.
+###
+CHECK_INTERVAL = 1.0
+
 ###
 # Credits
 ###
@@ -56,40 +81,233 @@ __license__ = 'MIT'
 
 logger = logging.getLogger('URLogger')
 
+
+def stamp_of(filename:str) -> tuple:
+    """
+    Enough to tell that the file has been replaced or written.
+    """
+    s = os.stat(filename)
+    return s.st_dev, s.st_ino, s.st_mtime_ns, s.st_size
+
+
+def flatten(tree:dict, prefix:str="") -> dict:
+    """
+    Every key in the tree, tables included, by its dotted name.
+    """
+    index = {}
+    for k, v in tree.items():
+        name = f"{prefix}{k}"
+        if isinstance(v, dict):
+            index[name] = SloppyTree(v)
+            index.update(flatten(v, f"{name}."))
+        else:
+            index[name] = v
+    return index
+
+
+def expand(index:dict, name:str, seen:tuple=()) -> tuple:
+    """
+    The members of the group called name, with any members that are
+    themselves groups replaced by their members, each name once, in
+    the order they first appear.
+    """
+    if name in seen:
+        logger.error(f"{' -> '.join((*seen, name))} goes around in a circle.")
+        return ()
+
+    members = {}
+    for member in index[name]:
+        if is_group(index.get(member)):
+            members.update(dict.fromkeys(expand(index, member, (*seen, name))))
+        else:
+            members[member] = None
+    return tuple(members)
+
+
+def is_group(value:object) -> bool:
+    return isinstance(value, (list, tuple)) and all(isinstance(_, str) for _ in value)
+
+
+class ConfigIndex:
+    """
+    One reading of the file, and everything that was worked out from
+    it. Once built, it is never changed.
+    """
+    __slots__ = {
+        'filename': 'where it came from',
+        'stamp': 'stamp_of(filename) when it was read',
+        'tree': 'the file, as a SloppyTree',
+        'index': 'dotted name -> value, with the groups expanded',
+        'version': 'one more than the version of the index it replaced'
+        }
+
+    def __init__(self, filename:str, overrides:dict, version:int) -> None:
+        self.filename = filename
+        self.stamp = stamp_of(filename)
+        with open(filename, 'rb') as f:
+            self.tree = SloppyTree(tomllib.load(f))
+        if stamp_of(filename) != self.stamp:
+            raise OSError(f"{filename} changed while it was being read.")
+
+        index = flatten(self.tree)
+        index.update(overrides)
+        for name, value in index.items():
+            if is_group(value): index[name] = expand(index, name)
+        self.index = index
+        self.version = version
+
+
 class WSConfig:
-    _config = None
-    object_created = None
+    """
+    There is only one of these. The first call names the file; after
+    that, WSConfig() gives back the same object, whose lookup() reads
+    the file again if it has changed.
+    """
+    __slots__ = {
+        'current': 'the ConfigIndex that lookups use',
+        'overrides': 'dotted name -> value, set by the program rather than the file',
+        'checked': 'time.monotonic() when we last looked at the file',
+        'broken': 'the stamp of the file the last time it could not be read',
+        'lock': 'so that only one thread at a time builds a new index'
+        }
+
+    _instance = None
 
     @trap
-    def __new__(cls, *args, **kwargs):
-        config_file_modified = os.path.getmtime(f"{args[0]}")
+    def __new__(cls, filename:str=None):
+        self = cls._instance
+        if self is not None and (filename is None or
+            os.path.abspath(filename) == self.current.filename):
+            return self
 
-        # if config file did not change, return previously created object        
-        if cls._config and not (config_file_modified > object_created): 
-            return cls._config
+        if filename is None:
+            logger.error("No configuration file has been named.")
+            sys.exit(os.EX_CONFIG)
 
-        if not os.path.exists(args[0]):
-            logger.error(f"{args[0]} not found.")
+        if not os.path.exists(filename):
+            logger.error(f"{filename} not found.")
             sys.exit(os.EX_IOERR)
 
-        try:
-            object_created = time.time()
-            
-            # if the configuration file was modified, update the contents of the object.
-            if config_file_modified > object_created:
-                cls._config = SloppyTree(tomllib.load(open(myargs.config, 'rb')))
-                logger.info(f"{myargs.config} read.")
+        ###
+        # Another file may be named later. Its index goes on from the
+        # version of the one it replaces, so that anything kept by
+        # version (the resolver's expansions) is not mistaken for it.
+        ###
+        version = 1 if self is None else self.current.version + 1
+        if self is None:
+            self = super().__new__(cls)
+            self.overrides = {}
+            self.broken = None
+            self.lock = threading.Lock()
 
+        try:
+            self.current = ConfigIndex(os.path.abspath(filename), self.overrides, version)
         except tomllib.TOMLDecodeError as e:
             logger.error(e)
             sys.exit(os.EX_CONFIG)
 
-class MyArgs:
-    config = "/home/alina/wscontrol/wscontrol.toml"
+        self.checked = time.monotonic()
+        logger.info(f"{filename} read.")
+        cls._instance = self
+        return self
+
+
+    def refresh(self) -> ConfigIndex:
+        """
+        The index, rebuilt first if the file has changed.
+        """
+        current = self.current
+        now = time.monotonic()
+        if now - self.checked < CHECK_INTERVAL: return current
+        self.checked = now
+
+        try:
+            stamp = stamp_of(current.filename)
+        except OSError as e:
+            logger.warning(f"{current.filename} cannot be read; keeping what we have. {e}")
+            return current
+
+        if stamp in (current.stamp, self.broken): return current
+        return self.rebuild(stamp)
+
+
+    def rebuild(self, stamp:tuple=None) -> ConfigIndex:
+        """
+        Read the file again. stamp is what it looked like when we
+        decided to; if another thread has read it since, once is enough.
+        """
+        with self.lock:
+            current = self.current
+            if stamp is not None and stamp == current.stamp: return current
+            try:
+                new = ConfigIndex(current.filename, self.overrides, current.version + 1)
+            except OSError as e:
+                logger.warning(f"{current.filename} cannot be read; keeping what we have. {e}")
+                return current
+            except tomllib.TOMLDecodeError as e:
+                logger.error(f"{current.filename} has a problem; keeping what we have. {e}")
+                self.broken = stamp
+                return current
+
+            self.current = new
+            logger.info(f"{current.filename} read again, version {new.version}.")
+            return new
+
+
+    def lookup(self, name:str, not_found:object=None) -> object:
+        """
+        The value with this dotted name, or not_found.
+        """
+        value = self.refresh().index.get(name)
+        return not_found if value is None else value
+
+
+    def override(self, name:str, value:object) -> None:
+        """
+        Set something as if the file had said so, and keep it set
+        when the file is read again.
+        """
+        self.overrides[name] = value
+        self.rebuild()
+
+
+    @property
+    def tree(self) -> SloppyTree:
+        return self.refresh().tree
+
+
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever what lookup() says might have changed, so
+        that anything worked out from the config can be kept until
+        then.
+        """
+        return self.refresh().version
+
+
+@trap
+def wsconfig_main(myargs:argparse.Namespace) -> int:
+    config = WSConfig(myargs.config)
+    for name in myargs.name or sorted(config.current.index):
+        print(f"{name} = {config.lookup(name)}")
+    return os.EX_OK
+
 
 if __name__ == "__main__":
-    myargs = MyArgs()
-    
-    # Instantiate WSConfig to load the configuration
-    config_instance = WSConfig(myargs.config)
-    print(config_instance)
+
+    parser = argparse.ArgumentParser(prog="wsconfig",
+        description="What wsconfig does, wsconfig does best.")
+
+    parser.add_argument('--config', type=str, default="wscontrol.toml",
+        help="The config file, defaults to wscontrol.toml")
+    parser.add_argument('name', nargs='*',
+        help="Dotted names to look up; everything, if there are none.")
+
+    myargs = parser.parse_args()
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
@@ -17,14 +17,15 @@ if sys.version_info < min_py:
 # Other standard distro imports
 ###
 import argparse
+import atexit
 import cmd
 import contextlib
 import getpass
 mynetid = getpass.getuser()
-import inspect
 import logging
 from   pprint import pprint
 import socket
+import sqlite3
 this_host = socket.gethostname()
 
 ###
@@ -35,7 +36,6 @@ this_host = socket.gethostname()
 ###
 # From hpclib
 ###
-import netutils
 import parsec4
 from   sloppytree import SloppyTree
 import sqlitedb
@@ -43,11 +43,19 @@ from   urdecorators import trap
 from   urlogger import URLogger
 
 ###
-# imports and objects that are a part of this project
+# imports and objects that are a part of this project. history, jobs,
+# optimizer, scheduler, and scriptcache are imported by the commands
+# that use them, so that the console is up before they are wanted.
 ###
+import auditlog
+import connpool
+import executor
+import ir
+import sshindex
+import transport
 from fsm import fsm
-from resolver import resolver
-from wscontrolparser import wslanguage, make_tree
+from resolver import resolver, resolve_config
+import wsfastparser
 from wsconfig import WSConfig
 
 ###
@@ -80,8 +88,65 @@ class WSConsole(cmd.Cmd):
         cmd.Cmd.__init__(self)
         self.myargs = myargs
         self.most_recent_cmd = ""
+        self.history_page = None
+        self.who = mynetid
+
+        ###
+        # Building the parsec grammar takes longer than anything else
+        # we do at startup, so it is only imported when it is wanted.
+        ###
+        if getattr(myargs, 'parser', 'fast') == 'parsec':
+            import wscontrolparser
+            self.parser = wscontrolparser
+        else:
+            self.parser = wsfastparser
         self.prompt = "\n [WSControl]: "
 
+        ###
+        # The ssh master connections live as long as the console
+        # does, and they are closed however the console ends.
+        ###
+        self.pool = connpool.open_pool(
+            resolve_config('connection.control_dir', None),
+            resolve_config('connection.persist', 300))
+        atexit.register(connpool.close_pool)
+
+
+    def postcmd(self, stop:bool, line:str) -> bool:
+        """
+        Between commands, close the master connections that have
+        gone idle, and say which background jobs have finished.
+        """
+        self.pool.reap()
+        if 'jobs' not in sys.modules: return stop
+
+        import jobs
+        for job in jobs.newly_over():
+            print(job.summary())
+        return stop
+
+
+    def postloop(self) -> None:
+        self.end_jobs()
+        connpool.close_pool()
+
+
+    def end_jobs(self) -> None:
+        """
+        The background jobs do not outlive the console; the hosts
+        they have started are allowed to finish, and no others are
+        started. If jobs has not been imported, there are none.
+        """
+        if 'jobs' not in sys.modules: return
+
+        import jobs
+        if not (running := jobs.running()): return
+        print(f"Cancelling {len(running)} background job(s).")
+        for job in running:
+            jobs.cancel(job)
+        for job in running:
+            job.thread.join()
+
 
     @trap
     def construct_error_message(self, e:parsec4.ParseError) -> str:
@@ -101,6 +166,59 @@ class WSConsole(cmd.Cmd):
         return "\n".join([e.text, " "*e.index + "^", "Expected: "+e.expected])
         
 
+    @trap
+    def do_cancel(self, args:str="") -> None:
+        """
+        Syntax: cancel [{job}]
+
+        Start no more hosts for a background job; the ones it has
+        already started are allowed to finish. The most recent job
+        is the default.
+        """
+        import jobs
+        if (job := jobs.find(args)) is None:
+            print(f"There is no job {args}." if args.strip() else "There are no jobs.")
+            return
+        if job.over:
+            print(f"Job {job.id} is already over.")
+            return
+        jobs.cancel(job)
+        print(f"[{job.id}] cancelling; the hosts already started will finish.")
+
+
+    @trap
+    def do_fg(self, args:str="") -> None:
+        """
+        Syntax: fg [{job}]
+
+        Show what a background job has printed, and go on showing it
+        until the job is over. Control C stops the showing, but not
+        the job. The most recent job is the default.
+        """
+        import jobs
+        if (job := jobs.find(args)) is None:
+            print(f"There is no job {args}." if args.strip() else "There are no jobs.")
+            return
+
+        seen = 0
+        try:
+            while True:
+                with job.changed:
+                    lines, now = job.since(seen)
+                    if now == seen and not job.over: job.changed.wait(1)
+                if (dropped := now - seen - len(lines)) > 0:
+                    print(f"[{job.id}] ... {dropped} lines not kept ...")
+                for line in lines: print(line)
+                seen = now
+                if job.over and not job.since(seen)[0]: break
+        except KeyboardInterrupt:
+            print(f"\n[{job.id}] still running in the background.")
+            return
+
+        print(job.summary())
+        jobs.forget(job)
+
+
     @trap
     def do_general(self, args:str='') -> None:
         """
@@ -131,6 +249,126 @@ class WSConsole(cmd.Cmd):
         print(text)
 
 
+    @trap
+    def do_history(self, args:str="") -> None:
+        """
+        Syntax: history [host=H] [who=U] [since=T] [until=T] 
+                    [result=N|failed] [cmd=TEXT] [limit=N]
+                history more
+
+        Show the commands that have been run, newest first. Times 
+        are written 'YYYY-MM-DD HH:MM:SS' (quoted, because of the 
+        space), and a date by itself means midnight. Anything that
+        is not a filter is taken to be part of the command text.
+        'history more' shows the next page of the previous query.
+
+        Examples:
+
+            history host=adam result=failed
+            history since="2024-01-01" cmd="dnf -y update" limit=100
+        """
+        import history
+        if args.strip() == 'more':
+            if self.history_page is None:
+                print("There is no previous history query.")
+                return
+            filters = self.history_page
+        else:
+            try:
+                filters = history.parse_filters(args)
+            except ValueError as e:
+                print(e)
+                return
+
+        auditlog.flush()
+        try:
+            db = history.connect(self.myargs.db)
+            rows = history.query(db, **filters)
+            db.close()
+        except sqlite3.Error as e:
+            print(f"Unable to read the history in {self.myargs.db}. {e}")
+            return
+
+        history.show(rows)
+        if len(rows) < filters.get('limit', 25):
+            self.history_page = None
+            return
+        self.history_page = {**filters, 'below': rows[-1][0]}
+        print("\nType 'history more' for the next page.")
+
+
+    @trap
+    def do_jobs(self, args:str="") -> None:
+        """
+        Syntax: jobs
+
+        List the background jobs: how long they have been running,
+        and how many of their hosts are in each state.
+        """
+        import jobs
+        if not jobs.the_jobs:
+            print("There are no jobs.")
+            return
+        for job in list(jobs.the_jobs.values()):
+            print(job.summary())
+
+
+    @trap
+    def do_redo(self, args:str="") -> None:
+        """
+        Syntax: redo failed [last|{invocation}]
+
+        Run a statement again, but only on the hosts where it failed.
+        The invocation number is printed after each statement runs,
+        and it appears in the history. 'last' (the default) is your 
+        most recent statement that failed anywhere.
+        """
+        import history
+        import optimizer
+        words = args.split()
+        if not words or words[0] != 'failed' or len(words) > 2: 
+            return self.do_help('redo')
+        which = words[1] if len(words) > 1 else 'last'
+
+        auditlog.flush()
+        try:
+            db = history.connect(self.myargs.db)
+            invocation = history.last_invocation(db, self.who) if which == 'last' else int(which)
+            statement = history.statement_of(db, invocation) if invocation else None
+            hosts = history.failed_hosts(db, invocation) if statement else ()
+            db.close()
+        except ValueError:
+            print(f"{which} is not an invocation number.")
+            return
+        except sqlite3.Error as e:
+            print(f"Unable to read the history in {self.myargs.db}. {e}")
+            return
+
+        if not statement:
+            print(f"There is no invocation {which}.")
+            return
+        if not hosts:
+            print(f"Nothing failed in invocation {invocation}.")
+            return
+
+        print(f"Redoing invocation {invocation} on {', '.join(hosts)}:\n  {statement}")
+        try:
+            ###
+            # The optimizer may have made one invocation of several
+            # statements, separated by semicolons.
+            ###
+            groups = self.parser.wsscript.parse(statement.strip().rstrip(';'))
+        except parsec4.ParseError as e:
+            print(f"Invocation {invocation} no longer parses. {e}")
+            return
+
+        from wscontrolparser import retarget
+        statements = [ (0, statement, resolver(ir.build(retarget(tokens, hosts)))) 
+            for group in groups for tokens in group ]
+        for lineno, source, program in optimizer.optimize(statements):
+            if program is None or self.run(program, statement): return
+
+
     @trap
     def do_samples(self, args:str="") -> None:
         """
@@ -139,6 +377,29 @@ class WSConsole(cmd.Cmd):
         return
 
 
+    @trap
+    def do_wait(self, args:str="") -> None:
+        """
+        Syntax: wait [{job}]
+
+        Wait for a background job to be over, or for all of them if
+        none is named. Control C stops the waiting, but not the jobs.
+        Use fg to see what they printed.
+        """
+        import jobs
+        if args.strip() and jobs.find(args) is None:
+            print(f"There is no job {args}.")
+            return
+
+        try:
+            for job in [jobs.find(args)] if args.strip() else list(jobs.the_jobs.values()):
+                job.thread.join()
+                job.reported = True
+                print(job.summary())
+        except KeyboardInterrupt:
+            print("\nThe jobs are still running in the background.")
+
+
     @trap
     def do_whatis(self, args:str="") -> None:
         """
@@ -149,20 +410,11 @@ class WSConsole(cmd.Cmd):
         """ 
         if not args: return self.do_help('whatis')
 
-        arg_list = args.split('.')
-        t = WSConfig()
-        for arg in arg_list:
-            try:
-                t = t[arg]
-            except KeyError as e:
-                print(f"{args} not found in config file.")
-                return
-
-        if t: 
+        if (t := WSConfig().lookup(args)) is not None:
             print(f"{args} is {t}")
             return
 
-        if (d:=netutils.get_ssh_host_info(args)):
+        if (d:=sshindex.host_info(args)):
             print(f"{args} is a host, with this connection information:\n\n{d}")
             return
 
@@ -180,25 +432,322 @@ class WSConsole(cmd.Cmd):
             print(args)
 
         if args.lower() in ("stop", "quit", "exit"):
+            self.end_jobs()
             sys.exit(os.EX_OK)
 
         if args.startswith('!'):
             os.system(args[1:])
             return
 
+        ###
+        # A statement that ends with & is run in the background, but
+        # only at the keyboard; a script would have to wait for it
+        # anyway.
+        ###
+        background = args.rstrip().endswith('&')
+        if background: args = args.rstrip()[:-1].rstrip()
+
         try:
             self.most_recent_cmd = args
-            tokens = wslanguage.parse(args)
+            tokens = self.parser.wslanguage.parse(args)
         except KeyboardInterrupt as e:
             print("You pressed control C. Exiting.")
+            self.end_jobs()
             sys.exit(os.EX_OK)
 
         except parsec4.ParseError as e:
             print("There is an error somewhere in your request.") 
             print(self.construct_error_message(e))  
             return
+
+        if background and os.isatty(0):
+            ###
+            # Resolve it here, so that a name that means nothing is
+            # reported now rather than later.
+            ###
+            if (program := resolver(ir.build(tokens))) is None: return
+            import jobs
+            import optimizer
+            program = optimizer.dedupe(program)
+            job = jobs.start(args, lambda: self.run(program, args),
+                resolve_config('jobs.max_lines', 1000))
+            print(f"[{job.id}] {job.source}")
+            return
         
-        resolved_command = resolver(make_tree(tokens))
+        if (code := self.execute(tokens, args)) and not os.isatty(0):
+            ###
+            # When we are reading a script, on_error fail means
+            # that the script stops here.
+            ###
+            sys.exit(code)
+
+
+    @trap
+    def execute(self, tokens:tuple, source:str) -> int:
+        """
+        Resolve the parsed statement, and carry it out.
+
+        returns -- os.EX_OK, or the exit code of the failure that
+            stopped the statement.
+        """
+        import optimizer
+        if (program := resolver(ir.build(tokens))) is None: return os.EX_CONFIG
+        return self.run(optimizer.dedupe(program), source)
+
+
+    @trap
+    def run(self, resolved_command:ir.Node, source:str) -> int:
+        """
+        Carry out a statement that has already been resolved.
+        """
         logger.debug(f"{resolved_command=}")
-        pprint(f"{resolved_command=}")
-        # fsm(resolved_command, not self.myargs.no_exec)
+        if getattr(self.myargs, 'explain', False):
+            import optimizer
+            print(optimizer.explain(resolved_command))
+            return os.EX_OK
+        if self.myargs.no_exec: pprint(f"{resolved_command=}")
+        return fsm(resolved_command, not self.myargs.no_exec, source, self.who)
+
+
+    def is_statement(self, line:str) -> bool:
+        """
+        Is the line something for the parser, rather than one of the 
+        console's own commands, a shell escape, or a way out?
+        """
+        word = line.split(maxsplit=1)[0] if line.split() else ""
+        return not ( line.startswith('!') or 
+            line.lower() in ("stop", "quit", "exit") or
+            hasattr(self, f"do_{word}") )
+
+
+    @trap
+    def compile(self, text:str) -> tuple:
+        """
+        Parse and resolve each statement in a script. Lines that are
+        not statements, or that do not parse, are kept as they are,
+        to be handled by the console when their turn comes.
+
+        returns -- the optimized list of (line number, source, resolved
+            program or None), and a list of the local files that were read.
+        """
+        import optimizer
+        import scriptcache
+        statements = []
+        files = []
+        for lineno, line in enumerate(text.splitlines(), start=1):
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            if not self.is_statement(line):
+                statements.append((lineno, line, None))
+                continue
+
+            ###
+            # wslanguage only sees the first of several statements
+            # joined by semicolons, so they are found first.
+            ###
+            found, mistakes = wsfastparser.statements(line)
+            if len(found) > 1 and not mistakes:
+                files.extend(f for *_, tokens in found for f in scriptcache.local_files(tokens))
+                group = [ (lineno, line[start:end].strip(), resolver(ir.build(tokens)))
+                    for _, start, end, tokens in found ]
+                resolved = all(_[2] is not None for _ in group)
+                statements.extend(self.sequence_of(group) if resolved else group)
+                continue
+
+            try:
+                tokens = self.parser.wslanguage.parse(line)
+            except parsec4.ParseError:
+                statements.append((lineno, line, None))
+                continue
+
+            files.extend(scriptcache.local_files(tokens))
+            statements.append((lineno, line, resolver(ir.build(tokens))))
+
+        return optimizer.optimize(statements), files
+
+
+    @trap
+    def run_script(self, text:str, statements_only:bool=False) -> int:
+        """
+        Run a whole script, compiling it first unless it has been run
+        before, just as it is, with the same configuration.
+
+        statements_only -- refuse the script, and run none of it, if
+            any line is something other than a statement: a shell
+            escape, one of the console's commands, or a line that
+            does not parse or resolve. wsdaemon runs scripts for other
+            people, and must not give them the console.
+
+        returns -- os.EX_OK, or the exit code of the failure that
+            stopped the script.
+        """
+        import scriptcache
+        key = scriptcache.key_of(text, self.myargs.config, 
+            getattr(self.myargs, 'parser', 'fast'), transport.current().name,
+            sshindex.stamp())
+        script = ( scriptcache.CompiledScript(key, *self.compile(text))
+            if getattr(self.myargs, 'no_cache', False) else
+            scriptcache.compiled(text, self.compile, key) )
+
+        if statements_only and (refused := [ _ for _ in script.statements if _[2] is None ]):
+            for lineno, source, _ in refused:
+                print(f"{lineno}: {source}\n    is not a statement that can be run here.")
+            return os.EX_NOPERM
+
+        return self.run_compiled(script)
+
+
+    @trap
+    def compile_file(self, text:str, filename:str) -> tuple:
+        """
+        Parse the whole of a script file as the language, and resolve
+        every statement in it. Unlike compile(), nothing is left for
+        the console: everything in the file has to be a statement,
+        and every one that is not, or that cannot be resolved, is
+        reported.
+
+        returns -- the optimized list of (line number, source, resolved
+            program), the local files that were read, and the error 
+            messages.
+        """
+        import optimizer
+        import scriptcache
+        text = wsfastparser.uncomment(text)
+        found, mistakes = wsfastparser.statements(text)
+        errors = []
+        lines = text.split('\n')
+        for index, expected in mistakes:
+            lineno, column = wsfastparser.where(text, index)
+            line = lines[lineno-1]
+            errors.append("\n".join([f"{filename}:{lineno}:{column}: expected {expected}",
+                f"    {line}", "    " + " "*(column-1) + "^"]))
+
+        ###
+        # The parsec grammar is the definition of the language, so if
+        # it was asked for, it has the last word on the whole file.
+        ###
+        if not mistakes and self.parser is not wsfastparser:
+            try:
+                if self.parser.wsscript.parse(text) != wsfastparser.grouped(found):
+                    errors.append(f"{filename}: the parsers do not agree about this script.")
+            except parsec4.ParseError as e:
+                lineno, column = wsfastparser.where(text, e.index)
+                errors.append(f"{filename}:{lineno}:{column}: expected {e.expected}")
+
+        groups = {}
+        files = []
+        for group, start, end, tokens in found:
+            source = text[start:end].strip()
+            lineno = wsfastparser.where(text, start)[0]
+            files.extend(scriptcache.local_files(tokens))
+            if (program := resolver(ir.build(tokens))) is None:
+                ###
+                # The resolver has already said what it could not find.
+                ###
+                errors.append(f"{filename}:{lineno}: unable to resolve {source}")
+            else:
+                groups.setdefault(group, []).append((lineno, source, program))
+
+        ###
+        # Statements joined by semicolons are done in order, as one
+        # step of the script.
+        ###
+        statements = []
+        for group in groups.values():
+            statements.extend(self.sequence_of(group))
+
+        return optimizer.optimize(statements), files, errors
+
+
+    def sequence_of(self, group:list) -> list:
+        """
+        Statements joined by semicolons, optimized, and made into one
+        ir.Sequence if more than one of them is left.
+        """
+        import optimizer
+        group = optimizer.optimize(group)
+        if len(group) > 1:
+            group = [(group[0][0], "; ".join(_[1] for _ in group),
+                ir.Sequence(tuple((_[1], _[2]) for _ in group)))]
+        return group
+
+
+    @trap
+    def run_file(self, filename:str) -> int:
+        """
+        Run a script file, but only if all of it is correct. Nothing
+        is sent to any host until every statement has been parsed and
+        resolved.
+
+        returns -- os.EX_OK, or the exit code of the failure that
+            stopped the script.
+        """
+        import scriptcache
+        try:
+            with open(filename) as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Unable to read {filename}. {e}")
+            return os.EX_NOINPUT
+
+        no_cache = getattr(self.myargs, 'no_cache', False)
+        key = scriptcache.key_of(text, self.myargs.config, 'script',
+            getattr(self.myargs, 'parser', 'fast'), transport.current().name,
+            sshindex.stamp())
+        if no_cache or (script := scriptcache.load(key)) is None:
+            statements, files, errors = self.compile_file(text, filename)
+            if errors:
+                print("\n".join(errors))
+                print(f"{len(errors)} error(s) in {filename}. Nothing has been done.")
+                return os.EX_DATAERR
+
+            script = scriptcache.CompiledScript(key, statements, scriptcache.depends_on(files))
+            if not no_cache: scriptcache.save(script)
+
+        return self.run_compiled(script)
+
+
+    @trap
+    def run_compiled(self, script:'scriptcache.CompiledScript') -> int:
+        """
+        Carry out the statements of a compiled script, each as soon as
+        the scheduler says that it may go. While they are running, the
+        limit on hosts in flight is for all of them together.
+
+        returns -- os.EX_OK, or the exit code of the failure that
+            stopped the script.
+        """
+        import optimizer
+        import scheduler
+        if getattr(self.myargs, 'explain', False):
+            steps = scheduler.plan(script.statements)
+            for step in steps:
+                print(f"{step.lineno}: {step.source}\n    ({scheduler.describe(step, steps)})")
+                print(optimizer.explain(step.program))
+            print(f"The longest chain is {max((_.depth for _ in steps), default=0)} "
+                f"of {len(steps)} steps.")
+            return os.EX_OK
+
+        executor.limit_in_flight(resolve_config('executor.max_in_flight', 8))
+        try:
+            return scheduler.run(script.statements, self.run_step,
+                resolve_config('scheduler.max_statements', 4))
+        finally:
+            executor.limit_in_flight(0)
+            self.postcmd(False, "")
+
+
+    def run_step(self, lineno:int, source:str, program:ir.Node) -> int:
+        """
+        One statement of a script. The scheduler calls this in its
+        own thread for statements that go to the hosts; the console's
+        own commands are barriers, and run in ours.
+        """
+        if program is None:
+            self.onecmd(source)
+            self.postcmd(False, source)
+            return os.EX_OK
+
+        print(source)
+        self.most_recent_cmd = source
+        return self.run(program, source)
@@ -17,6 +17,8 @@ import sys
 if sys.version_info < min_py:
     print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
     sys.exit(os.EX_SOFTWARE)
+import time
+started = time.perf_counter()
 
 ###
 # Other standard distro imports
@@ -36,7 +38,6 @@ import tomllib
 ###
 # From hpclib
 ###
-import linuxutils
 from   sloppytree import SloppyTree
 import sqlitedb
 from   sqlitedb import SQLiteDB
@@ -46,7 +47,11 @@ from   urlogger import URLogger, piddly
 ###
 # imports and objects that are a part of this project
 ###
-import logo
+import auditlog
+import hosthealth
+import resolver
+import timeouts
+import transport
 from wsconsole import WSConsole
 from wsconfig import WSConfig
 
@@ -56,6 +61,11 @@ from wsconfig import WSConfig
 logger=None
 mynetid = getpass.getuser()
 
+###
+# (what, time.perf_counter() when it was done), for --startup.
+###
+laps = []
+
 ###
 # Credits
 ###
@@ -69,10 +79,30 @@ __status__ = 'in progress'
 __license__ = 'MIT'
 
 
+def lap(what:str) -> None:
+    laps.append((what, time.perf_counter()))
+
+
+def startup_report() -> str:
+    """
+    How long each part of getting started took. python -X importtime
+    breaks the imports down further.
+    """
+    parts = []
+    then = started
+    for what, now in laps:
+        parts.append(f"{what} {1000*(now-then):.1f}ms")
+        then = now
+    return f"startup: {', '.join(parts)}; total {1000*(then-started):.1f}ms"
+
+
 @trap
-def wscontrol_main(myargs:argparse.Namespace) -> int:
-    global logger
-    logger.info("start")
+def start(myargs:argparse.Namespace) -> WSConsole:
+    """
+    Everything there is to do before the first statement can be run,
+    for us and for wsdaemon.
+    """
+    logger = logging.getLogger('URLogger')
 
     ###
     # Step 1: get the database open.
@@ -83,17 +113,79 @@ def wscontrol_main(myargs:argparse.Namespace) -> int:
         sys.exit(os.EX_CONFIG)
     logger.info(f"{myargs.db} is open.")
 
+    ###
+    # The master table is written by its own thread, and 
+    # the rows are flushed on the way out.
+    ###
+    auditlog.open_writer(myargs.db)
+    lap('database')
+
     ###
     # Step 2: read the configuration.
     ###
     config = WSConfig(myargs.config)
-    
+    lap('config')
+
+    ###
+    # Step 3: say where to find the workstations we already know to
+    # be down, and how long things have taken before, so that the
+    # timeouts are sensible. Neither is read, and the prober is not
+    # started, until the first connection.
+    ###
+    hosthealth.open_health(myargs.db,
+        resolver.resolve_config('health.threshold', 2),
+        resolver.resolve_config('health.ttl', 600),
+        resolver.resolve_config('health.probe_interval', 30))
+    timeouts.open_latency(myargs.db)
+    lap('health')
+
+    ###
+    # Step 4: decide how we will reach the workstations.
     ###
-    # Step 3: create the interactive console, and begin to read
-    # the input.
+    kind = myargs.transport or resolver.resolve_config('transport.kind', 'ssh')
+    settings = dict(resolver.resolve_config(f"transport.{kind}", {}))
+    if kind == 'ssh': settings['connect_timeout'] = timeouts.connect_timeout
+    transport.open_transport(kind, **settings)
+    lap('transport')
+
+    ###
+    # Step 5: create the console.
+    ###
+    console=WSConsole(myargs)
+    lap('console')
+    return console
+
+
+@trap
+def wscontrol_main(myargs:argparse.Namespace) -> int:
+    logger.info("start")
+
+    console = start(myargs)
+    if myargs.startup: print(startup_report(), file=sys.stderr)
+
+    ###
+    # A script on stdin is compiled, or found already compiled, and
+    # run all at once, rather than fed to the console a line at a time.
+    # So is a one-liner from -c.
+    ###
+    if myargs.command:
+        return console.run_script(myargs.command)
+
+    if myargs.script:
+        return console.run_file(myargs.script)
+
+    if not os.isatty(0):
+        return console.run_script(sys.stdin.read())
+
+    ###
+    # Only a person at a terminal needs the screen cleared and the
+    # logo, or the commit we are running.
+    ###
+    import linuxutils
+    import logo
+
     os.system('clear')
     print(logo.LOGO)
-    console=WSConsole(myargs)
     try:
         commit=linuxutils.version(False)
         d = str(datetime.fromtimestamp(os.stat(__file__).st_mtime))[:19]
@@ -113,6 +205,7 @@ def wscontrol_main(myargs:argparse.Namespace) -> int:
 
 if __name__ == '__main__':
 
+    lap('imports')
     here       = os.getcwd()
     progname   = os.path.basename(__file__)[:-3]
     configfile = f"{here}/{progname}.toml"
@@ -128,14 +221,36 @@ if __name__ == '__main__':
     parser.add_argument('--config', type=str, default=configfile,
         help=f"Input config file name, defaults to {configfile}")
 
+    parser.add_argument('-c', '--command', type=str, default="",
+        help="Statements to run (separated by semicolons), instead of reading them from stdin.")
+
+    parser.add_argument('--explain', action='store_true',
+        help="Show the plan for each statement, after it has been optimized, instead of running it.")
+
     parser.add_argument('--loglevel', type=int,
         choices=range(logging.FATAL, logging.NOTSET, -10), 
         default=logging.DEBUG, 
         help=f"Logging level, defaults to {logging.DEBUG}")
 
+    parser.add_argument('--no-cache', action='store_true',
+        help="Compile a script even if it has been compiled before.")
+
     parser.add_argument('--no-exec', action='store_true', 
         help="For testing; this generates all the opcodes, but does not execute the command.")
 
+    parser.add_argument('--parser', type=str, default="fast", choices=("fast", "parsec"),
+        help="fast (the default), or parsec, the reference grammar in wscontrolparser.py.")
+
+    parser.add_argument('--script', type=str, default="",
+        help="A file of statements to check completely, and then run.")
+
+    parser.add_argument('--startup', action='store_true',
+        help="Show how long each part of starting up took, on stderr.")
+
+    parser.add_argument('--transport', type=str, default="",
+        choices=("", *transport.transports),
+        help="How to reach the workstations: ssh, local, or simulated. Defaults to transport.kind in the config file.")
+
     parser.add_argument('-o', '--output', type=str, default="",
         help="Output file name (for non-interactive use.)")
 
@@ -150,6 +265,7 @@ if __name__ == '__main__':
             pass
 
     logger = URLogger(logfile=logfile, level=myargs.loglevel)
+    lap('arguments')
 
     try:
         outfile = sys.stdout if not myargs.output else open(myargs.output, 'w')
@@ -1,17 +1,53 @@
+###
+# Where wscontrol is installed. When this file is sourced, it is the
+# directory the file is in. Otherwise it is whatever we found the last
+# time, kept in ~/.cache/wscontrol/home, so that $HOME is searched
+# (which takes seconds on NFS) only the first time.
+###
+_wscontrol_cache="${XDG_CACHE_HOME:-$HOME/.cache}/wscontrol/home"
+
+if [ -f "$(dirname "${BASH_SOURCE[0]}")/wscontrol.py" ]; then
+    export WSCONTROL_HOME=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)
+fi
+
+function _wscontrol_home
+{
+    [ -f "$WSCONTROL_HOME/wscontrol.py" ] && return
+
+    WSCONTROL_HOME=$(cat "$_wscontrol_cache" 2>/dev/null)
+    if [ ! -f "$WSCONTROL_HOME/wscontrol.py" ]; then
+        ###
+        # Look for the program itself, not for a directory named
+        # wscontrol; ~/.cache/wscontrol is one of those, too.
+        ###
+        local found=$(find "$HOME" -name wscontrol.py -type f -print -quit 2>/dev/null)
+        if [ -z "$found" ]; then
+            echo "wscontrol.py is nowhere under $HOME." >&2
+            return 1
+        fi
+        WSCONTROL_HOME=$(dirname "$found")
+        mkdir -p "$(dirname "$_wscontrol_cache")"
+        echo "$WSCONTROL_HOME" > "$_wscontrol_cache"
+    fi
+    export WSCONTROL_HOME
+}
+
 function wscontrol
 {
-    export WSCONTROL_HOME=$(find $HOME -name wscontrol -type d 2>/dev/null)
-    command pushd $WSCONTROL_HOME >/dev/null
-    python wscontrol.py $@
+    _wscontrol_home || return
+    command pushd "$WSCONTROL_HOME" >/dev/null
+    python wscontrol.py "$@"
+    local code=$?
     command popd >/dev/null
+    return $code
 }
 
 function parsertests
 {
-    export WSCONTROL_HOME=$(find $HOME -name wscontrol -type d 2>/dev/null)
-    command pushd $WSCONTROL_HOME >/dev/null
-    python wscontrolparser.py $@
+    _wscontrol_home || return
+    command pushd "$WSCONTROL_HOME" >/dev/null
+    python wscontrolparser.py "$@"
     command popd >/dev/null
 }
 
-wscontrol $@
+wscontrol "$@"
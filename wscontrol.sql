@@ -3,8 +3,45 @@ CREATE TABLE master (
     who varchar(20),
     host varchar(20),
     command varchar(2000),
-    result integer
+    result integer,
+    invocation integer
     );
+CREATE TABLE invocation (
+    id integer primary key,
+    t datetime default current_timestamp,
+    who varchar(20),
+    statement varchar(2000)
+    );
+CREATE TABLE host_health (
+    host varchar(20) primary key,
+    address varchar(100),
+    port integer,
+    failures integer,
+    opened real,
+    until real
+    );
+CREATE TABLE latency (
+    t datetime default current_timestamp,
+    host varchar(20),
+    fingerprint varchar(200),
+    seconds real
+    );
+CREATE INDEX master_invocation ON master(invocation, result);
+CREATE INDEX invocation_who ON invocation(who);
+CREATE INDEX master_t ON master(t);
+CREATE INDEX master_host ON master(host);
+CREATE INDEX master_who ON master(who);
+CREATE INDEX master_result ON master(result);
+CREATE VIRTUAL TABLE master_fts USING fts5(
+    command, content='master', content_rowid='rowid', tokenize='trigram'
+    );
+CREATE TRIGGER master_fts_insert AFTER INSERT ON master BEGIN
+    INSERT INTO master_fts(rowid, command) VALUES (new.rowid, new.command);
+    END;
+CREATE TRIGGER master_fts_delete AFTER DELETE ON master BEGIN
+    INSERT INTO master_fts(master_fts, rowid, command) 
+        VALUES ('delete', old.rowid, old.command);
+    END;
 CREATE TABLE cpu_mem (
         t datetime default current_timestamp,
         host varchar(20),
@@ -39,6 +39,7 @@ from   urdecorators import trap
 ###
 # imports and objects that are a part of this project
 ###
+import ir
 from   parsertests import parsertests
 from   opcodes import OpCode
 import resolver
@@ -86,10 +87,12 @@ action = ( lexeme(string('ignore')).result(OpCode.IGNORE) |
             lexeme(string('retry')).result(OpCode.RETRY) )
 
 ###
-# Host names are alpha+underscore
+# Host names are alphanumeric+underscore+dot, with ranges like [001-512]
+# in them, and dashes, as long as something comes after the dash:
+# ws.all-(adam) is the difference of two groups.
 # Filenames also allows dashes, and bash symbols.
 ###
-hostname = lexeme(regex('[A-Za-z_.]+'))
+hostname = lexeme(regex(r'(?:[A-Za-z0-9_.]|\[\d+-\d+\]|-(?=[A-Za-z0-9_.\[]))+'))
 filename = lexeme(regex('[-A-Za-z/.*_$~]+'))
 
 #@lexeme
@@ -129,7 +132,27 @@ def hostnames():
     yield rparen
     raise EndOfGenerator(tuple(elements))
 
-context = hostnames ^ hostname
+###
+# Groups may be put together, from left to right:
+#
+#   ws.all - ws.nas
+#   (adam, anna) + ws.provost & ws.ssd
+#
+# A set operator with nothing after it that parses is left unread.
+###
+set_operator = ( lexeme(string('+')).result(OpCode.UNION) |
+            lexeme(string('-')).result(OpCode.DIFFERENCE) |
+            lexeme(string('&')).result(OpCode.INTERSECTION) )
+
+group = hostnames ^ hostname
+
+@generate
+def context():
+    target = yield group
+    operations = yield many(set_operator + group)
+    for operator, operand in operations:
+        target = (operator, target, operand)
+    raise EndOfGenerator(target)
 
 op = quoted
 capture = lexeme(string('capture'))
@@ -305,43 +328,17 @@ def wsscript():
 
 
 @trap
-def make_tree(opcodes:tuple) -> SloppyTree:
+def retarget(opcodes:tuple, hosts:tuple) -> tuple:
     """
-    Run down the opcodes, and build a tree so that we can use the 
-    usual tree functions to find things. The general format of a
-    successfully parsed input is 
-        - an opcode 
-        - optionally followed by tuples
-        - each interior tuple is an opcode and an operand
-        - the operand may be a single or an iterable.
+    Return the parsed statement with its context (the ON of an EXEC,
+    or the TO of a SEND or the ON of a SNAPSHOT) replaced by the
+    given hosts. This is how a statement is redone on only some of
+    the hosts it first named.
     """
-    
-    ###
-    # Make sure the argument is a tuple, even if it is a one-tuple.
-    ###
-    if not isinstance(opcodes, tuple):
-        opcodes = (opcodes,)
-
-    t = SloppyTree()
-
-    ###
-    # If we get an atomic opcode, create a tree that only has a root,
-    # and we are done.
-    ###
-    command = opcodes[0]
-    if not isinstance(command, Hashable): command=tuple(command)
-    t[command]
-    instructions = opcodes[1:]
-    if not len(instructions): return t
-
-    for action in instructions:
-        opcode = action[0]
-        if not isinstance(opcode, OpCode):
-            raise Exception(f"Found {action}. Excepted a tuple or an OpCode")
-        operands = action[1:]
-        t[command][opcode] = operands
-
-    return t
+    if not isinstance(opcodes, tuple): return opcodes
+    return tuple( (_[0], tuple(hosts)) if 
+        isinstance(_, tuple) and _ and _[0] in (OpCode.ON, OpCode.TO) else _ 
+        for _ in opcodes )
 
 
 @trap
@@ -366,15 +363,14 @@ def wscontrolparser_main(myargs:argparse.Namespace) -> int:
     For testing. Pick a parser and a string and print the result or
     the error.
     """
-    global parsertests
     print(f"Running {len(parsertests)} tests.")
     for k, v in parsertests:
         this_parser = globals()[k]
         print(f"\nParsing >>{v}<< with {k}\n")
         if use_resolver:
-            pprint(resolver.resolver(make_tree(this_parser.parse(v))))
+            pprint(resolver.resolver(ir.build(this_parser.parse(v))))
         else:
-            pprint(make_tree(this_parser.parse(v)))
+            pprint(ir.build(this_parser.parse(v)))
 
     return os.EX_OK
 
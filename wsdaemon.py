@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+wscontrol, started once and left running. Everything that makes a
+cold start slow -- the config, the ssh config index, the resolver's
+memory of groups, the master ssh connections, the database and its
+writer -- is kept warm, and statements arrive from wsclient over a
+Unix socket, so that a cron job or a shell loop pays milliseconds for
+each one rather than a whole start.
+
+Who is on the other end of the socket is asked of the kernel
+(SO_PEERCRED), not of the client. The user the daemon runs as may
+always use it, and so may the users in daemon.users; the statements
+are recorded as theirs, not the daemon's. Only the owner may have it
+read files on this computer, with send or "from local", because it
+reads them as the owner. One request is run at a time, and its
+output is sent back as it is printed.
+
+The conversation is one JSON object per line. The client sends
+
+    {"command": "on ws.parish do \"uptime\"", "cwd": "/home/me"}
+
+and gets back any number of {"out": "..."}, and then {"exit": 0}.
+
+    python wsdaemon.py --transport simulated &
+    python wsclient.py -c 'on ws.parish do "uptime"'
+"""
+import typing
+from   typing import *
+
+min_py = (3, 11)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import contextlib
+import io
+import json
+import logging
+import pwd
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import types
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   urdecorators import trap
+from   urlogger import URLogger
+
+###
+# imports and objects that are a part of this project
+###
+import ir
+import scriptcache
+import transport
+import wscontrol
+from   wsconfig import WSConfig
+import wsfastparser
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# Only one request runs at a time: stdout is redirected to the
+# client for the whole of it, and the console is not made to be
+# used by two people at once.
+###
+serving = threading.Lock()
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+def default_socket() -> str:
+    return os.path.join(scriptcache.cache_dir(), 'daemon.sock')
+
+
+def peer_of(connection:socket.socket) -> tuple:
+    """
+    The uid and the name of the user on the other end, from the kernel.
+    """
+    creds = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+        struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    try:
+        return uid, pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return uid, f"uid {uid}"
+
+
+def reads_here(node:ir.Node) -> bool:
+    """
+    Does the statement read files on this computer?
+    """
+    if isinstance(node, ir.Send): return True
+    if isinstance(node, ir.Exec): return any(isinstance(_, ir.FromFile) for _ in node.actions)
+    return False
+
+
+def owner_only(text:str) -> list:
+    """
+    The (line number, statement) of each statement in the text that
+    only the owner may send. This is decided on the statements as they
+    were written, before the resolver reads a "from local" file, and
+    whether or not the script has been compiled before for the owner.
+    """
+    refused = []
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        found, _ = wsfastparser.statements(line)
+        refused.extend((lineno, line[start:end].strip())
+            for _, start, end, tokens in found if reads_here(ir.build(tokens)))
+    return refused
+
+
+class ToClient:
+    """
+    A file for stdout that sends whatever is written to it to the
+    client, a line at a time.
+    """
+    __slots__ = {
+        'out': 'the socket, as a binary file',
+        'pending': 'what has been written since the last newline'
+        }
+
+    def __init__(self, out:BinaryIO) -> None:
+        self.out = out
+        self.pending = ""
+
+
+    def write(self, text:str) -> int:
+        self.pending += text
+        if '\n' in self.pending:
+            lines, _, self.pending = self.pending.rpartition('\n')
+            self.send(out=lines + '\n')
+        return len(text)
+
+
+    def flush(self) -> None:
+        if self.pending:
+            self.send(out=self.pending)
+            self.pending = ""
+
+
+    def send(self, **message) -> None:
+        try:
+            self.out.write(json.dumps(message).encode() + b'\n')
+            self.out.flush()
+        except OSError:
+            ###
+            # The client has gone. What is running carries on, and
+            # is recorded, but nobody is watching.
+            ###
+            pass
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    One client: check who it is, run what it sent, and say how it went.
+    """
+
+    def handle(self) -> None:
+        uid, who = peer_of(self.connection)
+        reply = ToClient(self.wfile)
+        if not self.server.allowed(uid, who):
+            logger.warning(f"{who} may not use this daemon.")
+            reply.send(out=f"{who} is not allowed to use this daemon.\n")
+            reply.send(exit=os.EX_NOPERM)
+            return
+
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request['command']
+        except (ValueError, KeyError, TypeError) as e:
+            reply.send(out=f"Not a request: {e}\n")
+            reply.send(exit=os.EX_PROTOCOL)
+            return
+
+        logger.info(f"{who}: {command}")
+        try:
+            code = self.server.run(command, uid, who, request.get('cwd'), reply)
+        except Exception as e:
+            logger.error(f"{who}: {command} raised {e}")
+            reply.send(out=f"{e}\n")
+            code = os.EX_SOFTWARE
+        reply.send(exit=code)
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The socket, and the console that the statements are run by.
+    """
+    daemon_threads = True
+
+    def __init__(self, path:str, console:object) -> None:
+        self.console = console
+        self.owner = os.getuid()
+        super().__init__(path, Handler)
+
+
+    def allowed(self, uid:int, who:str) -> bool:
+        return uid == self.owner or who in WSConfig().lookup('daemon.users', ())
+
+
+    def run(self, command:str, uid:int, who:str, cwd:str, reply:ToClient) -> int:
+        """
+        Run the statements as if who had typed them at the console,
+        from their directory if we can get to it. Only statements:
+        the console's own commands and its shell escapes would be run
+        as the daemon's owner, and so they are refused, from everyone.
+        So, from everyone but the owner, are the statements that
+        would read the owner's files.
+        """
+        with serving:
+            here = os.getcwd()
+            with contextlib.suppress(OSError, TypeError): os.chdir(cwd)
+            self.console.who = who
+            try:
+                with contextlib.redirect_stdout(reply):
+                    if uid != self.owner and (refused := owner_only(command)):
+                        for lineno, source in refused:
+                            print(f"{lineno}: {source}\n    reads files here, which only "
+                                "the daemon's owner may do.")
+                        return os.EX_NOPERM
+                    return self.console.run_script(command, True) or os.EX_OK
+            except SystemExit as e:
+                ###
+                # stop, quit, and exit end the request, not the daemon.
+                ###
+                return e.code if isinstance(e.code, int) else os.EX_OK
+            finally:
+                reply.flush()
+                self.console.who = wscontrol.mynetid
+                os.chdir(here)
+
+
+def claim(path:str) -> bool:
+    """
+    Remove a socket that was left behind, but not one that another
+    daemon is answering on.
+    """
+    if not os.path.exists(path): return True
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+            return False
+        except OSError:
+            os.unlink(path)
+            return True
+
+
+@trap
+def refusal_test() -> int:
+    """
+    Send each statement to a Daemon's run() as someone other than
+    its owner, and then as its owner, with a console that runs
+    nothing. Returns the number of mistakes.
+    """
+    class Console:
+        who = wscontrol.mynetid
+        def run_script(self, text:str, statements_only:bool) -> int:
+            return os.EX_OK
+
+    cases = {
+        'send /etc/shadow to adam': os.EX_NOPERM,
+        'on adam do from local /etc/shadow': os.EX_NOPERM,
+        'on adam do "uptime"; send /etc/hostname to anna': os.EX_NOPERM,
+        'log starting\non ws.parish do from local ~/.ssh/id_rsa': os.EX_NOPERM,
+        'on adam do "uptime"': os.EX_OK,
+        'on adam do from x.sh': os.EX_OK
+        }
+
+    server = types.SimpleNamespace(owner=os.getuid(), console=Console())
+    failures = 0
+    for command, expected in cases.items():
+        for uid, wanted in ((server.owner + 1, expected), (server.owner, os.EX_OK)):
+            code = Daemon.run(server, command, uid, 'someone', None, ToClient(io.BytesIO()))
+            print(f"{'other' if uid != server.owner else 'owner':>6}: {code:>2} "
+                f"{'ok' if code == wanted else 'WRONG'}  {command!r}")
+            failures += code != wanted
+
+    return failures
+
+
+@trap
+def wsdaemon_main(myargs:argparse.Namespace) -> int:
+    if myargs.test:
+        return os.EX_OK if not refusal_test() else os.EX_SOFTWARE
+
+    console = wscontrol.start(myargs)
+    path = myargs.socket or os.path.expanduser(
+        WSConfig().lookup('daemon.socket', default_socket()))
+
+    if not claim(path):
+        print(f"Another daemon is already listening on {path}.")
+        return os.EX_UNAVAILABLE
+
+    ###
+    # Who may connect is decided by allowed(), so the socket itself
+    # may be opened by anyone who can reach it.
+    ###
+    server = Daemon(path, console)
+    os.chmod(path, 0o666 if WSConfig().lookup('daemon.users', ()) else 0o600)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(os.EX_OK))
+    logger.info(f"listening on {path}")
+    print(f"Listening on {path}.")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(OSError): os.unlink(path)
+        console.postloop()
+        logger.info("daemon stopped")
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    here = os.getcwd()
+    logfile = f"{here}/wsdaemon.log"
+
+    parser = argparse.ArgumentParser(prog="wsdaemon",
+        description="What wsdaemon does, wsdaemon does best.")
+
+    parser.add_argument('--config', type=str, default=f"{here}/wscontrol.toml",
+        help=f"Input config file name, defaults to {here}/wscontrol.toml")
+    parser.add_argument('--db', type=str, default=f"{here}/wscontrol.db",
+        help=f"Name of the wscontrol database, defaults to {here}/wscontrol.db")
+    parser.add_argument('--loglevel', type=int,
+        choices=range(logging.FATAL, logging.NOTSET, -10),
+        default=logging.INFO,
+        help=f"Logging level, defaults to {logging.INFO}")
+    parser.add_argument('--no-cache', action='store_true',
+        help="Compile every request, even one that has been compiled before.")
+    parser.add_argument('--no-exec', action='store_true',
+        help="For testing; this generates all the opcodes, but does not execute the command.")
+    parser.add_argument('--parser', type=str, default="fast", choices=("fast", "parsec"),
+        help="fast (the default), or parsec, the reference grammar in wscontrolparser.py.")
+    parser.add_argument('--test', action='store_true',
+        help="Check that statements reading local files are refused to other users, and exit.")
+    parser.add_argument('--socket', type=str, default="",
+        help="Where to listen. Defaults to daemon.socket in the config file, or ~/.cache/wscontrol/daemon.sock")
+    parser.add_argument('--transport', type=str, default="",
+        choices=("", *transport.transports),
+        help="How to reach the workstations: ssh, local, or simulated. Defaults to transport.kind in the config file.")
+
+    myargs = parser.parse_args()
+    logger = URLogger(logfile=logfile, level=myargs.loglevel)
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
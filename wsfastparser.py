@@ -0,0 +1,630 @@
+# -*- coding: utf-8 -*-
+"""
+A hand-written parser for the wscontrol language. The parsec grammar
+in wscontrolparser.py is the definition of the language, and it is
+kept as the reference; this parser gives exactly the same opcode
+tuples for every statement, and it is a good deal faster, because it
+does not build and unwind a tower of combinators for each character.
+
+The lexing is done on demand from a table of patterns, because which
+token comes next depends on where we are: "adam" is a hostname after
+"on" but a filename after "send". Keywords are matched the way
+parsec's string() matches them, as prefixes, and every alternative
+backtracks the way parsec's ^ does, so that even the odd corners of
+the reference grammar come out the same.
+
+    python wsfastparser.py --compare
+    python wsfastparser.py --bench
+"""
+import typing
+from   typing import *
+
+min_py = (3, 9)
+
+###
+# Standard imports, starting with os and sys
+###
+import os
+import sys
+if sys.version_info < min_py:
+    print(f"This program requires Python {min_py[0]}.{min_py[1]}, or higher.")
+    sys.exit(os.EX_SOFTWARE)
+
+###
+# Other standard distro imports
+###
+import argparse
+import contextlib
+import logging
+import re
+import time
+
+###
+# Installed libraries.
+###
+
+
+###
+# From hpclib
+###
+from   parsec4 import ParseError
+from   urdecorators import trap
+
+###
+# imports and objects that are a part of this project
+###
+from   opcodes import OpCode
+
+###
+# Global objects and initializations
+###
+logger = logging.getLogger('URLogger')
+verbose = False
+
+###
+# The tokens, as the reference grammar defines them. Every token but
+# 'everything' is a lexeme, and swallows the whitespace after it.
+###
+TOKENS = {
+    'whitespace': re.compile(r'\s*', re.MULTILINE),
+    'hostname':   re.compile(r'(?:[A-Za-z0-9_.]|\[\d+-\d+\]|-(?=[A-Za-z0-9_.\[]))+'),
+    'filename':   re.compile(r'[-A-Za-z/.*_$~]+'),
+    'quoted':     re.compile(r'"[^"]*"|\'[^\']*\''),
+    'everything': re.compile(r'.*')
+    }
+
+WHITESPACE = TOKENS['whitespace'].match
+
+ERROR_ACTIONS = (
+    ('ignore', OpCode.IGNORE),
+    ('fail', OpCode.FAIL),
+    ('next', OpCode.NEXT),
+    ('retry', OpCode.RETRY)
+    )
+
+SET_OPERATORS = (
+    ('+', OpCode.UNION),
+    ('-', OpCode.DIFFERENCE),
+    ('&', OpCode.INTERSECTION)
+    )
+
+###
+# Credits
+###
+__author__ = 'George Flanagin'
+__copyright__ = 'Copyright 2023'
+__credits__ = None
+__version__ = 0.1
+__maintainer__ = 'George Flanagin'
+__email__ = ['gflanagin@richmond.edu']
+__status__ = 'in progress'
+__license__ = 'MIT'
+
+
+class Failure(Exception):
+    """
+    Raised inside the parser to back up to the last alternative; it
+    never gets out. ParseError is what the caller sees.
+    """
+    __slots__ = ('index', 'expected')
+
+    def __init__(self, index:int, expected:str) -> None:
+        self.index = index
+        self.expected = expected
+
+
+class Scanner:
+    """
+    The text being parsed, and the furthest point at which anything
+    failed to parse, which is the best guess at where the mistake is.
+    """
+    __slots__ = {
+        'text': 'the statement(s)',
+        'furthest': 'index of the furthest failure',
+        'expected': 'what we wanted to find there'
+        }
+
+    def __init__(self, text:str) -> None:
+        self.text = text
+        self.furthest = -1
+        self.expected = ""
+
+
+    def fail(self, i:int, expected:str) -> NoReturn:
+        if i >= self.furthest:
+            self.furthest, self.expected = i, expected
+        raise Failure(i, expected)
+
+
+    def error(self) -> ParseError:
+        return ParseError(self.expected, self.text, max(0, self.furthest))
+
+
+    ###
+    # Tokens.
+    ###
+    def keyword(self, i:int, word:str) -> int:
+        if not self.text.startswith(word, i): self.fail(i, word)
+        return WHITESPACE(self.text, i + len(word)).end()
+
+
+    def token(self, i:int, kind:str) -> tuple:
+        m = TOKENS[kind].match(self.text, i)
+        if m is None: self.fail(i, kind)
+        return m.group(), WHITESPACE(self.text, m.end()).end()
+
+
+    def quoted(self, i:int) -> tuple:
+        s, i = self.token(i, 'quoted')
+        return s[1:-1], i
+
+
+    def separated(self, i:int, element:Callable, separator:str) -> tuple:
+        """
+        parsec's sepBy: zero or more elements with separators between
+        them. A separator with no element after it is left unread.
+        """
+        values = []
+        try:
+            v, i = element(i)
+        except Failure:
+            return values, i
+        values.append(v)
+
+        while True:
+            try:
+                j = self.keyword(i, separator)
+                v, j = element(j)
+            except Failure:
+                return values, i
+            values.append(v)
+            i = j
+
+
+    def parenthesized(self, i:int, element:Callable) -> tuple:
+        i = self.keyword(i, '(')
+        values, i = self.separated(i, element, ',')
+        return tuple(values), self.keyword(i, ')')
+
+
+    def first_of(self, i:int, *alternatives:Callable) -> tuple:
+        """
+        parsec's ^: try each in turn, from the same place. If none
+        of them work, the last one's failure is ours.
+        """
+        for alternative in alternatives[:-1]:
+            try:
+                return alternative(i)
+            except Failure:
+                pass
+        return alternatives[-1](i)
+
+
+    ###
+    # Clauses.
+    ###
+    def hostname(self, i:int) -> tuple:
+        return self.token(i, 'hostname')
+
+
+    def filename(self, i:int) -> tuple:
+        return self.token(i, 'filename')
+
+
+    def group(self, i:int) -> tuple:
+        return self.first_of(i,
+            lambda i: self.parenthesized(i, self.hostname),
+            self.hostname)
+
+
+    def set_operator(self, i:int) -> tuple:
+        for symbol, opcode in SET_OPERATORS:
+            if self.text.startswith(symbol, i):
+                return opcode, self.keyword(i, symbol)
+        self.fail(i, 'one of + - &')
+
+
+    def context(self, i:int) -> tuple:
+        """
+        Groups put together from left to right. As with many() in
+        parsec, an operator with no group after it is left unread.
+        """
+        target, i = self.group(i)
+        while True:
+            try:
+                operator, j = self.set_operator(i)
+                operand, j = self.group(j)
+            except Failure:
+                return target, i
+            target, i = (operator, target, operand), j
+
+
+    def on_error(self, i:int, default:OpCode) -> tuple:
+        """
+        An on_error clause that is not there, or that does not parse,
+        leaves the default in place and nothing read.
+        """
+        try:
+            j = self.keyword(i, 'on_error')
+            for word, opcode in ERROR_ACTIONS:
+                if self.text.startswith(word, j):
+                    return (OpCode.ONERROR, opcode), self.keyword(j, word)
+            self.fail(j, 'ignore, fail, next, or retry')
+        except Failure:
+            return (OpCode.ONERROR, default), i
+
+
+    def capture_op(self, i:int) -> tuple:
+        i = self.keyword(i, 'capture')
+        cmd, i = self.quoted(i)
+        return (OpCode.CAPTURE, cmd), i
+
+
+    def any_op(self, i:int) -> tuple:
+        op, i = self.first_of(i, self.capture_op, self.quoted)
+        return (OpCode.ACTION, op), i
+
+
+    def from_file_clause(self, i:int) -> tuple:
+        i = self.keyword(i, 'from')
+        scope = OpCode.REMOTE
+        if self.text.startswith('local', i):
+            scope, i = OpCode.LOCAL, self.keyword(i, 'local')
+        fname, i = self.filename(i)
+        return (OpCode.FROM, scope, fname), i
+
+
+    def do_clause(self, i:int) -> tuple:
+        i = self.keyword(i, 'do')
+        action, i = self.first_of(i, self.from_file_clause, self.capture_op,
+            lambda i: self.parenthesized(i, self.any_op), self.quoted)
+        if isinstance(action, str): action = (action,)
+        return (OpCode.DO, action), i
+
+
+    ###
+    # Commands.
+    ###
+    def exec_command(self, i:int) -> tuple:
+        i = self.keyword(i, 'on')
+        location, i = self.context(i)
+        action, i = self.do_clause(i)
+        error_action, i = self.on_error(i, OpCode.FAIL)
+        return (OpCode.EXEC, (OpCode.ON, location), action, error_action), i
+
+
+    def send_command(self, i:int) -> tuple:
+        i = self.keyword(i, 'send')
+        fname, i = self.first_of(i,
+            lambda i: self.parenthesized(i, self.filename),
+            self.filename)
+        i = self.keyword(i, 'to')
+        destination, i = self.context(i)
+        error_action, i = self.on_error(i, OpCode.FAIL)
+        return (OpCode.SEND, (OpCode.FILES, fname), (OpCode.TO, destination), error_action), i
+
+
+    def snapshot_command(self, i:int) -> tuple:
+        i = self.keyword(i, 'snapshot')
+        target, i = self.context(i)
+        error_action, i = self.on_error(i, OpCode.RETRY)
+        return (OpCode.SNAPSHOT, (OpCode.ON, target), error_action), i
+
+
+    def log_command(self, i:int) -> tuple:
+        i = self.keyword(i, 'log')
+        try:
+            text, i = self.quoted(i)
+        except Failure:
+            m = TOKENS['everything'].match(self.text, i)
+            text, i = m.group(), WHITESPACE(self.text, m.end()).end()
+        return (OpCode.LOG, (OpCode.LITERAL, text)), i
+
+
+    def stop_command(self, i:int) -> tuple:
+        for word in ('stop', 'quit'):
+            if self.text.startswith(word, i):
+                return OpCode.STOP, self.keyword(i, word)
+        self.fail(i, 'stop')
+
+
+    def nop_command(self, i:int) -> tuple:
+        """
+        nop, and perhaps something after it that is not to be done.
+        """
+        i = self.keyword(i, 'nop')
+        try:
+            command, i = self.first_of(i, self.stop_command, self.log_command,
+                self.send_command, self.exec_command, self.snapshot_command)
+        except Failure:
+            command = None
+        return (OpCode.NOP, command), i
+
+
+    def any_command(self, i:int) -> tuple:
+        """
+        At most one of the commands can begin here, so there is no need
+        to try them all.
+        """
+        for word, command in COMMANDS:
+            if self.text.startswith(word, i):
+                return command(self, i)
+        self.fail(i, 'nop, stop, quit, log, send, on, or snapshot')
+
+
+    ###
+    # What we parse.
+    ###
+    def statement(self, i:int=0) -> tuple:
+        """
+        One statement, with or without a semicolon. Like the parsec
+        parser's parse(), we stop there and do not mind what follows.
+        """
+        command, i = self.any_command(WHITESPACE(self.text, i).end())
+        if self.text.startswith(';', i): i = self.keyword(i, ';')
+        return command, i
+
+
+    def script(self, i:int=0) -> tuple:
+        """
+        Statements separated by semicolons are a group; the groups
+        are separated by anything else (usually newlines.) All the
+        text has to be used.
+        """
+        i = WHITESPACE(self.text, i).end()
+        groups = []
+        while True:
+            group, j = self.separated(i, self.any_command, ';')
+            if not group: break
+            groups.append(group)
+            i = j
+
+        if i < len(self.text): self.fail(i, 'end of input')
+        return groups, i
+
+
+    def statements(self) -> tuple:
+        """
+        The same thing as script(), one statement at a time, carrying
+        on past the ones that do not parse so that every mistake in
+        the file can be reported at once. After a mistake we pick up
+        again at the start of the next line.
+
+        returns -- a list of (group, start, end, command), and a list
+            of (index, expected) for the mistakes.
+        """
+        found = []
+        mistakes = []
+        group = 0
+        semicolon = None
+        i = WHITESPACE(self.text, 0).end()
+        while i < len(self.text):
+            self.furthest = -1
+            try:
+                command, j = self.any_command(i)
+            except Failure:
+                mistakes.append((self.furthest, self.expected))
+                eol = self.text.find('\n', max(i, self.furthest))
+                i = len(self.text) if eol < 0 else WHITESPACE(self.text, eol).end()
+                group += 1
+                semicolon = None
+                continue
+
+            found.append((group, i, j, command))
+            if self.text.startswith(';', j):
+                semicolon, i = j, self.keyword(j, ';')
+            else:
+                semicolon, i = None, j
+                group += 1
+
+        if semicolon is not None: mistakes.append((semicolon, 'a statement after this ;'))
+        return found, mistakes
+
+
+###
+# The words commands begin with, in the order that the reference
+# grammar tries them.
+###
+COMMANDS = (
+    ('nop', Scanner.nop_command),
+    ('stop', Scanner.stop_command),
+    ('quit', Scanner.stop_command),
+    ('log', Scanner.log_command),
+    ('send', Scanner.send_command),
+    ('on', Scanner.exec_command),
+    ('snapshot', Scanner.snapshot_command)
+    )
+
+
+class Grammar:
+    """
+    Something with a parse() method, like a parsec parser, so that
+    this parser can be used wherever wslanguage or wsscript is.
+    """
+    __slots__ = {
+        'rule': 'the Scanner method that parses the whole thing'
+        }
+
+    def __init__(self, rule:Callable) -> None:
+        self.rule = rule
+
+
+    def parse(self, text:str) -> object:
+        s = Scanner(text)
+        try:
+            return self.rule(s)[0]
+        except Failure:
+            raise s.error() from None
+
+
+wslanguage = Grammar(Scanner.statement)
+wsscript = Grammar(Scanner.script)
+
+
+def statements(text:str) -> tuple:
+    """
+    Parse a script, finding all the mistakes rather than the first.
+
+    returns -- a list of (group, start, end, command), and a list of
+        (index, expected) that is empty if the whole script parsed.
+    """
+    return Scanner(text).statements()
+
+
+def grouped(found:list) -> list:
+    """
+    What statements() found, arranged the way wsscript gives it.
+    """
+    groups = {}
+    for group, start, end, command in found:
+        groups.setdefault(group, []).append(command)
+    return list(groups.values())
+
+
+def uncomment(text:str) -> str:
+    """
+    Blank out the lines of a script file that are comments. The
+    language has no comments, but the files that hold it do. The
+    blanks keep everything else where it was, so that the line and
+    column of a mistake are still right.
+    """
+    return re.sub(r'(?m)^[ \t]*#.*$', lambda m: ' ' * len(m.group()), text)
+
+
+def where(text:str, index:int) -> tuple:
+    """
+    Line and column, counted from 1, of an index into text.
+    """
+    line = text.count('\n', 0, index) + 1
+    return line, index - (text.rfind('\n', 0, index) + 1) + 1
+
+
+def outcome(grammar:object, text:str) -> tuple:
+    """
+    What a parser makes of text, or the fact that it could not.
+    """
+    try:
+        return True, grammar.parse(text)
+    except ParseError:
+        return False, None
+
+
+@trap
+def compare(statements:Iterable) -> int:
+    """
+    Parse each statement with both parsers, as a statement and as a
+    script, and report any difference.
+
+    returns -- the number of differences.
+    """
+    import wscontrolparser
+
+    differences = 0
+    for text in statements:
+        for name, fast, reference in (
+            ('wslanguage', wslanguage, wscontrolparser.wslanguage),
+            ('wsscript', wsscript, wscontrolparser.wsscript)):
+            mine, theirs = outcome(fast, text), outcome(reference, text)
+            if mine != theirs:
+                differences += 1
+                print(f"{name} >>{text}<<\n   fast: {mine}\n   parsec: {theirs}")
+
+        ###
+        # Parsing a script one statement at a time has to come out
+        # the same as parsing it all at once.
+        ###
+        found, mistakes = Scanner(text).statements()
+        whole = outcome(wsscript, text)
+        if (not mistakes, grouped(found) if not mistakes else None) != whole:
+            differences += 1
+            print(f"statements >>{text}<<\n   one at a time: {grouped(found)} {mistakes}"
+                f"\n   all at once: {whole}")
+
+    return differences
+
+
+def variants(text:str) -> list:
+    """
+    Some statements that are close to text: with more and less space,
+    with a semicolon, and cut short.
+    """
+    squeezed = re.sub(r'\s+', ' ', text).strip()
+    return [ text, squeezed, f"  {squeezed}  ", f"{squeezed};",
+        f"{squeezed}; {squeezed}", f"{squeezed}\n{squeezed}", f"nop {squeezed}",
+        *(squeezed[:n] for n in range(0, len(squeezed), 3)) ]
+
+
+def corpus(filename:str=None) -> list:
+    """
+    The statements in parsertests, and in filename if there is one,
+    and their variants.
+    """
+    from parsertests import parsertests, languagetests
+    statements = [ v for k, v in parsertests if k in ('wslanguage', 'wsscript') ]
+    statements.extend(languagetests)
+    if filename:
+        with open(filename) as f:
+            statements.extend(_.strip() for _ in f if _.strip())
+    return [ v for s in statements for v in variants(s) ]
+
+
+def bench(statements:list, min_time:float=1.0) -> dict:
+    """
+    Statements per second for each parser.
+    """
+    import wscontrolparser
+
+    rates = {}
+    for name, grammar in (('parsec', wscontrolparser.wslanguage), ('fast', wslanguage)):
+        n, start = 0, time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            for text in statements:
+                outcome(grammar, text)
+            n += len(statements)
+        rates[name] = n / (time.perf_counter() - start)
+        print(f"{name:>8} {rates[name]:>12.0f} statements/s")
+
+    print(f"{'speedup':>8} {rates['fast'] / rates['parsec']:>12.1f}x")
+    return rates
+
+
+@trap
+def wsfastparser_main(myargs:argparse.Namespace) -> int:
+    statements = corpus(myargs.input)
+    if myargs.compare:
+        differences = compare(statements)
+        print(f"{len(statements)} statements, {differences} differences.")
+        if differences: return os.EX_DATAERR
+
+    if myargs.bench:
+        bench(statements, myargs.min_time)
+
+    for text in myargs.statement:
+        print(wslanguage.parse(text))
+
+    return os.EX_OK
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="wsfastparser",
+        description="What wsfastparser does, wsfastparser does best.")
+
+    parser.add_argument('--bench', action='store_true',
+        help="Time both parsers on the test statements.")
+    parser.add_argument('--compare', action='store_true',
+        help="Check that both parsers agree on the test statements.")
+    parser.add_argument('-i', '--input', type=str, default="",
+        help="A file of more statements to test, one per line (try testcommands.txt).")
+    parser.add_argument('--min-time', type=float, default=1.0,
+        help="Seconds to spend timing each parser.")
+    parser.add_argument('statement', nargs='*',
+        help="Statements to parse and print.")
+
+    myargs = parser.parse_args()
+
+    try:
+        sys.exit(globals()[f"{os.path.basename(__file__)[:-3]}_main"](myargs))
+
+    except Exception as e:
+        print(f"Escaped or re-raised exception: {e}")
@@ -37,7 +37,12 @@ mynetid = getpass.getuser()
 # imports and objects that are a part of this project
 ###
 from   wrapper import trap
+import hosthealth
+import hostranges
 from dorunrun import dorunrun
+from sloppytree import SloppyTree
+import transport
+from wsconfig import WSConfig
 import sqlitedb
 from sqlitedb import SQLiteDB
 import wsview_utils
@@ -59,63 +64,64 @@ __license__ = 'MIT'
 DAT_FILE=os.path.join(os.getcwd(), 'info.dat')
 padding = lambda x: " "*x
 
-@trap
-def get_memory(ws:str) -> dict:
+def memory_from(free:str) -> dict:
     """
-    Collects and returns used and total memory for the workstation
+    Used and total memory, from what free printed.
     """
-    d = {}
-
+    d = {"used":"n/a", "total":"n/a", "how_busy":0}
     try:
-        cmd = f"ssh -o ConnectTimeout=1 {ws} free"
-        result = dorunrun(cmd, return_datatype = str)
-        used = float(result.split()[8])
-        total = float(result.split()[7])
-
+        used = float(free.split()[8])
+        total = float(free.split()[7])
         d["used"] = used
         d["total"] = total
         d["how_busy"] = used / total #this is to determine ws's load
-
-    except Exception as e:
-        d["used"] = "n/a"
-        d["total"] = "n/a"
-        d["how_busy"] = 0
+    except (IndexError, ValueError, ZeroDivisionError):
+        pass
     return d
 
-@trap
-def get_cpu(ws:str) -> dict:
+def cpu_from(nproc:str, w:str) -> dict:
     """
-    Collects and returns used and total CPUs from the worsktation.
+    Used and total CPUs, from what nproc and w printed.
     """
-    d = {}
-
+    d = {"used":"n/a", "total":"n/a", "how_busy":0}
     try:
-        cmd_total = f"ssh -o ConnectTimeout=1 {ws} nproc"
-        cmd_used = f"ssh -o ConnectTimeout=1 {ws} w"
-        total = float(dorunrun(cmd_total, return_datatype = str))
-        used = dorunrun(cmd_used, return_datatype=str).split()[9]
-        used = float(used.split(",")[0])
+        total = float(nproc)
+        used = float(w.split()[9].split(",")[0])
         d["used"] = used
         d["total"] = total
         d["how_busy"] = used / total
-    except:
-        d["used"] = "n/a"
-        d["total"] = "n/a"
-        d["how_busy"] = 0
+    except (IndexError, ValueError, ZeroDivisionError):
+        pass
     return d
 
+@trap
+def get_memory(ws:str) -> dict:
+    """
+    Collects and returns used and total memory for the workstation
+    """
+    if hosthealth.is_down(ws): return memory_from("")
+
+    host = SloppyTree({'host':ws, 'hostname':ws})
+    return memory_from(transport.current().run(host, "free", 10, wait=1).stdout)
+
+@trap
+def get_cpu(ws:str) -> dict:
+    """
+    Collects and returns used and total CPUs from the worsktation.
+    """
+    if hosthealth.is_down(ws): return cpu_from("", "")
+
+    host = SloppyTree({'host':ws, 'hostname':ws})
+    return cpu_from(transport.current().run(host, "nproc", 10, wait=1).stdout,
+        transport.current().run(host, "w", 10, wait=1).stdout)
+
 @trap
 def get_list_of_ws(lst:str):
     """
     Return list of workstations based on who they belong to.
     """
-    with open(myargs.input, "rb") as f:
-        contents = tomllib.load(f)
-    try:
-        result = contents["ws"][lst]
-    except:
-        result = None
-    return result
+    names = WSConfig().lookup(f"ws.{lst}", None)
+    return None if names is None else list(hostranges.expand_all(names))
 
 @trap
 def record_info(ws:str, cpu:dict, mem:dict):
@@ -137,7 +143,13 @@ def prepare_data(ws:str):
     
     #insert numerical entries into the database
     record_info(ws, cpu, mem)
-    
+    return graphs(cpu, mem)
+
+def graphs(cpu:dict, mem:dict) -> str:
+    """
+    The graphs for one workstation, from what cpu_from() and
+    memory_from() made of it.
+    """
     r_c = ""
     r_m = ""
     warning = ""
@@ -378,14 +390,10 @@ if __name__ == '__main__':
     logger = wsview_utils.URLogger(level=myargs.verbose)
    
     # add a check for --ws argument validity and suggest valid entry
+    WSConfig(myargs.input)
     if get_list_of_ws(myargs.ws) is None:
-        with open(myargs.input, "rb") as f:
-            contents = tomllib.load(f)
-            for k, v in contents.items():
-                if k == "ws":
-                    suggested_lst = v.keys()
-                    print("Error in the provided --ws argument")
-                    print(f'Try one of the existing lists: {", ".join(list(suggested_lst))}')
+        print("Error in the provided --ws argument")
+        print(f'Try one of the existing lists: {", ".join(WSConfig().lookup("ws", {}).keys())}')
         sys.exit()
 
     try: